@@ -2,6 +2,7 @@ from sanic import Sanic
 from sanic_cors import CORS
 
 from app.misc.log import log
+from app.utils import logger_utils, request_timing
 
 
 def register_extensions(sanic_app: Sanic):
@@ -16,10 +17,30 @@ def register_views(sanic_app: Sanic):
     route(sanic_app)
 
 
+def register_listeners(sanic_app: Sanic):
+    from app.databases.connections import close_connections, log_startup, open_connections
+
+    # Registered before the blueprints, so their before_server_start listeners find the clients
+    # open, and (stop listeners running last registered first) close them after theirs have run.
+    sanic_app.register_listener(open_connections, 'before_server_start')
+    sanic_app.register_listener(log_startup, 'after_server_start')
+    sanic_app.register_listener(close_connections, 'after_server_stop')
+
+
 def register_hooks(sanic_app: Sanic):
+    from app.hooks.compression import compress_response
+    from app.hooks.metrics import record_response, start_timer
+    from app.hooks.profiling import finish_profiling, start_profiling
     from app.hooks.request_context import after_request
 
+    sanic_app.register_middleware(start_timer, 'request')
+    sanic_app.register_middleware(start_profiling, 'request')
+    # Response middleware runs last registered first, and stops at the first one returning the
+    # response (after_request does): compression, then metrics, then profiling, then after_request.
     sanic_app.register_middleware(after_request, 'response')
+    sanic_app.register_middleware(finish_profiling, 'response')
+    sanic_app.register_middleware(record_response, 'response')
+    sanic_app.register_middleware(compress_response, 'response')
     # sanic_app.error_handler.add(SanicException, sanic_app)
     # sanic_app.error_handler.add(Exception, broad_exception_handler)
 
@@ -30,12 +51,13 @@ def create_app(*config_cls) -> Sanic:
         keyword='INFO'
     )
 
-    sanic_app = Sanic(__name__)
+    sanic_app = Sanic(__name__, dumps=request_timing.dumps, log_config=logger_utils.sanic_log_config())
 
     for config in config_cls:
         sanic_app.config.update_config(config)
 
     register_extensions(sanic_app)
+    register_listeners(sanic_app)
     register_views(sanic_app)
     register_hooks(sanic_app)
 
@@ -2,5 +2,7 @@ from sanic import Blueprint
 
 from app.apis.books_blueprint import books_bp
 from app.apis.example_blueprint import example
+from app.apis.metrics_blueprint import metrics_bp
+from app.apis.profiles_blueprint import profiles_bp
 
-api = Blueprint.group(example, books_bp)
+api = Blueprint.group(example, books_bp, metrics_bp, profiles_bp)
@@ -1,43 +1,261 @@
+import asyncio
+import time
 import uuid
+import zlib
+
 from sanic import Blueprint
-from sanic.response import json
+from sanic.response import json, raw
 from sanic_openapi.openapi2 import doc
 
-from app.decorators.auth import protected
-from app.utils import jwt_utils
+from config import Config, MongoDBConfig
+
+from app.decorators.admission import Admission
+from app.decorators.auth import protected, verified_tokens
+from app.utils import json_utils, jwt_utils
+from app.utils.password_utils import is_password_hash, password_hasher
+from app.utils.cursor_utils import decode_cursor, encode_cursor
 from app.constants.cache_constants import CacheConstants
-from app.databases.mongodb import MongoDB
-from app.databases.redis_cached import get_cache, set_cache
-from app.decorators.json_validator import validate_with_jsonschema
-from app.hooks.error import ApiInternalError, ApiNotFound, ApiForbidden, ApiBadRequest
-from app.models.book import create_book_json_schema, Book, PostBook, PostUpdateBook, PostLogin,update_book_json_schema,login_json_schema
+from app.databases import books_cache, books_stats
+from app.databases.book_loader import get_book_loader
+from app.databases.books_search import books_search
+from app.databases.redis_cached import MISSING, cache, get_cached_book, get_cached_books, get_version, invalidate_cache, set_cached_book, set_cached_books
+from app.decorators.json_validator import compile_jsonschema, first_error, validate_with_jsonschema
+from app.hooks.compression import accepted_encodings, cache_compressed
+from app.hooks.etag import conditional, if_match_versions, make_etag, version_etag
+from app.hooks.error import ApiInternalError, ApiNotFound, ApiForbidden, ApiBadRequest, ApiConflict, ApiServiceUnavailable
+from app.models.book import book_fields, create_book_json_schema, Book, PostBook, PostUpdateBook, PostLogin,update_book_json_schema,login_json_schema
+from app.models.book import bulk_delete_books_json_schema, bulk_update_books_json_schema, PostBulkDeleteBooks, PostBulkUpdateBooks
+from app.models.book import batch_books_json_schema, PostBatchBooks
 
 books_bp = Blueprint('books_blueprint', url_prefix='/books')
+admission = Admission(books_bp.name)
+admission.install(books_bp)
+
+@books_bp.listener('before_server_start')
+async def ensure_indexes(app, loop):
+    await app.ctx.db.ensure_indexes()
+    if MongoDBConfig.EXPLAIN_QUERIES:
+        await app.ctx.db.explain_queries()
+
+
+@books_bp.listener('after_server_start')
+async def listen_cache_invalidations(app, loop):
+    app.ctx.cache_listener = loop.create_task(cache.listen(app.ctx.redis))
+
+
+@books_bp.listener('before_server_stop')
+async def stop_cache_invalidations(app, loop):
+    app.ctx.cache_listener.cancel()
+    await asyncio.gather(app.ctx.cache_listener, return_exceptions=True)
+
+
+@books_bp.listener('after_server_start')
+async def listen_token_revocations(app, loop):
+    app.ctx.revocation_listener = loop.create_task(verified_tokens.revoked.listen(app.ctx.redis))
+
+
+@books_bp.listener('before_server_stop')
+async def stop_token_revocations(app, loop):
+    app.ctx.revocation_listener.cancel()
+    await asyncio.gather(app.ctx.revocation_listener, return_exceptions=True)
+
+
+@books_bp.listener('after_server_start')
+async def start_search_index(app, loop):
+    app.ctx.search_tasks = [
+        loop.create_task(books_search.build(app.ctx.db, batch_size=Config.BOOKS_EXPORT_BATCH_SIZE)),
+        loop.create_task(books_search.listen(app.ctx.redis, app.ctx.db, batch_size=Config.BOOKS_EXPORT_BATCH_SIZE))
+    ]
+
+
+@books_bp.listener('before_server_stop')
+async def stop_search_index(app, loop):
+    for task in app.ctx.search_tasks:
+        task.cancel()
+    await asyncio.gather(*app.ctx.search_tasks, return_exceptions=True)
+
+
+@books_bp.listener('after_server_stop')
+async def close_password_hasher(app, loop):
+    password_hasher.close()
+
+
+def _parse_limit(value):
+    if value is None:
+        return Config.BOOKS_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ApiBadRequest('limit must be an integer')
+    if limit < 1:
+        raise ApiBadRequest('limit must be positive')
+    return min(limit, Config.BOOKS_MAX_PAGE_SIZE)
+
+
+def _parse_fields(value):
+    if not value:
+        return None
+    fields = [field for field in value.split(',') if field]
+    unknown = [field for field in fields if field not in book_fields]
+    if unknown:
+        raise ApiBadRequest('unknown fields: {}'.format(', '.join(unknown)))
+    return fields
+
 
-_db = MongoDB()
+async def _load_books_page(request, r, limit, after, fields):
+    try:
+        after_key = decode_cursor(after) if after else None
+    except ValueError:
+        raise ApiBadRequest('invalid after cursor')
+
+    docs = await books_cache.get_books_page(r, limit + 1, after=after_key)
+    if docs is None:
+        request.app.add_task(books_cache.warm_books_cache(
+            request.app.ctx.redis, request.app.ctx.db, batch_size=Config.BOOKS_EXPORT_BATCH_SIZE
+        ))
+        projection = None if fields is None else dict.fromkeys(fields + ['createdAt'], 1)
+        docs = await request.app.ctx.db.get_books_page(limit + 1, after=after_key, projection=projection)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+
+    if fields is None:
+        books = [Book().from_dict(doc).to_dict() for doc in docs]
+    else:
+        books = [{field: doc.get(field) for field in ['_id'] + fields} for doc in docs]
+    next_cursor = encode_cursor(docs[-1]['createdAt'], docs[-1]['_id']) if has_more else None
+    return {
+        'n_books': len(books),
+        'books': books,
+        'next': next_cursor
+    }
+
+
+async def _cached_json_response(request, r, key, load_body, ttl, stale_ttl=0):
+    """Serve an encoded JSON body straight from the cache; compressed copies are cached next to it."""
+    body = await cache.get_or_set(r, key, load_body, ttl=ttl, stale_ttl=stale_ttl)
+    cache_compressed(request, key, ttl, stale_ttl)
+    return raw(body, content_type='application/json')
+
+
+async def _books_etag(request):
+    async with request.app.ctx.redis as r:
+        version = await get_version(r, CacheConstants.books_version)
+    return make_etag('books', version, request.query_string)
 
 
 @books_bp.route('/', methods={"GET"})
-@doc.summary('Get all books')
+@admission.limited
+@doc.summary('Get a page of books, oldest first')
+@doc.consumes(doc.Integer(name='limit', description='page size'), location='query')
+@doc.consumes(doc.String(name='after', description='cursor returned as `next` by the previous page'), location='query')
+@doc.consumes(doc.String(name='fields', description='comma separated fields to return'), location='query')
+@conditional(_books_etag)
 async def get_all_books(request):
-    # TODO: use cache to optimize api
+    limit = _parse_limit(request.args.get('limit'))
+    after = request.args.get('after')
+    fields = _parse_fields(request.args.get('fields'))
+
     async with request.app.ctx.redis as r:
-        books = await get_cache(r, CacheConstants.all_books)
-        if books is None:
-            book_objs = _db.get_books()
-            books = [book.to_dict() for book in book_objs]
-            await set_cache(r, CacheConstants.all_books, books)
-
-    book_objs = _db.get_books()
-    books = [book.to_dict() for book in book_objs]
-    number_of_books = len(books)
+        version = await get_version(r, CacheConstants.books_version)
+        key = CacheConstants.books_page.format(
+            version=version, limit=limit, after=after or '', fields=','.join(fields or [])
+        )
+        async def load_body():
+            return json_utils.dumps(await _load_books_page(request, r, limit, after, fields))
+
+        return await _cached_json_response(
+            request, r, key, load_body, ttl=Config.BOOKS_PAGE_TTL, stale_ttl=Config.BOOKS_PAGE_STALE_TTL
+        )
+
+
+def _parse_offset(value, limit):
+    try:
+        offset = int(value or 0)
+    except ValueError:
+        raise ApiBadRequest('offset must be an integer')
+    if offset < 0 or offset + limit > Config.SEARCH_MAX_RESULTS:
+        raise ApiBadRequest('offset + limit must be between 0 and {}'.format(Config.SEARCH_MAX_RESULTS))
+    return offset
+
+
+@books_bp.route('/search', methods={'GET'})
+@admission.limited
+@doc.summary('Search title, authors and description, best match first')
+@doc.consumes(doc.String(name='q', description='words to search for'), location='query', required=True)
+@doc.consumes(doc.Integer(name='limit', description='page size'), location='query')
+@doc.consumes(doc.Integer(name='offset', description='results to skip'), location='query')
+async def search_books(request):
+    query = request.args.get('q', '').strip()
+    if not query:
+        raise ApiBadRequest('q is required')
+    limit = _parse_limit(request.args.get('limit'))
+    offset = _parse_offset(request.args.get('offset'), limit)
+    if not books_search.ready:
+        # Starts a build if the last one failed; does nothing while one is running.
+        request.app.add_task(books_search.build(request.app.ctx.db, batch_size=Config.BOOKS_EXPORT_BATCH_SIZE))
+        raise ApiServiceUnavailable('search index is being built', retry_after=1)
+
+    n_matches, hits = books_search.search(query, limit, offset)
+    books = await _get_books_by_ids(request, [book_id for book_id, _ in hits])
+    results = [dict(book, score=round(score, 4)) for book, (_, score) in zip(books, hits) if book is not None]
+    has_more = offset + limit < min(n_matches, Config.SEARCH_MAX_RESULTS)
     return json({
-        'n_books': number_of_books,
-
-        'books': books
+        'n_matches': n_matches,
+        'n_books': len(results),
+        'books': results,
+        'next': offset + limit if has_more else None
     })
 
 
+@books_bp.route('/stats', methods={'GET'})
+@doc.summary('Number of books in total and per owner, publisher and author, biggest groups first')
+@doc.consumes(doc.Integer(name='limit', description='groups of each kind'), location='query')
+async def get_books_stats(request):
+    limit = _parse_limit(request.args.get('limit'))
+    async with request.app.ctx.redis as r:
+        return json(await books_stats.get_stats(r, limit))
+
+
+@books_bp.route('/export', methods={'GET'})
+@admission.limited
+@doc.summary('Stream every book as NDJSON, ordered by _id')
+@doc.consumes(doc.String(name='after', description='resume after this _id'), location='query')
+async def export_books(request):
+    use_gzip = 'gzip' in accepted_encodings(request)
+    headers = {'Vary': 'Accept-Encoding', **({'Content-Encoding': 'gzip'} if use_gzip else {})}
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if use_gzip else None
+
+    response = await request.respond(content_type='application/x-ndjson', headers=headers)
+    async for docs in request.app.ctx.db.iter_books(after_id=request.args.get('after'), batch_size=Config.BOOKS_EXPORT_BATCH_SIZE):
+        chunk = b''.join(json_utils.dumps(Book().from_dict(doc).to_dict()) + b'\n' for doc in docs)
+        if compressor:
+            chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        await response.send(chunk)
+    if compressor:
+        await response.send(compressor.flush())
+    await response.eof()
+
+
+async def _record_write(request, old_books=(), new_books=()):
+    """Bring the caches, the search index and the stats in line with a write.
+
+    ``old_books`` are the stored books the write replaced or deleted, ``new_books`` the books
+    it stored; a book only in ``old_books`` was deleted.
+    """
+    new_ids = {book['_id'] for book in new_books}
+    removed_ids = [book['_id'] for book in old_books if book['_id'] not in new_ids]
+    book_keys = dict.fromkeys(CacheConstants.book.format(book_id=book['_id']) for book in [*old_books, *new_books])
+    async with request.app.ctx.redis as r:
+        await invalidate_cache(r, *book_keys)
+        if new_books:
+            await books_cache.put_books(r, new_books)
+            await books_search.add_books(r, new_books)
+        if removed_ids:
+            await books_cache.remove_books(r, removed_ids)
+            await books_search.remove_books(r, removed_ids)
+        await books_stats.record_changes(r, old_books, new_books)
+
+
 @books_bp.route('/', methods={'POST'})
 @protected
 @doc.consumes(PostBook, location='body', required=True)
@@ -50,114 +268,315 @@ async def create_book(request, username=None):
     book.owner = username
 
     # # TODO: Save book to database
-    inserted = _db.add_book(book)
+    inserted = await request.app.ctx.db.add_book(book)
     if not inserted:
         raise ApiInternalError('Fail to create book')
 
-    # TODO: Update cache
-    async with request.app.ctx.redis as r:
-        books = await get_cache(r, CacheConstants.all_books)
-        if books is None:
-            book_objs = _db.get_books()
-            books = [book.to_dict() for book in book_objs]
-            await set_cache(r, CacheConstants.all_books, books)
-        books.append(book.to_dict())
-        await set_cache(r, CacheConstants.all_books, books)
-
+    await _record_write(request, new_books=[book.to_dict()])
     return json({'status': 'success'}, status=201)
 
 
+_create_book_validator = compile_jsonschema(create_book_json_schema)
+
+
+async def _bulk_items(request):
+    """``(item, error)`` for every item of a JSON array or, with an NDJSON content type, every line."""
+    max_size = Config.BOOKS_BULK_MAX_ITEM_SIZE
+    if request.content_type.startswith('application/x-ndjson'):
+        async for item, error in json_utils.iter_ndjson(request.stream, max_item_size=max_size):
+            yield item, error
+    else:
+        async for item in json_utils.iter_json_array(request.stream, max_item_size=max_size):
+            yield item, None
+
+
+async def _create_books_batch(request, batch, username):
+    """Validate and insert one batch of ``(index, item, error)``; return a result per item."""
+    results = []
+    books = []
+    for index, item, error in batch:
+        if error is None:
+            error = first_error(_create_book_validator, item)
+        if error is not None:
+            results.append({'index': index, 'status': 'failed', 'error': error})
+            continue
+        book = Book(str(uuid.uuid4())).from_dict(item)
+        book.owner = username
+        books.append((index, book))
+
+    if books:
+        errors = await request.app.ctx.db.add_books([book for _, book in books])
+        inserted = []
+        for position, (index, book) in enumerate(books):
+            if position in errors:
+                results.append({'index': index, 'status': 'failed', 'error': errors[position]})
+            else:
+                results.append({'index': index, 'status': 'created', '_id': book._id})
+                inserted.append(book.to_dict())
+        if inserted:
+            await _record_write(request, new_books=inserted)
+    return sorted(results, key=lambda result: result['index'])
+
+
+@books_bp.route('/bulk', methods={'POST'}, stream=True)
+@admission.limited
+@protected
+@doc.summary('Create books from a JSON array or an NDJSON body, streaming back a result per book')
+@doc.consumes(doc.List(PostBook), location='body', required=True)
+async def create_books(request, username=None):
+    response = None
+    counts = {'created': 0, 'failed': 0}
+
+    async def send(results, summary=None):
+        nonlocal response
+        if response is None:
+            response = await request.respond(content_type='application/x-ndjson')
+        for result in results:
+            counts[result['status']] += 1
+        lines = results + ([summary] if summary else [])
+        await response.send(b''.join(json_utils.dumps(line) + b'\n' for line in lines))
+
+    batch = []
+    try:
+        async for item, error in _bulk_items(request):
+            batch.append((counts['created'] + counts['failed'] + len(batch), item, error))
+            if len(batch) == Config.BOOKS_BULK_BATCH_SIZE:
+                await send(await _create_books_batch(request, batch, username))
+                batch = []
+    except ValueError as ex:
+        if response is None and not batch:
+            raise ApiBadRequest(str(ex))
+        await send(await _create_books_batch(request, batch, username))
+        await send([], summary={**counts, 'error': str(ex)})
+    else:
+        await send(await _create_books_batch(request, batch, username), summary=counts)
+    await response.eof()
+
+
+def _bulk_filter(body, username):
+    """Mongo filter for the books selected by ``ids`` or ``owner``, always limited to ``username``'s books."""
+    if body.get('owner', username) != username:
+        raise ApiForbidden('you can only change your own books')
+    filter_ = {'owner': username}
+    if 'ids' in body:
+        filter_['_id'] = {'$in': body['ids']}
+    return filter_
+
+
+# What _record_write needs of the books a bulk write replaces, besides their _id.
+_BULK_SELECTION_FIELDS = ['owner', 'publisher', 'authors']
+
+
+async def _iter_bulk_selection(request, filter_):
+    """The books matching ``filter_`` in ``_id`` order, ``BOOKS_BULK_BATCH_SIZE`` at a time."""
+    async for docs in request.app.ctx.db.iter_books(filter_=filter_, projection=_BULK_SELECTION_FIELDS,
+                                                    batch_size=Config.BOOKS_BULK_BATCH_SIZE):
+        yield [Book().from_dict(doc).to_dict() for doc in docs]
+
+
+@books_bp.route('/bulk', methods={'PATCH'})
+@admission.limited
+@protected
+@doc.summary('Update every book of yours matching `ids` or `owner`')
+@doc.consumes(PostBulkUpdateBooks, location='body', required=True)
+@validate_with_jsonschema(bulk_update_books_json_schema)
+async def update_books(request, username=None):
+    body = request.json
+    filter_ = _bulk_filter(body, username)
+    update = dict(body['update'], lastUpdatedAt=int(time.time()))
+    matched = modified = 0
+    async for books in _iter_bulk_selection(request, filter_):
+        book_ids = [book['_id'] for book in books]
+        result = await request.app.ctx.db.update_books({'_id': {'$in': book_ids}, 'owner': username}, update)
+        if result is None:
+            raise ApiInternalError('Fail to update books')
+        matched += result.matched_count
+        modified += result.modified_count
+
+        # Read back: another write may have changed a book since it was selected.
+        updated = await request.app.ctx.db.get_books(filter_={'_id': {'$in': book_ids}})
+        await _record_write(request, books, [book.to_dict() for book in updated])
+    return json({'status': 'success', 'matched': matched, 'modified': modified})
+
+
+@books_bp.route('/bulk', methods={'DELETE'})
+@admission.limited
+@protected
+@doc.summary('Delete every book of yours matching `ids` or `owner`')
+@doc.consumes(PostBulkDeleteBooks, location='body', required=True)
+@validate_with_jsonschema(bulk_delete_books_json_schema)
+async def del_books(request, username=None):
+    filter_ = _bulk_filter(request.json, username)
+    deleted = 0
+    async for books in _iter_bulk_selection(request, filter_):
+        result = await request.app.ctx.db.del_books({'_id': {'$in': [book['_id'] for book in books]}, 'owner': username})
+        if result is None:
+            raise ApiInternalError('Fail to delete books')
+        deleted += result.deleted_count
+        await _record_write(request, old_books=books)
+    return json({'status': 'success', 'deleted': deleted})
+
+
 # TODO: write api get, update, delete book
 
+async def _load_book(request, r, key, book_id):
+    book = await get_book_loader(request, request.app.ctx.db).load(book_id)
+    await set_cached_book(r, key, book, ttl=Config.BOOK_CACHE_TTL, missing_ttl=Config.BOOK_MISSING_CACHE_TTL)
+    return book
+
+
+async def _get_books_by_ids(request, book_ids):
+    """Books in ``book_ids`` order, ``None`` for ids without one: per-book cache first, one ``$in`` for the rest."""
+    unique_ids = list(dict.fromkeys(book_ids))
+    async with request.app.ctx.redis as r:
+        cached = await get_cached_books(r, [CacheConstants.book.format(book_id=book_id) for book_id in unique_ids])
+        books = {book_id: book for book_id, (_, book) in zip(unique_ids, cached)}
+        misses = [book_id for book_id, (hit, _) in zip(unique_ids, cached) if not hit]
+        if misses:
+            loaded = dict(zip(misses, await get_book_loader(request, request.app.ctx.db).load_many(misses)))
+            await set_cached_books(
+                r, {CacheConstants.book.format(book_id=book_id): book for book_id, book in loaded.items()},
+                ttl=Config.BOOK_CACHE_TTL, missing_ttl=Config.BOOK_MISSING_CACHE_TTL
+            )
+            books.update(loaded)
+    return [books[book_id] for book_id in book_ids]
+
+
+async def _batch_response(request, book_ids):
+    books = await _get_books_by_ids(request, book_ids)
+    return json({
+        'n_books': sum(book is not None for book in books),
+        'books': books,
+        'missing': [book_id for book_id, book in zip(book_ids, books) if book is None]
+    })
+
+
+@books_bp.route('/batch', methods={'GET'})
+@admission.limited
+@doc.summary('Get many books by id, in the order asked; null for ids without a book')
+@doc.consumes(doc.String(name='ids', description='comma separated ids'), location='query', required=True)
+async def get_books_batch(request):
+    book_ids = [book_id for value in request.args.getlist('ids', []) for book_id in value.split(',') if book_id]
+    if not book_ids:
+        raise ApiBadRequest('ids is required')
+    if len(book_ids) > Config.BOOKS_BATCH_MAX_IDS:
+        raise ApiBadRequest('at most {} ids'.format(Config.BOOKS_BATCH_MAX_IDS))
+    return await _batch_response(request, book_ids)
+
+
+@books_bp.route('/batch', methods={'POST'})
+@admission.limited
+@doc.summary('Like GET /books/batch, for id lists too long for a URL')
+@doc.consumes(PostBatchBooks, location='body', required=True)
+@validate_with_jsonschema(batch_books_json_schema)
+async def post_books_batch(request):
+    return await _batch_response(request, request.json['ids'])
+
+
+async def _book_etag(request, book_id):
+    async with request.app.ctx.redis as r:
+        book = await cache.get(r, CacheConstants.book.format(book_id=book_id))
+    if book is None or book == MISSING:
+        return None
+    return version_etag(book.get('version', 0))
+
+
 @books_bp.route('<book_id>/', methods={'GET'})
 @doc.consumes(doc.String(name="book_id", description="book_id"), location="path", required=True)
+@conditional(_book_etag)
 async def read_book(request, book_id):
-    book_obj = _db.get_books(filter_={"_id": book_id})
-    if not book_obj:
+    key = CacheConstants.book.format(book_id=book_id)
+    async with request.app.ctx.redis as r:
+        cached, book = await get_cached_book(r, key)
+        if not cached:
+            book = await cache.flight.do(key, lambda: _load_book(request, r, key, book_id))
+
+    if book is None:
         raise ApiNotFound(f'book detail not found with id {book_id}')
-    book = [book.to_dict() for book in book_obj]
+    return json(book)
 
-    return json(book[0])
+
+async def _raise_write_failure(request, book_id, username, versions, action):
+    """Explain why a conditional write of ``book_id`` matched nothing; only runs when it did."""
+    book = await request.app.ctx.db.get_books(filter_={"_id": book_id})
+    if not book:
+        raise ApiNotFound(f'can not find book with id {book_id} to {action}')
+    if book[0].owner != username:
+        raise ApiForbidden('you are not the owner of this book')
+    if versions is not None and book[0].version not in versions:
+        # 409 rather than 412: Sanic 21.9 drops Content-Length from 412 responses and clients hang.
+        raise ApiConflict(f'book {book_id} is at version {book[0].version}')
+    raise ApiInternalError(f'Fail to {action} book')
 
 
 @books_bp.route('<book_id>/', methods={'PUT'})
 @protected
 @doc.consumes(PostUpdateBook, location='body', required=True)
 @doc.consumes(doc.String(name="book_id", description="book_id"), location="path", required=True)
+@doc.consumes(doc.String(name="If-Match", description="ETag of the version being updated"), location="header")
 @validate_with_jsonschema(update_book_json_schema)
 async def update_book(request, book_id, username=None):
     body = request.json
-    book = _db.get_books(filter_={"_id": book_id})
-
-    if not book:
-        raise ApiNotFound(f'can not find book with id {book_id} to update')
-    book_dict = book[0].to_dict()
-    if book_dict['owner'] != username:
-        raise ApiForbidden('you are not the owner of this book')
-
-
-    updated = _db.update_book(book_id=book_id, update=body)
+    body['lastUpdatedAt'] = int(time.time())
+    versions = if_match_versions(request)
 
-    if not updated:
-        raise ApiInternalError('Fail to update book')
+    # One round trip: the write only applies to the owner's book, at the expected version if given.
+    old = await request.app.ctx.db.update_book(book_id=book_id, update=body, owner=username, versions=versions)
+    if old is None:
+        await _raise_write_failure(request, book_id, username, versions, 'update')
+    old = Book().from_dict(old).to_dict()
+    book = {**old, **body, 'version': old['version'] + 1}
 
-    async with request.app.ctx.redis as r:
-        books = await get_cache(r, CacheConstants.all_books)
-        books.remove(book)
-        books.append(updated)
-        await set_cache(r, CacheConstants.all_books, books)
-    return json({'status': 'success'})
+    await _record_write(request, [old], [book])
+    return json({'status': 'success'}, headers={'ETag': version_etag(book['version'])})
 
 
 @books_bp.route('<book_id>/', methods={'Delete'})
 @doc.consumes(doc.String(name="book_id", description="book_id"), location="path", required=True)
+@doc.consumes(doc.String(name="If-Match", description="ETag of the version being deleted"), location="header")
 @protected
 async def del_book(request, book_id, username=None):
-    book = _db.get_books(filter_={"_id": book_id})
-    if not book:
-        raise ApiNotFound(f'can not find book with id {book_id} to delete')
-    book_dict = book[0].to_dict()
-    if book_dict['owner'] != username:
-        raise ApiForbidden('you are not the owner of this book')
-    deleted = _db.del_book(book_id)
-
-    if not deleted:
-        raise ApiInternalError('Fail to delete book')
-    # async with request.app.ctx.redis as r:
-    #     books = await get_cache(r, CacheConstants.all_books)
-    #
-    #     books.remove(deleted)
-    #     await set_cache(r, CacheConstants.all_books, books)
+    versions = if_match_versions(request)
+    book = await request.app.ctx.db.del_book(book_id, owner=username, versions=versions)
+    if book is None:
+        await _raise_write_failure(request, book_id, username, versions, 'delete')
+
+    await _record_write(request, old_books=[book])
     return json({'status': 'success'})
 
 
 @books_bp.route('/register', methods={'POST'})
+@admission.limited
 @doc.consumes(PostLogin, location='body', required=True)
 @validate_with_jsonschema(login_json_schema)
 async def register(request):
     body = request.json
     username = body['username']
     password = body['password']
-    if _db.get_user(filter_={'username': username}):
+    if await request.app.ctx.db.get_user(filter_={'username': username}):
         raise ApiBadRequest("username already existed")
-    else:
-        _db.add_user(body)
-
-        return json({'status': 'successful'})
+    # The check above saves hashing for taken names; the unique index settles concurrent registrations.
+    if await request.app.ctx.db.add_user({'username': username, 'password': await password_hasher.hash(password)}) is None:
+        raise ApiBadRequest("username already existed")
+    return json({'status': 'successful'})
 
 
 @books_bp.route('/login', methods={'POST'})
+@admission.limited
 @doc.consumes(PostLogin, location='body', required=True)
 @validate_with_jsonschema(login_json_schema)
 async def login(request):
     body = request.json
     username = body['username']
     password = body['password']
-    user = _db.get_user(filter_={'username': username})
+    user = await request.app.ctx.db.get_user(filter_={'username': username})
     if not user:
         raise ApiBadRequest("username does not exist")
-    if user[0]["password"] != password :
+    stored = user[0]["password"]
+    if not await password_hasher.verify(password, stored):
         raise ApiBadRequest("password not corrected")
+    if not is_password_hash(stored):
+        await request.app.ctx.db.update_user(username, {'password': await password_hasher.hash(password)})
     _jwt = jwt_utils.generate_jwt(username)
 
     return json({'status': 'successful',
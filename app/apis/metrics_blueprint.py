@@ -0,0 +1,32 @@
+import asyncio
+
+from sanic import Blueprint
+from sanic.response import text
+from sanic_openapi.openapi2 import doc
+
+from app.utils import metrics
+from config import Config
+
+metrics_bp = Blueprint('metrics_blueprint')
+
+
+@metrics_bp.listener('after_server_start')
+async def start_metrics_flush(app, loop):
+    app.ctx.metrics_flush = loop.create_task(
+        metrics.registry.flush_periodically(app.ctx.redis, Config.METRICS_FLUSH_INTERVAL)
+    )
+
+
+@metrics_bp.listener('before_server_stop')
+async def stop_metrics_flush(app, loop):
+    app.ctx.metrics_flush.cancel()
+    await asyncio.gather(app.ctx.metrics_flush, return_exceptions=True)
+    await metrics.registry.flush(app.ctx.redis)
+
+
+@metrics_bp.route('/metrics', methods={'GET'})
+@doc.summary('Metrics of every worker in the Prometheus text format')
+async def get_metrics(request):
+    async with request.app.ctx.redis as r:
+        body = await metrics.registry.render(r)
+    return text(body, content_type='text/plain; version=0.0.4; charset=utf-8')
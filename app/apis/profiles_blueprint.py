@@ -0,0 +1,49 @@
+import io
+import pstats
+
+from sanic import Blueprint
+from sanic.response import file, json, text
+from sanic_openapi.openapi2 import doc
+
+from app.hooks.error import ApiForbidden, ApiNotFound, ApiBadRequest
+from app.hooks.profiling import PROFILE_HEADER, has_profile_token, list_profiles, profile_path
+
+profiles_bp = Blueprint('profiles_blueprint', url_prefix='/profiles')
+
+
+def _check_token(request):
+    if not has_profile_token(request):
+        raise ApiForbidden('send the profiling token in the {} header'.format(PROFILE_HEADER))
+
+
+def _path(name):
+    try:
+        path = profile_path(name)
+    except ValueError as ex:
+        raise ApiBadRequest(str(ex))
+    if not any(profile['name'] == name for profile in list_profiles()):
+        raise ApiNotFound('profile {} does not exist'.format(name))
+    return path
+
+
+@profiles_bp.route('/', methods={'GET'})
+@doc.summary('Stored request profiles, newest first')
+@doc.consumes(doc.String(name=PROFILE_HEADER, description='profiling token'), location='header', required=True)
+async def get_profiles(request):
+    _check_token(request)
+    profiles = list_profiles()
+    return json({'n_profiles': len(profiles), 'profiles': profiles})
+
+
+@profiles_bp.route('/<name>', methods={'GET'})
+@doc.summary('Download a profile for pstats/snakeviz, or ?format=text for its top functions')
+@doc.consumes(doc.String(name=PROFILE_HEADER, description='profiling token'), location='header', required=True)
+@doc.consumes(doc.String(name='format', description='"text" for the 50 functions with the most cumulative time'), location='query')
+async def get_profile(request, name):
+    _check_token(request)
+    path = _path(name)
+    if request.args.get('format') == 'text':
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(50)
+        return text(out.getvalue())
+    return await file(path, mime_type='application/octet-stream', filename=name)
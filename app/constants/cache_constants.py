@@ -1,2 +1,20 @@
 class CacheConstants:
-    all_books = 'all_books'
+    books_version = 'books:version'
+    books_page = 'books:page:{version}:{limit}:{after}:{fields}'
+    books_data = 'books:data'
+    books_index = 'books:index'
+    books_versions = 'books:versions'
+    books_removed = 'books:removed'
+    books_warm = 'books:warm'
+    books_warming = 'books:warming'
+    books_dirty = 'books:dirty'
+    book = 'books:item:{book_id}'
+    invalidation_channel = 'cache:invalidate'
+    lock = 'lock:{key}'
+    search_channel = 'search:updates'
+    stats_total = 'stats:books:total'
+    stats_group = 'stats:books:{group}'
+    metrics = 'metrics'
+    revoked_tokens = 'auth:revoked'
+    revocation_channel = 'auth:revocations'
+    rate_limit = 'ratelimit:{scope}:{client}'
@@ -1,3 +1,17 @@
 class MongoCollections:
     books = 'books'
     users = 'users'
+
+
+class MongoIndexes:
+    """Indexes each collection should have, applied by ``MongoDB.ensure_indexes``; keys as for ``create_index``."""
+    books = [
+        {'name': 'owner_1', 'keys': [('owner', 1)]},
+        # Same order as GET /books pages, so a page is an index range walk instead of a sort.
+        {'name': 'createdAt_1__id_1', 'keys': [('createdAt', 1), ('_id', 1)]},
+        {'name': 'title_authors_description_text',
+         'keys': [('title', 'text'), ('authors', 'text'), ('description', 'text')]},
+    ]
+    users = [
+        {'name': 'username_1', 'keys': [('username', 1)], 'unique': True},
+    ]
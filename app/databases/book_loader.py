@@ -0,0 +1,56 @@
+import asyncio
+
+
+class BookLoader:
+    """Coalesces the book lookups of one request.
+
+    Ids asked for during the same event loop turn are fetched together with a single ``$in``
+    query, and each id is fetched at most once per loader. Create one per request with
+    :func:`get_book_loader`.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._futures = {}
+        self._queue = []
+
+    def load(self, book_id):
+        """Awaitable of the book as a dict, or ``None`` if there is no such book."""
+        future = self._futures.get(book_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[book_id] = loop.create_future()
+            self._queue.append(book_id)
+            if len(self._queue) == 1:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    async def load_many(self, book_ids):
+        return await asyncio.gather(*[self.load(book_id) for book_id in book_ids])
+
+    def clear(self, book_id):
+        """Forget ``book_id`` so the next ``load`` reads it again, e.g. after writing it."""
+        self._futures.pop(book_id, None)
+
+    async def _dispatch(self):
+        book_ids, self._queue = self._queue, []
+        futures = [self._futures.get(book_id) for book_id in book_ids]
+        try:
+            books = await self.db.get_books(filter_={'_id': {'$in': book_ids}})
+        except Exception as ex:
+            for future in futures:
+                if future is not None and not future.done():
+                    future.set_exception(ex)
+            return
+        found = {book._id: book.to_dict() for book in books}
+        for book_id, future in zip(book_ids, futures):
+            if future is not None and not future.done():
+                future.set_result(found.get(book_id))
+
+
+def get_book_loader(request, db):
+    """The :class:`BookLoader` of ``request``, created on first use."""
+    loader = getattr(request.ctx, 'book_loader', None)
+    if loader is None:
+        loader = request.ctx.book_loader = BookLoader(db)
+    return loader
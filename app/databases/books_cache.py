@@ -0,0 +1,168 @@
+"""Incremental cache of the whole books collection.
+
+``books:data`` is a hash of ``_id -> serialized book`` and ``books:index`` a sorted set of
+``_id`` scored by ``createdAt`` (equal scores sort by ``_id``, matching the ``GET /books``
+order), so a write touches one entry instead of rewriting the collection. Every write bumps
+``books:version``. Pages are only served from the cache once ``books:warm`` is set by
+:func:`warm_books_cache`, after a complete pass over the collection.
+
+Writes may reach the cache in another order than MongoDB saw them, so they go through Lua
+scripts: ``books:versions`` keeps the version of each cached book and an older one is not
+written over it, and ``books:removed`` keeps removed ids for a while so a late write does not
+bring the book back.
+"""
+from app.constants.cache_constants import CacheConstants
+from app.databases.redis_cached import bump_version
+from app.models.book import Book
+from app.utils import json_utils
+from app.utils.logger_utils import get_logger
+from config import Config
+
+logger = get_logger('BooksCache')
+
+_KEYS = (CacheConstants.books_data, CacheConstants.books_index, CacheConstants.books_versions, CacheConstants.books_removed)
+
+# KEYS: books:data, books:index, books:versions, books:removed. ARGV: _id, version, createdAt and
+# the serialized book, for each book. Returns how many books were written.
+PUT_BOOKS_SCRIPT = '''
+local written = 0
+for i = 1, #ARGV, 4 do
+    local id = ARGV[i]
+    local version = tonumber(ARGV[i + 1])
+    local cached = redis.call('HGET', KEYS[3], id)
+    if not redis.call('ZSCORE', KEYS[4], id) and (not cached or tonumber(cached) < version) then
+        redis.call('HSET', KEYS[1], id, ARGV[i + 3])
+        redis.call('ZADD', KEYS[2], ARGV[i + 2], id)
+        redis.call('HSET', KEYS[3], id, version)
+        written = written + 1
+    end
+end
+return written
+'''
+
+# KEYS: as above. ARGV: seconds the removals are remembered, then the _ids.
+# The clock is Redis's, so workers on different hosts agree on it.
+REMOVE_BOOKS_SCRIPT = '''
+redis.replicate_commands()
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+for i = 2, #ARGV do
+    redis.call('HDEL', KEYS[1], ARGV[i])
+    redis.call('ZREM', KEYS[2], ARGV[i])
+    redis.call('HDEL', KEYS[3], ARGV[i])
+    redis.call('ZADD', KEYS[4], now, ARGV[i])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', now - tonumber(ARGV[1]))
+return #ARGV - 1
+'''
+
+
+async def _write(r, books):
+    args = []
+    for book in books:
+        args += [book['_id'], book['version'], book['createdAt'], json_utils.dumps(book)]
+    return await r.eval(PUT_BOOKS_SCRIPT, len(_KEYS), *_KEYS, *args)
+
+
+async def _remove(r, book_ids):
+    return await r.eval(REMOVE_BOOKS_SCRIPT, len(_KEYS), *_KEYS, Config.BOOKS_REMOVED_TTL, *book_ids)
+
+
+async def _mark_dirty(r, book_ids):
+    if await r.exists(CacheConstants.books_warming):
+        # A warm-up in flight may overwrite these books with versions it read before the write: it
+        # reads them again once done. Marked before the write so the re-read cannot miss it.
+        await r.sadd(CacheConstants.books_dirty, *book_ids)
+
+
+async def put_book(r, book: dict):
+    await _mark_dirty(r, [book['_id']])
+    await _write(r, [book])
+    return await bump_version(r, CacheConstants.books_version)
+
+
+async def put_books(r, books):
+    """Like :func:`put_book` for many books, with a single version bump."""
+    await _mark_dirty(r, [book['_id'] for book in books])
+    await _write(r, books)
+    return await bump_version(r, CacheConstants.books_version)
+
+
+async def remove_book(r, book_id):
+    await _mark_dirty(r, [book_id])
+    await _remove(r, [book_id])
+    return await bump_version(r, CacheConstants.books_version)
+
+
+async def remove_books(r, book_ids):
+    """Like :func:`remove_book` for many books, with a single version bump."""
+    await _mark_dirty(r, book_ids)
+    await _remove(r, book_ids)
+    return await bump_version(r, CacheConstants.books_version)
+
+
+async def get_books_page(r, limit, after=None):
+    """Books after the ``(created_at, _id)`` key, or ``None`` while the cache is cold."""
+    if not await r.exists(CacheConstants.books_warm):
+        return None
+
+    index = CacheConstants.books_index
+    if after is None:
+        ids = await r.zrange(index, 0, limit - 1)
+    else:
+        created_at, book_id = after
+        rank = await r.zrank(index, book_id)
+        if rank is not None:
+            ids = await r.zrange(index, rank + 1, rank + limit)
+        else:
+            ties = await r.zrangebyscore(index, created_at, created_at)
+            ids = [_id for _id in ties if _id.decode() > book_id][:limit]
+            ids += await r.zrangebyscore(index, '({}'.format(created_at), '+inf', start=0, num=limit - len(ids))
+
+    if not ids:
+        return []
+    values = await r.hmget(CacheConstants.books_data, ids)
+    return [json_utils.loads(value) for value in values if value is not None]
+
+
+async def _refresh_dirty_books(r, db):
+    """Read the books written during the warm-up again, until no more writes come in meanwhile."""
+    while True:
+        pipe = r.pipeline(transaction=True)
+        pipe.smembers(CacheConstants.books_dirty)
+        pipe.delete(CacheConstants.books_dirty)
+        book_ids, _ = await pipe.execute()
+        if not book_ids:
+            return
+        book_ids = [_id.decode() if isinstance(_id, bytes) else _id for _id in book_ids]
+        books = {book._id: book.to_dict() for book in await db.get_books(filter_={'_id': {'$in': book_ids}})}
+        if books:
+            await _write(r, books.values())
+        deleted = [_id for _id in book_ids if _id not in books]
+        if deleted:
+            await _remove(r, deleted)
+
+
+async def warm_books_cache(r, db, batch_size=500):
+    """Load every book into the cache in batches; only one worker warms at a time.
+
+    Returns whether the cache is now warm. A failed read leaves it cold, to be warmed again on a
+    later miss, rather than serve part of the collection as all of it.
+    """
+    if not await r.set(CacheConstants.books_warming, 1, ex=600, nx=True):
+        return False
+    try:
+        n_books = 0
+        async for docs in db.iter_books(batch_size=batch_size):
+            docs = [Book().from_dict(doc).to_dict() for doc in docs]
+            await _write(r, docs)
+            n_books += len(docs)
+        await _refresh_dirty_books(r, db)
+        await r.set(CacheConstants.books_warm, 1)
+        logger.info('books cache warmed with {} books'.format(n_books))
+        return True
+    except Exception as ex:
+        logger.warning('books cache warm-up failed, it stays cold: {}'.format(ex))
+        return False
+    finally:
+        await r.delete(CacheConstants.books_warming)
@@ -0,0 +1,276 @@
+"""In-process full-text index of the books, ranked with BM25.
+
+Each worker keeps its own :class:`InvertedIndex`, built from MongoDB at startup and kept
+current by the write handlers through :class:`BooksSearch`, which also publishes every change
+so the other workers apply it too.
+
+Postings are two ``array('I')`` per term (document numbers and weighted term frequencies),
+about 8 bytes per posting instead of a tuple in a list. Document numbers only grow, so a
+removed book leaves dead postings behind until the index is compacted: :class:`BooksSearch` builds
+the compacted copy in a thread and swaps it in, so the event loop is not held for the whole pass.
+"""
+import asyncio
+import heapq
+import math
+import re
+import uuid
+from array import array
+from collections import Counter
+
+from app.constants.cache_constants import CacheConstants
+from app.databases.redis_cached import follow_channel
+from app.models.book import Book
+from app.utils import json_utils
+from app.utils.logger_utils import get_logger
+
+logger = get_logger('BooksSearch')
+
+# A word in the title counts three times, one in the authors twice.
+FIELD_WEIGHTS = {'title': 3, 'authors': 2, 'description': 1}
+K1 = 1.2
+B = 0.75
+REMOVED = math.inf
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def _book_terms(book: dict):
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = book.get(field)
+        if isinstance(value, list):
+            value = ' '.join(item for item in value if isinstance(item, str))
+        if isinstance(value, str):
+            for token in tokenize(value):
+                terms[token] += weight
+    return terms
+
+
+class InvertedIndex:
+    def __init__(self):
+        self._postings = {}  # term -> (document numbers, weighted term frequencies)
+        self._book_ids = []  # document number -> book _id, None once removed
+        self._docs = {}  # book _id -> document number
+        # book _id -> version indexed, REMOVED once removed, until the next compaction.
+        self._versions = {}
+        self._lengths = array('I')
+        self._total_length = 0
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, book: dict):
+        """Index ``book``, replacing the version indexed before; an older version or a removed book is ignored."""
+        version = book.get('version', 0)
+        if version < self._versions.get(book['_id'], -1):
+            return False
+        self._unindex(book['_id'])
+        self._versions[book['_id']] = version
+        terms = _book_terms(book)
+        doc = len(self._book_ids)
+        self._book_ids.append(book['_id'])
+        self._docs[book['_id']] = doc
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._total_length += length
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('I'), array('I'))
+            postings[0].append(doc)
+            postings[1].append(frequency)
+        return True
+
+    def remove(self, book_id):
+        # Book ids are not reused, so any later add of this one is a change that arrived late.
+        self._versions[book_id] = REMOVED
+        return self._unindex(book_id)
+
+    def _unindex(self, book_id):
+        doc = self._docs.pop(book_id, None)
+        if doc is None:
+            return False
+        self._book_ids[doc] = None
+        self._total_length -= self._lengths[doc]
+        self._removed += 1
+        return True
+
+    @property
+    def needs_compaction(self):
+        return self._removed > 1024 and self._removed * 4 > len(self._book_ids)
+
+    def compact(self):
+        """Drop the postings of removed books and renumber the others, in place."""
+        self.__dict__.update(self.compacted().__dict__)
+
+    def compacted(self):
+        """A copy without the postings of removed books; reads this index and leaves it as it is."""
+        renumber = array('i', [-1]) * len(self._book_ids)
+        book_ids = []
+        lengths = array('I')
+        for doc, book_id in enumerate(self._book_ids):
+            if book_id is not None:
+                renumber[doc] = len(book_ids)
+                book_ids.append(book_id)
+                lengths.append(self._lengths[doc])
+
+        postings = {}
+        for term, (docs, frequencies) in self._postings.items():
+            kept_docs, kept_frequencies = array('I'), array('I')
+            for doc, frequency in zip(docs, frequencies):
+                if renumber[doc] >= 0:
+                    kept_docs.append(renumber[doc])
+                    kept_frequencies.append(frequency)
+            if kept_docs:
+                postings[term] = (kept_docs, kept_frequencies)
+
+        index = InvertedIndex()
+        index._postings = postings
+        index._book_ids = book_ids
+        index._docs = {book_id: doc for doc, book_id in enumerate(book_ids)}
+        index._versions = {book_id: self._versions[book_id] for book_id in book_ids}
+        index._lengths = lengths
+        index._total_length = self._total_length
+        return index
+
+    def search(self, query, limit, offset=0):
+        """Return ``(n_matches, [(book_id, score), ...])`` for the ``limit`` best after the first ``offset``."""
+        n_docs = len(self._docs)
+        if not n_docs:
+            return 0, []
+        book_ids = self._book_ids
+        lengths = self._lengths
+        # K1 * (1 - B + B * length / average length), split so the loop does one multiply-add.
+        norm = K1 * (1 - B)
+        norm_per_length = K1 * B * n_docs / self._total_length if self._total_length else 0.0
+
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            live = zip(*postings)
+            if self._removed:
+                live = [(doc, frequency) for doc, frequency in live if book_ids[doc] is not None]
+            else:
+                live = list(live)
+            idf = math.log(1 + (n_docs - len(live) + 0.5) / (len(live) + 0.5))
+            for doc, frequency in live:
+                score = idf * frequency * (K1 + 1) / (frequency + norm + norm_per_length * lengths[doc])
+                scores[doc] = scores.get(doc, 0.0) + score
+
+        # Equal scores rank the book indexed first higher.
+        best = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], -item[0]))
+        return len(scores), [(book_ids[doc], score) for doc, score in best[offset:]]
+
+
+class BooksSearch:
+    """This worker's :class:`InvertedIndex` plus the plumbing that keeps it current.
+
+    Until :meth:`build` finishes, changes are queued and replayed afterwards, so a batch read
+    before a write cannot bring the old version of a book back. The same goes while a compacted
+    copy of the index is built in a thread: searches use the current index, which is left
+    untouched until the copy replaces it.
+    """
+
+    def __init__(self, channel=CacheConstants.search_channel):
+        self.index = InvertedIndex()
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self.ready = False
+        self._pending = None
+        self._compaction = None
+
+    def reset(self):
+        if self._compaction is not None:
+            self._compaction.cancel()
+            self._compaction = None
+        self.index = InvertedIndex()
+        self.ready = False
+        self._pending = None
+
+    async def build(self, db, batch_size=500):
+        if self.ready or self._pending is not None:
+            return
+        pending = self._pending = []
+        index = InvertedIndex()
+        try:
+            async for docs in db.iter_books(batch_size=batch_size):
+                for doc in docs:
+                    index.add(Book().from_dict(doc).to_dict())
+        except BaseException:
+            if self._pending is pending:
+                self._pending = None
+            raise
+        if self._pending is not pending:
+            return  # reset meanwhile: a newer build takes over
+        self._pending = None
+        self.index = index
+        for change in pending:
+            self._apply(change)
+        self.ready = True
+        logger.info('search index built with {} books'.format(len(index)))
+
+    def search(self, query, limit, offset=0):
+        return self.index.search(query, limit, offset)
+
+    def _apply(self, change):
+        if self._pending is not None:
+            self._pending.append(change)
+            return
+        for book in change.get('add', []):
+            self.index.add(book)
+        for book_id in change.get('remove', []):
+            self.index.remove(book_id)
+        if self.ready and self.index.needs_compaction:
+            self._pending = []
+            self._compaction = asyncio.ensure_future(self._compact(self.index))
+
+    async def _compact(self, index):
+        compacted = None
+        try:
+            compacted = await asyncio.get_running_loop().run_in_executor(None, index.compacted)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.warning('search index compaction failed: {}'.format(ex))
+        pending, self._pending, self._compaction = self._pending, None, None
+        if compacted is not None:
+            self.index = compacted
+        for change in pending:
+            self._apply(change)
+
+    async def _publish(self, r, change):
+        self._apply(change)
+        await r.publish(self.channel, json_utils.dumps({'worker': self.worker_id, **change}))
+
+    async def add_books(self, r, books):
+        await self._publish(r, {'add': books})
+
+    async def remove_books(self, r, book_ids):
+        await self._publish(r, {'remove': list(book_ids)})
+
+    def _apply_published(self, change):
+        if change.pop('worker') != self.worker_id:
+            self._apply(change)
+
+    async def listen(self, r, db=None, batch_size=500):
+        """Apply the changes published by other workers; runs until cancelled.
+
+        Changes published while it was reconnecting are lost, so it then builds the index again
+        from ``db`` (without a ``db``, the next search starts that build).
+        """
+        async def resubscribed(again):
+            if again:
+                self.reset()
+                if db is not None:
+                    await self.build(db, batch_size=batch_size)
+        await follow_channel(r, self.channel, self._apply_published, resubscribed)
+
+
+books_search = BooksSearch()
@@ -0,0 +1,149 @@
+"""Catalog statistics kept as counters in Redis, so reading them never touches the books collection.
+
+``stats:books:total`` counts every book; the sorted sets ``stats:books:{owner,publisher,author}``
+map each name to its number of books, which makes the top groups one ``ZRANGE``. Writes apply
+the difference between the old and the new version of the books they change; a name whose
+count drops to zero is removed.
+
+Counters can drift (e.g. a worker dying between the database write and the counter update);
+:func:`reconcile_stats` recounts from the collection. Run it with::
+
+    $ python -m app.databases.books_stats
+"""
+import asyncio
+from collections import Counter
+
+from app.constants.cache_constants import CacheConstants
+from app.utils.logger_utils import get_logger
+
+logger = get_logger('BooksStats')
+
+GROUPS = {'owner': 'owners', 'publisher': 'publishers', 'author': 'authors'}
+
+
+def _book_groups(book: dict):
+    """``(group, name)`` pairs ``book`` counts towards."""
+    pairs = set()
+    if book.get('owner'):
+        pairs.add(('owner', book['owner']))
+    if book.get('publisher'):
+        pairs.add(('publisher', book['publisher']))
+    for author in book.get('authors') or []:
+        if isinstance(author, str) and author:
+            pairs.add(('author', author))
+    return pairs
+
+
+def books_delta(old_books=(), new_books=()):
+    """Counter changes going from ``old_books`` to ``new_books``; ``None`` on either side means no book."""
+    delta = Counter()
+    for book in old_books:
+        if book is not None:
+            delta['total'] -= 1
+            for pair in _book_groups(book):
+                delta[pair] -= 1
+    for book in new_books:
+        if book is not None:
+            delta['total'] += 1
+            for pair in _book_groups(book):
+                delta[pair] += 1
+    return delta
+
+
+async def apply_delta(r, delta):
+    changes = {key: amount for key, amount in delta.items() if amount}
+    if not changes:
+        return
+    pipe = r.pipeline(transaction=True)
+    touched = set()
+    for key, amount in changes.items():
+        if key == 'total':
+            pipe.incrby(CacheConstants.stats_total, amount)
+        else:
+            group, name = key
+            stats_key = CacheConstants.stats_group.format(group=group)
+            pipe.zincrby(stats_key, amount, name)
+            touched.add(stats_key)
+    for stats_key in touched:
+        pipe.zremrangebyscore(stats_key, '-inf', 0)
+    await pipe.execute()
+
+
+async def record_changes(r, old_books=(), new_books=()):
+    await apply_delta(r, books_delta(old_books, new_books))
+
+
+async def get_stats(r, limit):
+    """Totals plus the ``limit`` biggest groups of each kind."""
+    pipe = r.pipeline(transaction=False)
+    pipe.get(CacheConstants.stats_total)
+    for group in GROUPS:
+        stats_key = CacheConstants.stats_group.format(group=group)
+        pipe.zcard(stats_key)
+        pipe.zrange(stats_key, 0, limit - 1, desc=True, withscores=True)
+    total, *results = await pipe.execute()
+
+    stats = {'n_books': int(total or 0)}
+    for i, (group, plural) in enumerate(GROUPS.items()):
+        count, top = results[2 * i], results[2 * i + 1]
+        stats['n_' + plural] = count
+        stats[plural] = [{'name': _str(name), 'n_books': int(score)} for name, score in top]
+    return stats
+
+
+def _str(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def reconcile_stats(r, db, batch_size=500):
+    """Recount every counter from the collection and swap the results in; return what had drifted.
+
+    Writes made while the books are being read can be lost from the new counters, so run it when
+    writes are quiet (or again afterwards).
+    """
+    counts = Counter()
+    async for docs in db.iter_books(batch_size=batch_size):
+        counts.update(books_delta(new_books=docs))
+
+    drift = {}
+    old_total = int(await r.get(CacheConstants.stats_total) or 0)
+    if old_total != counts['total']:
+        drift['n_books'] = counts['total'] - old_total
+
+    pipe = r.pipeline(transaction=True)
+    for group in GROUPS:
+        stats_key = CacheConstants.stats_group.format(group=group)
+        new = {key[1]: count for key, count in counts.items() if key != 'total' and key[0] == group and count > 0}
+        old = {_str(name): int(score) for name, score in await r.zrange(stats_key, 0, -1, withscores=True)}
+        changed = {name: new.get(name, 0) - old.get(name, 0) for name in set(new) | set(old)
+                   if new.get(name, 0) != old.get(name, 0)}
+        if changed:
+            drift[GROUPS[group]] = changed
+        pipe.delete(stats_key)
+        if new:
+            pipe.zadd(stats_key, new)
+    pipe.set(CacheConstants.stats_total, counts['total'])
+    await pipe.execute()
+    if drift:
+        logger.warning('books stats had drifted: {}'.format(drift))
+    return drift
+
+
+async def main():
+    import aioredis
+
+    from app.databases.mongodb import AsyncMongoDB
+    from config import Config
+
+    r = aioredis.from_url(Config.REDIS)
+    db = AsyncMongoDB()
+    try:
+        drift = await reconcile_stats(r, db, batch_size=Config.BOOKS_EXPORT_BATCH_SIZE)
+        print('stats reconciled, drift: {}'.format(drift or 'none'))
+    finally:
+        db.close()
+        await r.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
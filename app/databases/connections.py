@@ -0,0 +1,45 @@
+"""MongoDB and Redis clients of each worker.
+
+Sanic forks its workers after importing the app, and a client created before the fork would be
+shared by every worker. So nothing connects at import time: each worker opens its own clients
+in ``before_server_start`` and closes them once it has stopped serving.
+"""
+import time
+
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.utils.logger_utils import get_logger
+from config import Config, MongoDBConfig
+
+logger = get_logger('Connections')
+
+
+def connect_mongodb():
+    return AsyncMongoDB(MongoDB(max_pool_size=MongoDBConfig.MAX_POOL_SIZE))
+
+
+def connect_redis(url):
+    # Imported here, like in books_stats.main: importing the app does not load the Redis client.
+    import aioredis
+
+    # A blocking pool makes a request wait for a free connection instead of failing.
+    pool = aioredis.BlockingConnectionPool.from_url(
+        url, max_connections=Config.REDIS_MAX_CONNECTIONS, timeout=Config.REDIS_POOL_TIMEOUT
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+async def open_connections(app, loop):
+    app.ctx.starting_at = time.perf_counter()
+    app.ctx.db = connect_mongodb()
+    app.ctx.redis = connect_redis(app.config.REDIS)
+
+
+async def log_startup(app, loop):
+    startup_seconds = time.perf_counter() - app.ctx.starting_at
+    logger.info('worker started in {:.3f}s'.format(startup_seconds), extra={'startup_seconds': startup_seconds})
+
+
+async def close_connections(app, loop):
+    await app.ctx.redis.close()
+    await app.ctx.redis.connection_pool.disconnect()
+    app.ctx.db.close()
@@ -1,36 +1,150 @@
-from pymongo import MongoClient
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from app.constants.mongodb_constants import MongoCollections
+from pymongo import MongoClient, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.constants.mongodb_constants import MongoCollections, MongoIndexes
 from app.models.book import Book
+from app.utils import metrics, request_timing
 from app.utils.logger_utils import get_logger
 from config import MongoDBConfig
 
 logger = get_logger('MongoDB')
 
+operation_seconds = metrics.histogram(
+    'mongodb_operation_duration_seconds', 'MongoDB calls by method, executor queueing included.', ('method',)
+)
+operation_errors = metrics.counter('mongodb_operation_errors_total', 'MongoDB calls that raised, by method.', ('method',))
+
+BOOKS_ORDER = [('createdAt', 1), ('_id', 1)]
+
+# Every query the app runs, as (collection, filter, sort); checked for collection scans by explain_queries.
+QUERY_SHAPES = {
+    'user by username': (MongoCollections.users, {'username': ''}, None),
+    'book by id': (MongoCollections.books, {'_id': ''}, None),
+    'books by owner': (MongoCollections.books, {'owner': ''}, None),
+    'books page': (MongoCollections.books, {'$or': [
+        {'createdAt': {'$gt': 0}},
+        {'createdAt': 0, '_id': {'$gt': ''}}
+    ]}, BOOKS_ORDER),
+    'books export': (MongoCollections.books, {'_id': {'$gt': ''}}, [('_id', 1)]),
+    'books text search': (MongoCollections.books, {'$text': {'$search': ''}}, None),
+}
+
+
+def _book_filter(book_id, owner=None, versions=None):
+    filter_ = {'_id': book_id}
+    if owner is not None:
+        filter_['owner'] = owner
+    if versions is not None:
+        # Books written before versioning have no field, which reads as version 0.
+        filter_['version'] = {'$in': (versions + [None]) if 0 in versions else versions}
+    return filter_
+
+
+def _plan_stages(plan):
+    """Every ``stage`` of an explain plan, however deeply the server nests them."""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages += _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages += _plan_stages(value)
+    return stages
+
 
 class MongoDB:
-    def __init__(self, connection_url=None):
+    def __init__(self, connection_url=None, client=None, max_pool_size=None):
         if connection_url is None:
             connection_url = f'mongodb://{MongoDBConfig.USERNAME}:{MongoDBConfig.PASSWORD}@{MongoDBConfig.HOST}:{MongoDBConfig.PORT}'
 
         self.connection_url = connection_url.split('@')[-1]
-        self.client = MongoClient(connection_url)
+        if client is None:
+            client = MongoClient(connection_url, maxPoolSize=max_pool_size or MongoDBConfig.MAX_POOL_SIZE)
+        self.client = client
         self.db = self.client[MongoDBConfig.DATABASE]
 
         self._books_col = self.db[MongoCollections.books]
         self._users_col = self.db[MongoCollections.users]
+
+    def ensure_indexes(self):
+        """Create the indexes of :class:`MongoIndexes` that do not exist yet; return their names."""
+        created = []
+        for collection in [MongoCollections.books, MongoCollections.users]:
+            col = self.db[collection]
+            try:
+                existing = col.index_information()
+                for index in getattr(MongoIndexes, collection):
+                    if index['name'] in existing:
+                        continue
+                    options = {key: value for key, value in index.items() if key != 'keys'}
+                    col.create_index(index['keys'], **options)
+                    created.append(index['name'])
+                    logger.info('created index {} on {}'.format(index['name'], collection))
+            except Exception as ex:
+                logger.exception(ex)
+        return created
+
+    def explain_queries(self):
+        """Explain every query of ``QUERY_SHAPES`` and log the ones that scan a whole collection."""
+        report = []
+        for name, (collection, filter_, sort) in QUERY_SHAPES.items():
+            cursor = self.db[collection].find(filter_)
+            if sort:
+                cursor = cursor.sort(sort)
+            try:
+                stages = _plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+            except Exception as ex:
+                logger.warning('can not explain {}: {}'.format(name, ex))
+                report.append({'query': name, 'collection': collection, 'error': str(ex)})
+                continue
+            collscan = 'COLLSCAN' in stages
+            if collscan:
+                logger.warning('{} scans the whole {} collection: {}'.format(name, collection, ' <- '.join(stages)))
+            report.append({'query': name, 'collection': collection, 'stages': stages, 'collscan': collscan})
+        return report
+
     def get_books(self, filter_=None, projection=None):
-        try:
-            if not filter_:
-                filter_ = {}
-            cursor = self._books_col.find(filter_, projection=projection)
-            data = []
-            for doc in cursor:
-                data.append(Book().from_dict(doc))
-            return data
-        except Exception as ex:
-            logger.exception(ex)
-        return []
+        """Matching books; errors are raised, so an empty list always means no book matched."""
+        if not filter_:
+            filter_ = {}
+        cursor = self._books_col.find(filter_, projection=projection)
+        data = []
+        for doc in cursor:
+            data.append(Book().from_dict(doc))
+        return data
+
+    def get_books_page(self, limit, after=None, projection=None):
+        """Raw book documents in ``(createdAt, _id)`` order, starting after the ``(created_at, _id)`` key.
+
+        Errors are raised: the page is cached, and an empty one would hide every book until it expires.
+        """
+        filter_ = {}
+        if after:
+            created_at, book_id = after
+            filter_ = {'$or': [
+                {'createdAt': {'$gt': created_at}},
+                {'createdAt': created_at, '_id': {'$gt': book_id}}
+            ]}
+        cursor = self._books_col.find(filter_, projection=projection).sort(BOOKS_ORDER).limit(limit)
+        return list(cursor)
+
+    def get_books_after_id(self, after_id=None, limit=500, filter_=None, projection=None):
+        """Raw book documents matching ``filter_`` in ``_id`` order with ``_id`` greater than ``after_id``.
+
+        Errors are raised, not logged: an empty list must only ever mean the end of the collection.
+        """
+        if after_id:
+            after = {'_id': {'$gt': after_id}}
+            filter_ = {'$and': [filter_, after]} if filter_ else after
+        cursor = self._books_col.find(filter_ or {}, projection=projection).sort('_id', 1).limit(limit)
+        return list(cursor)
 
     def add_book(self, book: Book):
         try:
@@ -40,6 +154,17 @@ class MongoDB:
             logger.exception(ex)
         return None
 
+    def add_books(self, books):
+        """Insert ``books`` unordered; return ``{index: error message}`` for the ones that failed."""
+        try:
+            self._books_col.insert_many([book.to_dict() for book in books], ordered=False)
+            return {}
+        except BulkWriteError as ex:
+            return {error['index']: error['errmsg'] for error in ex.details['writeErrors']}
+        except Exception as ex:
+            logger.exception(ex)
+        return {index: 'insert failed' for index in range(len(books))}
+
     # TODO: write functions CRUD with books
     # def add_book(self, book: Book):
     #     try:
@@ -48,23 +173,37 @@ class MongoDB:
     #     except Exception as ex:
     #         return None
 
-    def del_book(self, book_id):
+    def del_book(self, book_id, owner=None, versions=None):
+        """Delete the book if it matches ``owner`` and one of ``versions``; return it, or ``None`` if nothing matched."""
         try:
-            book_obj = self.get_books(filter_={"_id":book_id})
-            book = [book.to_dict() for book in book_obj]
-            del_doc = self._books_col.delete_one(book[0])
-            print(del_doc.deleted_count, " books deleted")
-            return True
+            return self._books_col.find_one_and_delete(_book_filter(book_id, owner, versions))
         except Exception as ex:
             logger.exception(ex)
             return None
 
-    def update_book(self, book_id, update=None):
+    def del_books(self, filter_):
+        try:
+            return self._books_col.delete_many(filter_)
+        except Exception as ex:
+            logger.exception(ex)
+            return None
+
+    def update_book(self, book_id, update=None, owner=None, versions=None):
+        """Like :meth:`del_book`, but ``$set`` ``update`` and bump ``version``; returns the book as it was."""
         try:
             if not update:
                 update = {}
-            updated_doc = self._books_col.update_one({"_id":book_id},{"$set":update})
-            return updated_doc
+            return self._books_col.find_one_and_update(
+                _book_filter(book_id, owner, versions), {'$set': update, '$inc': {'version': 1}},
+                return_document=ReturnDocument.BEFORE
+            )
+        except Exception as ex:
+            logger.exception(ex)
+            return None
+
+    def update_books(self, filter_, update):
+        try:
+            return self._books_col.update_many(filter_, {'$set': update, '$inc': {'version': 1}})
         except Exception as ex:
             logger.exception(ex)
             return None
@@ -82,16 +221,102 @@ class MongoDB:
             logger.exception(ex)
         return []
 
-    def add_user(self,user):
+    def add_user(self, user):
+        """Insert ``user``; return ``None`` if the username is taken (unique ``username_1`` index)."""
         try:
-            inserted = self._users_col.insert_one(user)
-            return inserted
+            return self._users_col.insert_one(user)
+        except DuplicateKeyError:
+            return None
+
+    def update_user(self, username, update):
+        try:
+            updated = self._users_col.update_one({'username': username}, {'$set': update})
+            return updated
         except Exception as ex:
             logger.exception(ex)
-        return []
+        return None
+
+
+class AsyncMongoDB:
+    """Awaitable facade over :class:`MongoDB`.
+
+    pymongo is blocking, so every call is pushed to a bounded thread pool and the
+    event loop only awaits the result. At most ``max_workers`` queries run at once,
+    the rest wait in the executor queue instead of stalling the loop.
+    """
+
+    def __init__(self, mongodb: MongoDB = None, max_workers=None):
+        self.mongodb = mongodb if mongodb is not None else MongoDB()
+        self.max_workers = max_workers or MongoDBConfig.EXECUTOR_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='mongodb')
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            operation_errors.inc(fn.__name__)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started_at
+            operation_seconds.observe(elapsed, fn.__name__)
+            request_timing.add('db', elapsed)
+
+    async def ensure_indexes(self):
+        return await self._run(self.mongodb.ensure_indexes)
+
+    async def explain_queries(self):
+        return await self._run(self.mongodb.explain_queries)
+
+    async def get_books(self, filter_=None, projection=None):
+        return await self._run(self.mongodb.get_books, filter_=filter_, projection=projection)
+
+    async def get_books_page(self, limit, after=None, projection=None):
+        return await self._run(self.mongodb.get_books_page, limit, after=after, projection=projection)
+
+    async def iter_books(self, after_id=None, batch_size=500, filter_=None, projection=None):
+        """Yield every book matching ``filter_``, one batch of raw documents at a time, resuming after ``after_id``.
+
+        A failed read raises mid-iteration, so callers never mistake it for the end of the collection.
+        """
+        while True:
+            docs = await self._run(self.mongodb.get_books_after_id, after_id=after_id, limit=batch_size,
+                                   filter_=filter_, projection=projection)
+            if not docs:
+                return
+            yield docs
+            if len(docs) < batch_size:
+                return
+            after_id = docs[-1]['_id']
+
+    async def add_book(self, book: Book):
+        return await self._run(self.mongodb.add_book, book)
+
+    async def add_books(self, books):
+        return await self._run(self.mongodb.add_books, books)
+
+    async def del_book(self, book_id, owner=None, versions=None):
+        return await self._run(self.mongodb.del_book, book_id, owner=owner, versions=versions)
+
+    async def update_book(self, book_id, update=None, owner=None, versions=None):
+        return await self._run(self.mongodb.update_book, book_id, update=update, owner=owner, versions=versions)
 
+    async def del_books(self, filter_):
+        return await self._run(self.mongodb.del_books, filter_)
 
+    async def update_books(self, filter_, update):
+        return await self._run(self.mongodb.update_books, filter_, update)
 
+    async def get_user(self, filter_):
+        return await self._run(self.mongodb.get_user, filter_)
 
+    async def add_user(self, user):
+        return await self._run(self.mongodb.add_user, user)
 
+    async def update_user(self, username, update):
+        return await self._run(self.mongodb.update_user, username, update)
 
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.mongodb.client.close()
@@ -1,17 +1,382 @@
-import json
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, namedtuple
 
+from app.constants.cache_constants import CacheConstants
+from app.utils import json_utils, metrics, request_timing
+from app.utils.logger_utils import get_logger
+from config import Config
 
-async def set_cache(r, key, value, ttl=300):
-    await r.set(key, json.dumps(value), ex=ttl)
+logger = get_logger('RedisCached')
 
+redis_seconds = metrics.histogram(
+    'cache_redis_duration_seconds', 'Redis round trips of the tiered cache, by operation.', ('op',),
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1.0)
+)
 
-async def get_cache(r, key):
+# Stored in place of a book that does not exist, so repeated misses skip the database.
+MISSING = '__missing__'
+
+
+def _observe_redis(op, started_at):
+    elapsed = time.perf_counter() - started_at
+    redis_seconds.observe(elapsed, op)
+    request_timing.add('cache', elapsed)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def to_dict(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.hits + self.negative_hits) / lookups if lookups else 0.0
+        }
+
+
+book_cache_stats = CacheStats()
+
+
+# What get_or_set stores: the value plus the time after which it is served stale.
+_Entry = namedtuple('_Entry', ['fresh_until', 'value'])
+
+
+def _encode(value):
+    """Values are stored with a one byte kind prefix; ``bytes`` are kept as they are."""
+    if isinstance(value, _Entry):
+        return b'e%.6f\n' % value.fresh_until + _encode(value.value)
+    if isinstance(value, bytes):
+        return b'b' + value
+    return b'j' + json_utils.dumps(value)
+
+
+def _decode(raw):
+    kind = raw[:1]
+    if kind == b'e':
+        header, _, rest = raw.partition(b'\n')
+        return _Entry(float(header[1:]), _decode(rest))
+    if kind == b'b':
+        return raw[1:]
+    return json_utils.loads(raw[1:])
+
+
+class LRUCache:
+    """Bounded in-process cache; the least recently used entry is evicted first, expired ones on read."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return ``(found, value)``."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SingleFlight:
+    """Runs one computation per key at a time; concurrent callers await the same result."""
+
+    def __init__(self):
+        self._inflight = {}
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a cancelled caller does not cancel the computation the others are waiting on.
+        return await asyncio.shield(task)
+
+
+async def follow_channel(r, channel, on_message, on_subscribe=None):
+    """Call ``on_message`` with each message published on ``channel``; runs until cancelled.
+
+    A Redis error does not end it: it subscribes again after a growing pause. Messages published
+    in between are lost, so ``on_subscribe(resubscribed)`` is awaited after every subscription
+    (``resubscribed`` is False the first time) for the caller to catch up.
+    """
+    delay, resubscribed = Config.PUBSUB_RETRY_MIN, False
+    while True:
+        pubsub = r.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            if on_subscribe is not None:
+                await on_subscribe(resubscribed)
+            delay = Config.PUBSUB_RETRY_MIN
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    on_message(json_utils.loads(message['data']))
+        except asyncio.CancelledError:
+            return
+        except Exception as ex:
+            logger.warning('subscription to {} lost, retrying in {}s: {}'.format(channel, delay, ex))
+        finally:
+            try:
+                await pubsub.unsubscribe(channel)
+                # Gives the connection back to the pool, a broken one included.
+                await pubsub.reset()
+            except Exception:
+                pass
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, Config.PUBSUB_RETRY_MAX)
+        resubscribed = True
+
+
+class TieredCache:
+    """Cache of JSON values or raw ``bytes`` with an in-process :class:`LRUCache` in front of Redis.
+
+    Values read from the local tier are shared objects and must not be mutated. ``delete``
+    publishes the keys on ``channel`` so every worker running :meth:`listen` evicts them too;
+    local entries never outlive ``local_ttl``, which bounds staleness if a message is lost.
+    """
+
+    def __init__(self, max_size=None, local_ttl=None, channel=CacheConstants.invalidation_channel):
+        self.local = LRUCache(max_size or Config.LOCAL_CACHE_SIZE, local_ttl or Config.LOCAL_CACHE_TTL)
+        self.channel = channel
+        self.worker_id = uuid.uuid4().hex
+        self.stats = {'local': CacheStats(), 'redis': CacheStats()}
+        self.sets = 0
+        self.flight = SingleFlight()
+
+    async def get(self, r, key):
+        found, value = self.local.get(key)
+        if found:
+            self.stats['local'].hits += 1
+            return value
+        self.stats['local'].misses += 1
+
+        started_at = time.perf_counter()
+        raw = await r.get(key)
+        _observe_redis('get', started_at)
+        if raw is None:
+            self.stats['redis'].misses += 1
+            return None
+        self.stats['redis'].hits += 1
+        value = _decode(raw)
+        self.local.set(key, value)
+        return value
+
+    async def get_many(self, r, keys):
+        """Values of ``keys`` in order, ``None`` for misses; one ``MGET`` for everything not held locally."""
+        values = []
+        remote = []
+        for i, key in enumerate(keys):
+            found, value = self.local.get(key)
+            self.stats['local'].hits += found
+            self.stats['local'].misses += not found
+            values.append(value)
+            if not found:
+                remote.append(i)
+        if remote:
+            started_at = time.perf_counter()
+            raws = await r.mget([keys[i] for i in remote])
+            _observe_redis('mget', started_at)
+            for i, raw in zip(remote, raws):
+                if raw is None:
+                    self.stats['redis'].misses += 1
+                    continue
+                self.stats['redis'].hits += 1
+                values[i] = _decode(raw)
+                self.local.set(keys[i], values[i])
+        return values
+
+    async def set(self, r, key, value, ttl=300):
+        started_at = time.perf_counter()
+        await r.set(key, _encode(value), ex=ttl)
+        _observe_redis('set', started_at)
+        self.sets += 1
+        self.local.set(key, value, ttl=ttl)
+
+    async def set_many(self, r, items, ttl=300):
+        """``set`` every ``key: value`` of ``items`` in one pipelined round trip."""
+        pipe = r.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, _encode(value), ex=ttl)
+            self.local.set(key, value, ttl=ttl)
+        started_at = time.perf_counter()
+        await pipe.execute()
+        _observe_redis('set_many', started_at)
+        self.sets += len(items)
+
+    async def get_or_set(self, r, key, loader, ttl=300, stale_ttl=0):
+        """Read-through ``get`` where only one caller per key runs ``loader`` on a miss.
+
+        Within a worker, concurrent misses share one ``loader()`` call; across workers a short
+        Redis lock elects the loader and the others poll for its result, loading themselves if
+        it does not show up before the lock expires. For ``stale_ttl`` seconds after ``ttl``
+        the old value is still returned while a single background refresh replaces it.
+        """
+        entry = await self.get(r, key)
+        if entry is not None:
+            if entry.fresh_until <= time.time() and key not in self.flight:
+                asyncio.ensure_future(self.flight.do(key, lambda: self._load(r, key, loader, ttl, stale_ttl)))
+            return entry.value
+        return await self.flight.do(key, lambda: self._load(r, key, loader, ttl, stale_ttl))
+
+    async def _load(self, r, key, loader, ttl, stale_ttl):
+        lock_key = CacheConstants.lock.format(key=key)
+        token = uuid.uuid4().hex
+        if not await r.set(lock_key, token, px=int(Config.CACHE_LOCK_TTL * 1000), nx=True):
+            deadline = time.monotonic() + Config.CACHE_LOCK_TTL
+            while time.monotonic() < deadline:
+                await asyncio.sleep(Config.CACHE_LOCK_POLL_INTERVAL)
+                raw = await r.get(key)
+                entry = _decode(raw) if raw is not None else None
+                if entry is not None and entry.fresh_until > time.time():
+                    self.local.set(key, entry)
+                    return entry.value
+            logger.warning('cache lock on {} expired, loading without it'.format(key))
+            token = None
+
+        try:
+            value = await loader()
+            await self.set(r, key, _Entry(time.time() + ttl, value), ttl=ttl + stale_ttl)
+            return value
+        finally:
+            if token and await r.get(lock_key) == token.encode():
+                await r.delete(lock_key)
+
+    async def delete(self, r, *keys):
+        for key in keys:
+            self.local.delete(key)
+        await r.delete(*keys)
+        await r.publish(self.channel, json_utils.dumps({'worker': self.worker_id, 'keys': list(keys)}))
+
+    def _evict(self, payload):
+        if payload['worker'] != self.worker_id:
+            for key in payload['keys']:
+                self.local.delete(key)
+
+    async def _resubscribed(self, resubscribed):
+        # Deletes published while unsubscribed were missed: any local entry may be stale.
+        if resubscribed:
+            self.local.clear()
+
+    async def listen(self, r):
+        """Evict keys deleted by other workers; runs until cancelled."""
+        await follow_channel(r, self.channel, self._evict, self._resubscribed)
+
+    def clear(self):
+        self.local.clear()
+
+    def to_dict(self):
+        return {
+            'local_size': len(self.local),
+            'local': self.stats['local'].to_dict(),
+            'redis': self.stats['redis'].to_dict()
+        }
+
+
+cache = TieredCache()
+
+
+def _cache_lookups():
+    lookups = {}
+    for tier, stats in [*cache.stats.items(), ('book', book_cache_stats)]:
+        lookups[(tier, 'hit')] = stats.hits
+        lookups[(tier, 'miss')] = stats.misses
+        if stats.negative_hits:
+            lookups[(tier, 'negative_hit')] = stats.negative_hits
+    return lookups
+
+
+metrics.counter_func(
+    'cache_lookups_total', 'Cache lookups by tier (local, redis, and book for whole book lookups) and result.',
+    ('tier', 'result'), _cache_lookups
+)
+metrics.counter_func('cache_sets_total', 'Values written to the tiered cache.', (), lambda: {(): cache.sets})
+
+
+async def get_version(r, key):
     value = await r.get(key)
-    if value:
-        value = json.loads(value)
-    return value
+    return int(value) if value else 0
+
+
+async def bump_version(r, key):
+    return await r.incr(key)
+
+
+async def get_cached_book(r, key):
+    """Return ``(cached, book)``; a cached ``None`` book means the id is known not to exist."""
+    book = await cache.get(r, key)
+    if book is None:
+        book_cache_stats.misses += 1
+        return False, None
+    if book == MISSING:
+        book_cache_stats.negative_hits += 1
+        return True, None
+    book_cache_stats.hits += 1
+    return True, book
+
+
+async def get_cached_books(r, keys):
+    """``get_cached_book`` for many keys at once."""
+    results = []
+    for book in await cache.get_many(r, keys):
+        if book is None:
+            book_cache_stats.misses += 1
+            results.append((False, None))
+        elif book == MISSING:
+            book_cache_stats.negative_hits += 1
+            results.append((True, None))
+        else:
+            book_cache_stats.hits += 1
+            results.append((True, book))
+    return results
+
 
+async def set_cached_book(r, key, book, ttl=300, missing_ttl=30):
+    if book is None:
+        await cache.set(r, key, MISSING, ttl=missing_ttl)
+    else:
+        await cache.set(r, key, book, ttl=ttl)
 
 
+async def set_cached_books(r, books, ttl=300, missing_ttl=30):
+    """``set_cached_book`` for a ``key: book`` dict, ``None`` books included."""
+    found = {key: book for key, book in books.items() if book is not None}
+    missing = {key: MISSING for key, book in books.items() if book is None}
+    if found:
+        await cache.set_many(r, found, ttl=ttl)
+    if missing:
+        await cache.set_many(r, missing, ttl=missing_ttl)
 
 
+async def invalidate_cache(r, *keys):
+    await cache.delete(r, *keys)
@@ -0,0 +1,163 @@
+"""Admission control: per-client rate limits and per-route concurrency limits, one policy per blueprint.
+
+:class:`Admission` reads ``Config.ADMISSION[<blueprint name>]``:
+
+* ``rate`` and ``burst``: every client (its JWT ``username``, or its IP without a valid token)
+  has a token bucket in Redis refilled at ``rate`` tokens per second up to ``burst``. Each request
+  takes a token in one atomic script; an empty bucket answers 429 with ``Retry-After``.
+* ``routes``: ``{handler name: (running, waiting)}``. In each worker, at most ``running``
+  requests of the route run at once and ``waiting`` more wait in arrival order, for up to
+  ``Config.ADMISSION_QUEUE_TIMEOUT`` seconds; past that, or when the queue is full, 503 with
+  ``Retry-After`` right away.
+
+Install the rate limit with :meth:`Admission.install` and decorate the routes to limit with
+:meth:`Admission.limited`, on top of the other decorators.
+"""
+import asyncio
+import math
+from collections import deque
+from functools import wraps
+
+from app.constants.cache_constants import CacheConstants
+from app.decorators.auth import check_token
+from app.hooks.error import ApiServiceUnavailable, ApiTooManyRequests
+from app.utils import metrics
+from app.utils.logger_utils import get_logger
+from config import Config
+
+logger = get_logger('Admission')
+
+rejections = metrics.counter(
+    'admission_rejections_total', 'Requests turned away by admission control.', ('blueprint', 'route', 'reason')
+)
+
+# KEYS[1]: the bucket; ARGV: rate (tokens per second), burst. Returns {allowed, seconds to wait}.
+# The clock is Redis's, so workers on different hosts agree on it.
+TOKEN_BUCKET_SCRIPT = '''
+redis.replicate_commands()
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = burst
+if state[1] then
+    tokens = math.min(burst, tonumber(state[1]) + math.max(0, now - tonumber(state[2])) * rate)
+end
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    allowed = 1
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+'''
+
+
+async def take_token(r, key, rate, burst):
+    """Take a token from the bucket at ``key``; return ``(allowed, seconds until one is available)``."""
+    allowed, wait = await r.eval(TOKEN_BUCKET_SCRIPT, 1, key, rate, burst)
+    return bool(allowed), float(wait)
+
+
+def client_key(request):
+    authenticated, claims = check_token(request)
+    if authenticated:
+        return 'user:' + claims['username']
+    return 'ip:' + (request.remote_addr or request.ip)
+
+
+class ConcurrencyLimiter:
+    """At most ``limit`` holders at once; up to ``queue_size`` more wait in arrival order, the rest are refused."""
+
+    def __init__(self, limit, queue_size, timeout=None):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = Config.ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Return once holding a slot; raise ``asyncio.TimeoutError`` after ``timeout`` and ``OverflowError`` when the queue is full."""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            raise OverflowError('queue is full')
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.timeout)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended: pass it on.
+                self.release()
+            elif waiter in self._waiters:
+                # Not there if release() already skipped it, cancelled by the timeout.
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self):
+        # The slot goes straight to the first waiter, so a newcomer cannot take it first.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class Admission:
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = Config.ADMISSION.get(name, {}) if config is None else config
+        self.limiters = {}
+
+    def install(self, blueprint):
+        if self.config.get('rate'):
+            blueprint.middleware(self.rate_limit, 'request')
+
+    async def rate_limit(self, request):
+        key = CacheConstants.rate_limit.format(scope=self.name, client=client_key(request))
+        try:
+            async with request.app.ctx.redis as r:
+                allowed, wait = await take_token(r, key, self.config['rate'], self.config.get('burst', self.config['rate']))
+        except Exception as ex:
+            # Without Redis, let requests through rather than refuse them all.
+            logger.warning('rate limit not checked: {}'.format(ex))
+            return
+        if not allowed:
+            rejections.inc(self.name, request.route.name.rsplit('.', 1)[-1], 'rate_limited')
+            raise ApiTooManyRequests(
+                'more than {} requests per second'.format(self.config['rate']), retry_after=max(1, math.ceil(wait))
+            )
+
+    def limited(self, fn):
+        """Apply the concurrency limit configured for ``fn``'s name, if any."""
+        limits = self.config.get('routes', {}).get(fn.__name__)
+        if limits is None:
+            return fn
+        limiter = self.limiters[fn.__name__] = ConcurrencyLimiter(*limits)
+
+        @wraps(fn)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                await limiter.acquire()
+            except (OverflowError, asyncio.TimeoutError) as ex:
+                reason = 'queue_full' if isinstance(ex, OverflowError) else 'queue_timeout'
+                rejections.inc(self.name, fn.__name__, reason)
+                raise ApiServiceUnavailable('too many requests in progress, try again shortly',
+                                            retry_after=Config.ADMISSION_RETRY_AFTER)
+            try:
+                return await fn(request, *args, **kwargs)
+            finally:
+                limiter.release()
+        return wrapper
@@ -1,8 +1,124 @@
+import hashlib
+import time
 from functools import wraps
 import jwt
 
 from config import Config
+from app.constants.cache_constants import CacheConstants
+from app.databases.redis_cached import CacheStats, LRUCache, follow_channel
 from app.hooks.error import ApiUnauthorized
+from app.utils import json_utils, metrics, request_timing
+
+
+class RevokedTokens:
+    """Digests of revoked tokens, shared by every worker until the tokens expire.
+
+    The shared copy is the ``auth:revoked`` sorted set (digest scored by ``exp``); each worker
+    mirrors it in memory, loaded by :meth:`listen` and kept current through pub/sub, so checking
+    a request costs no round trip. Unlike the claims cache it is not bounded: a revocation is
+    only forgotten once its token has expired.
+    """
+
+    def __init__(self, key=CacheConstants.revoked_tokens, channel=CacheConstants.revocation_channel):
+        self.key = key
+        self.channel = channel
+        self._expires = {}  # digest -> exp
+        self._next_prune = 1024
+
+    def __len__(self):
+        return len(self._expires)
+
+    def __contains__(self, digest):
+        exp = self._expires.get(digest)
+        if exp is None:
+            return False
+        if exp <= time.time():
+            del self._expires[digest]
+            return False
+        return True
+
+    def add(self, digest, exp):
+        if exp > time.time():
+            self._expires[digest] = exp
+        if len(self._expires) >= self._next_prune:
+            now = time.time()
+            self._expires = {key: value for key, value in self._expires.items() if value > now}
+            self._next_prune = max(1024, 2 * len(self._expires))
+
+    async def revoke(self, r, digest, exp):
+        self.add(digest, exp)
+        pipe = r.pipeline(transaction=True)
+        pipe.zadd(self.key, {digest.hex(): exp})
+        pipe.zremrangebyscore(self.key, '-inf', time.time())
+        pipe.publish(self.channel, json_utils.dumps({'digest': digest.hex(), 'exp': exp}))
+        await pipe.execute()
+
+    async def load(self, r):
+        for digest, exp in await r.zrangebyscore(self.key, '({}'.format(time.time()), '+inf', withscores=True):
+            self.add(bytes.fromhex(digest.decode() if isinstance(digest, bytes) else digest), exp)
+
+    def _add_published(self, revocation):
+        self.add(bytes.fromhex(revocation['digest']), revocation['exp'])
+
+    async def listen(self, r):
+        """Load the revocations so far, then follow new ones; runs until cancelled."""
+        # Loaded once subscribed, and again after every reconnect, so no revocation in between is missed.
+        await follow_channel(r, self.channel, self._add_published, lambda resubscribed: self.load(r))
+
+
+class VerifiedTokenCache:
+    """Claims of already verified JWTs, keyed by token digest and dropped at their ``exp``.
+
+    ``revoke`` rejects a token in every worker until it expires, whether or not it is cached.
+    """
+
+    def __init__(self, max_size):
+        self.enabled = max_size > 0
+        self._claims = LRUCache(max(max_size, 1), ttl=Config.EXPIRATION_JWT)
+        self.revoked = RevokedTokens()
+        self.stats = CacheStats()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        if not self.enabled:
+            return None
+        found, claims = self._claims.get(self._digest(token))
+        if found:
+            self.stats.hits += 1
+            return claims
+        self.stats.misses += 1
+        return None
+
+    def put(self, token, claims):
+        ttl = claims.get('exp', 0) - time.time()
+        if self.enabled and ttl > 0:
+            self._claims.set(self._digest(token), claims, ttl=ttl)
+
+    def is_revoked(self, token):
+        return len(self.revoked) > 0 and self._digest(token) in self.revoked
+
+    async def revoke(self, r, token):
+        try:
+            exp = jwt.decode(token, options={'verify_signature': False}).get('exp', 0)
+        except jwt.exceptions.DecodeError:
+            return
+        digest = self._digest(token)
+        self._claims.delete(digest)
+        if exp > time.time():
+            await self.revoked.revoke(r, digest, exp)
+
+    def clear(self):
+        self._claims.clear()
+
+
+verified_tokens = VerifiedTokenCache(Config.JWT_CACHE_SIZE)
+metrics.counter_func(
+    'jwt_cache_lookups_total', 'Lookups of verified JWT claims in the local cache, by result.', ('result',),
+    lambda: {('hit',): verified_tokens.stats.hits, ('miss',): verified_tokens.stats.misses}
+)
 
 
 def check_token(request):
@@ -10,20 +126,29 @@ def check_token(request):
     if not token:
         return False, None
 
+    # Checked before the cache too: a token cached here may have been revoked by another worker.
+    if verified_tokens.is_revoked(token):
+        return False, None
+    jwt_ = verified_tokens.get(token)
+    if jwt_ is not None:
+        return True, jwt_
+
     try:
         jwt_ = jwt.decode(
             token, Config.SECRET_KEY, algorithms=["HS256"]
         )
-        return True, jwt_
     except jwt.exceptions.InvalidTokenError:
         return False, None
+    verified_tokens.put(token, jwt_)
+    return True, jwt_
 
 
 def protected(wrapped):
     def decorator(f):
         @wraps(f)
         async def decorated_function(request, *args, **kwargs):
-            is_authenticated, jwt_ = check_token(request)
+            with request_timing.phase('auth'):
+                is_authenticated, jwt_ = check_token(request)
 
             if is_authenticated:
                 kwargs['username'] = jwt_['username']
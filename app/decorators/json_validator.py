@@ -1,23 +1,39 @@
 from functools import wraps
 
-from jsonschema import ValidationError, validate
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
 from sanic.request import Request
 
 from app.hooks.error import ApiBadRequest
+from app.utils import request_timing
+
+
+def compile_jsonschema(jsonschema: dict):
+    """Check ``jsonschema`` once and return a validator for it, as ``jsonschema.validate`` would build."""
+    cls = validator_for(jsonschema)
+    cls.check_schema(jsonschema)
+    return cls(jsonschema)
+
+
+def first_error(validator, instance):
+    """Message of the most relevant error of ``instance``, or ``None`` when it is valid."""
+    error = best_match(validator.iter_errors(instance))
+    return None if error is None else error.message
 
 
 def validate_with_jsonschema(jsonschema: dict):
+    validator = compile_jsonschema(jsonschema)
+
     def decorator(fn):
         @wraps(fn)
         async def wrapper(*args, **kwargs):
-            for arg in args:
-                if isinstance(arg, Request):
-                    request: Request = arg
-
-                    try:
-                        validate(request.json, jsonschema)
-                    except ValidationError as ex:
-                        raise ApiBadRequest(ex.message)
+            # Handlers take the request first, methods of HTTPMethodView right after self.
+            request: Request = args[0] if isinstance(args[0], Request) else args[1]
+
+            with request_timing.phase('validation'):
+                error = first_error(validator, request.json)
+            if error is not None:
+                raise ApiBadRequest(error)
 
             return await fn(*args, **kwargs)
         return wrapper
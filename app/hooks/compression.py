@@ -0,0 +1,90 @@
+import asyncio
+import gzip
+
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+from app.databases.redis_cached import cache
+from app.hooks.etag import encoded_etag
+from config import Config
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def _gzip(body):
+    return gzip.compress(body, compresslevel=Config.GZIP_LEVEL)
+
+
+def _brotli(body):
+    return brotli.compress(body, quality=Config.BROTLI_QUALITY)
+
+
+ENCODERS = {'gzip': _gzip}
+if brotli is not None:
+    ENCODERS['br'] = _brotli
+
+
+def accepted_encodings(request: Request):
+    """Encodings from ``Accept-Encoding`` that we support, best ``q`` first (``br`` wins ties)."""
+    weights = {}
+    for item in request.headers.get('accept-encoding', '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    return sorted(
+        (name for name in ENCODERS if weights.get(name, weights.get('*', 0.0)) > 0),
+        key=lambda name: (-weights.get(name, weights.get('*', 0.0)), name != 'br')
+    )
+
+
+def cache_compressed(request: Request, key, ttl, stale_ttl=0):
+    """Let :func:`compress_response` keep compressed copies of this response under ``key``.
+
+    Only use it for a ``key`` whose content never changes while it lives in the cache.
+    """
+    request.ctx.compressed_cache = (key, ttl, stale_ttl)
+
+
+async def _compress(encoding, body):
+    if len(body) < Config.COMPRESS_OFFLOAD_SIZE:
+        return ENCODERS[encoding](body)
+    return await asyncio.get_running_loop().run_in_executor(None, ENCODERS[encoding], body)
+
+
+async def compress_response(request: Request, response: HTTPResponse):
+    body = getattr(response, 'body', None)
+    if (
+        not body or len(body) < Config.COMPRESS_MIN_SIZE
+        or 'content-encoding' in response.headers
+        or not response.content_type or not response.content_type.startswith(COMPRESSIBLE_TYPES)
+    ):
+        return
+    response.headers['Vary'] = 'Accept-Encoding'
+    encodings = accepted_encodings(request)
+    if not encodings:
+        return
+    encoding = encodings[0]
+
+    cached = getattr(request.ctx, 'compressed_cache', None)
+    if cached is not None:
+        key, ttl, stale_ttl = cached
+        async with request.app.ctx.redis as r:
+            response.body = await cache.get_or_set(
+                r, '{}:{}'.format(key, encoding), lambda: _compress(encoding, body), ttl=ttl, stale_ttl=stale_ttl
+            )
+    else:
+        response.body = await _compress(encoding, body)
+
+    response.headers['Content-Encoding'] = encoding
+    if 'etag' in response.headers:
+        response.headers['ETag'] = encoded_etag(response.headers['etag'], encoding)
@@ -34,8 +34,33 @@ class ApiNotFound(_ApiError):
         super().__init__(message=message, status_code=status_code, quiet=quiet)
 
 
+class ApiConflict(_ApiError):
+    def __init__(self, message, quiet=None):
+        status_code = 409
+        message = 'Conflict: ' + message
+        super().__init__(message=message, status_code=status_code, quiet=quiet)
+
+
 class ApiInternalError(_ApiError):
     def __init__(self, message, quiet=None):
         status_code = 500
         message = 'Internal Error: ' + message
         super().__init__(message=message, status_code=status_code, quiet=quiet)
+
+
+class ApiServiceUnavailable(_ApiError):
+    def __init__(self, message, retry_after=None, quiet=None):
+        status_code = 503
+        message = 'Service Unavailable: ' + message
+        super().__init__(message=message, status_code=status_code, quiet=quiet)
+        if retry_after is not None:
+            self.headers = {'Retry-After': str(retry_after)}
+
+
+class ApiTooManyRequests(_ApiError):
+    def __init__(self, message, retry_after=None, quiet=None):
+        status_code = 429
+        message = 'Too Many Requests: ' + message
+        super().__init__(message=message, status_code=status_code, quiet=quiet)
+        if retry_after is not None:
+            self.headers = {'Retry-After': str(retry_after)}
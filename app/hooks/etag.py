@@ -0,0 +1,79 @@
+from functools import wraps
+from hashlib import blake2b
+
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag derived from the values that identify one version of a resource."""
+    digest = blake2b('\x1f'.join(str(part) for part in parts).encode(), digest_size=12).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def version_etag(version) -> str:
+    """Strong ETag of a resource carrying its own ``version`` counter, readable back by :func:`if_match_versions`."""
+    return '"v{}"'.format(version)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    # A compressed representation is a different byte sequence, so it gets its own strong tag.
+    return '{}-{}"'.format(etag[:-1], encoding)
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = {tag.strip().replace('W/', '', 1) for tag in header.split(',')}
+    return etag in candidates or any(encoded_etag(etag, encoding) in candidates for encoding in ('gzip', 'br'))
+
+
+def if_match_versions(request: Request):
+    """Versions listed in ``If-Match`` as :func:`version_etag` tags, or ``None`` when any version will do.
+
+    Weak tags never match (``If-Match`` uses the strong comparison) and are left out, so the
+    result may be empty.
+    """
+    header = request.headers.get('if-match')
+    if not header or header.strip() == '*':
+        return None
+    versions = []
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('"v'):
+            # Compressed responses carry the same version with an encoding suffix.
+            version = tag[2:-1].split('-')[0]
+            if version.isdigit():
+                versions.append(int(version))
+    return versions
+
+
+def conditional(compute_etag):
+    """Answer ``304 Not Modified`` when ``If-None-Match`` matches, and tag ``200`` responses.
+
+    Compressed responses get an encoding suffix on the tag from ``compress_response``.
+
+    ``compute_etag(request, *args, **kwargs)`` is awaited before the handler with the same
+    arguments and must be cheap (no database reads). When it returns ``None`` (e.g. nothing
+    cached yet) the handler runs and ``compute_etag`` is asked again to tag its response.
+    """
+    def decorator(f):
+        @wraps(f)
+        async def decorated_function(request, *args, **kwargs):
+            etag = await compute_etag(request, *args, **kwargs)
+            if etag is not None and if_none_match(request, etag):
+                return HTTPResponse(status=304, headers={'ETag': etag})
+
+            response = await f(request, *args, **kwargs)
+            if response.status == 200 and etag is None:
+                etag = await compute_etag(request, *args, **kwargs)
+            if etag is not None and response.status == 200:
+                response.headers['ETag'] = etag
+            return response
+
+        return decorated_function
+
+    return decorator
@@ -0,0 +1,34 @@
+import time
+
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+from app.utils import logger_utils, metrics
+
+request_seconds = metrics.histogram(
+    'http_request_duration_seconds', 'Time from routing to the response headers, by route.', ('method', 'route')
+)
+responses = metrics.counter('http_responses_total', 'Responses by route and status code.', ('method', 'route', 'status'))
+metrics.counter_func(
+    'log_records_dropped_total', 'Log records dropped because the logging queue was full.', (),
+    lambda: {(): logger_utils.dropped_records()}
+)
+
+
+def _route(request: Request):
+    # The route pattern rather than the path, so /books/<book_id> is one series and not one per book.
+    route = request.route
+    return '/' + route.path if route is not None else 'unmatched'
+
+
+async def start_timer(request: Request):
+    request.ctx.started_at = time.perf_counter()
+
+
+async def record_response(request: Request, response: HTTPResponse):
+    started_at = getattr(request.ctx, 'started_at', None)
+    if started_at is None:
+        return
+    route = _route(request)
+    request_seconds.observe(time.perf_counter() - started_at, request.method, route)
+    responses.inc(request.method, route, response.status)
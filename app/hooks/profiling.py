@@ -0,0 +1,114 @@
+"""Opt-in cProfile capture and slow-request logging.
+
+A request is profiled when it carries ``X-Profile: <Config.PROFILE_TOKEN>`` or falls in the
+``Config.PROFILE_SAMPLE_RATE`` sample. The profile is written to ``Config.PROFILE_DIR`` (only the
+newest ``Config.PROFILE_KEEP`` are kept), its name is returned in ``X-Profile-Id`` and
+``/profiles`` lists and serves them. cProfile hooks the whole thread, so a profile also holds
+whatever other requests ran on the event loop meanwhile, and a worker profiles one request at a
+time: the others are not profiled while it runs.
+
+Independently, requests slower than ``Config.SLOW_REQUEST_SECONDS`` are logged with the
+breakdown of :mod:`app.utils.request_timing`.
+"""
+import asyncio
+import cProfile
+import hmac
+import os
+import random
+import re
+import time
+
+from sanic.request import Request
+from sanic.response import HTTPResponse
+
+from app.utils import request_timing
+from app.utils.logger_utils import get_logger
+from config import Config
+
+logger = get_logger('Profiling')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_NAME = re.compile(r'^[\w.-]+\.prof$')
+# A profiled request that never reached the response middleware (e.g. the client went away)
+# stops blocking the next profile after this many seconds.
+ABANDONED_AFTER = 60
+
+_profiling_since = None  # time.monotonic() the request being profiled in this worker started
+
+
+def has_profile_token(request: Request):
+    token = request.headers.get(PROFILE_HEADER)
+    return bool(Config.PROFILE_TOKEN and token) and hmac.compare_digest(token, Config.PROFILE_TOKEN)
+
+
+def _wants_profile(request: Request):
+    if Config.PROFILE_SAMPLE_RATE and random.random() < Config.PROFILE_SAMPLE_RATE:
+        return True
+    return has_profile_token(request)
+
+
+def profile_path(name):
+    if not PROFILE_NAME.match(name):
+        raise ValueError('invalid profile name')
+    return os.path.join(Config.PROFILE_DIR, name)
+
+
+def list_profiles():
+    """Stored profiles, newest first."""
+    try:
+        entries = [entry for entry in os.scandir(Config.PROFILE_DIR) if PROFILE_NAME.match(entry.name)]
+    except FileNotFoundError:
+        return []
+    entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return [{'name': entry.name, 'size': entry.stat().st_size, 'created': entry.stat().st_mtime} for entry in entries]
+
+
+def _save(profiler, name):
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(profile_path(name))
+    for stale in list_profiles()[Config.PROFILE_KEEP:]:
+        try:
+            os.remove(profile_path(stale['name']))
+        except FileNotFoundError:
+            pass
+
+
+def _format_phases(total, phases):
+    parts = ['{} {:.3f}s'.format(name, seconds) for name, seconds in sorted(phases.items(), key=lambda item: -item[1])]
+    parts.append('other {:.3f}s'.format(max(total - sum(phases.values()), 0.0)))
+    return ', '.join(parts)
+
+
+async def start_profiling(request: Request):
+    global _profiling_since
+    request.ctx.phases = request_timing.start()
+    busy = _profiling_since is not None and time.monotonic() - _profiling_since < ABANDONED_AFTER
+    if not busy and _wants_profile(request):
+        _profiling_since = time.monotonic()
+        request.ctx.profiler = cProfile.Profile()
+        request.ctx.profiler.enable()
+
+
+async def finish_profiling(request: Request, response: HTTPResponse):
+    global _profiling_since
+    profiler = getattr(request.ctx, 'profiler', None)
+    started_at = getattr(request.ctx, 'started_at', None)
+    if profiler is not None:
+        profiler.disable()
+        request.ctx.profiler = None
+        _profiling_since = None
+        elapsed_ms = (time.perf_counter() - started_at) * 1000 if started_at is not None else 0
+        name = '{}-{}-{}{}-{:.0f}ms.prof'.format(
+            time.strftime('%Y%m%dT%H%M%S'), os.getpid(), request.method,
+            re.sub(r'[^\w]+', '_', request.path), elapsed_ms
+        )
+        await asyncio.get_running_loop().run_in_executor(None, _save, profiler, name)
+        response.headers['X-Profile-Id'] = name
+
+    if started_at is not None and Config.SLOW_REQUEST_SECONDS:
+        total = time.perf_counter() - started_at
+        if total >= Config.SLOW_REQUEST_SECONDS:
+            logger.warning('slow request {} {} {} in {:.3f}s: {}'.format(
+                request.method, request.path, response.status, total,
+                _format_phases(total, getattr(request.ctx, 'phases', None) or {})
+            ))
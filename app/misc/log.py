@@ -1,12 +1,14 @@
-from termcolor import colored
+import logging
+
+from app.utils.logger_utils import get_logger
+
+LEVELS = {'WARN': logging.WARNING, 'ERROR': logging.ERROR, 'INFO': logging.INFO}
+
+logger = get_logger('App')
 
 
 def log(message: str, keyword: str = "WARN"):
-    if keyword == "WARN":
-        print(colored('[WARN]', 'yellow'), message)
-    elif keyword == "ERROR":
-        print(colored('[ERROR] ' + message, 'red'))
-    elif keyword == "INFO":
-        print(colored('[INFO]', 'blue'), message)
+    if keyword in LEVELS:
+        logger.log(LEVELS[keyword], message)
     else:
-        print(colored('[{}]'.format(keyword), 'cyan'), message)
+        logger.info(message, extra={'keyword': keyword})
@@ -11,6 +11,7 @@ class Book:
         self.owner = None
         self.created_at = int(time.time())
         self.last_updated_at = int(time.time())
+        self.version = 0
 
     def to_dict(self):
         return {
@@ -21,7 +22,8 @@ class Book:
             'description': self.description,
             'owner': self.owner,
             'createdAt': self.created_at,
-            'lastUpdatedAt': self.last_updated_at
+            'lastUpdatedAt': self.last_updated_at,
+            'version': self.version
         }
 
     def from_dict(self, json_dict: dict):
@@ -33,9 +35,12 @@ class Book:
         self.owner = json_dict.get('owner')
         self.created_at = json_dict.get('createdAt', int(time.time()))
         self.last_updated_at = json_dict.get('lastUpdatedAt', int(time.time()))
+        self.version = json_dict.get('version', 0)
         return self
 
 
+book_fields = ['_id', 'title', 'authors', 'publisher', 'description', 'owner', 'createdAt', 'lastUpdatedAt', 'version']
+
 create_book_json_schema = {
     'type': 'object',
     'properties': {
@@ -44,7 +49,9 @@ create_book_json_schema = {
         'publisher': {'type': 'string'},
         'description': {'type': 'string'},
     },
-    'required': ['title', 'authors', 'publisher']
+    'required': ['title', 'authors', 'publisher'],
+    # _id, owner, createdAt and version are the server's: createdAt is half of the GET /books cursor.
+    "additionalProperties" : False
 }
 
 update_book_json_schema = {
@@ -58,6 +65,36 @@ update_book_json_schema = {
     'required': [],
     "additionalProperties" : False
 }
+_bulk_selector_properties = {
+    'ids': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 1, 'maxItems': 1000},
+    'owner': {'type': 'string'},
+}
+
+bulk_update_books_json_schema = {
+    'type': 'object',
+    'properties': {
+        **_bulk_selector_properties,
+        'update': {**update_book_json_schema, 'minProperties': 1},
+    },
+    'required': ['update'],
+    'oneOf': [{'required': ['ids']}, {'required': ['owner']}],
+    "additionalProperties" : False
+}
+
+bulk_delete_books_json_schema = {
+    'type': 'object',
+    'properties': _bulk_selector_properties,
+    'oneOf': [{'required': ['ids']}, {'required': ['owner']}],
+    "additionalProperties" : False
+}
+batch_books_json_schema = {
+    'type': 'object',
+    'properties': {
+        'ids': {'type': 'array', 'items': {'type': 'string'}, 'minItems': 1, 'maxItems': 1000},
+    },
+    'required': ['ids'],
+    "additionalProperties" : False
+}
 class PostBook:
     title = doc.String(description= "Title", required= True)
     authors = doc.List(description= "Authors",required=True)
@@ -71,6 +108,15 @@ class PostUpdateBook:
     description = doc.String(description="Description", required=False)
 
 
+class PostBulkDeleteBooks:
+    ids = doc.List(doc.String(), description="Ids of the books, or", required=False)
+    owner = doc.String(description="Owner of the books, must be you", required=False)
+
+class PostBulkUpdateBooks(PostBulkDeleteBooks):
+    update = doc.Object(PostUpdateBook, description="Fields to set on every book", required=True)
+
+class PostBatchBooks:
+    ids = doc.List(doc.String(), description="Ids of the books", required=True)
 
 
 class PostLogin:
@@ -0,0 +1,19 @@
+import base64
+import json
+
+
+def encode_cursor(created_at, book_id):
+    raw = json.dumps([created_at, book_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(created_at, book_id)`` from an ``after`` cursor, or raise ``ValueError``."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, book_id = json.loads(raw)
+    except (ValueError, TypeError) as ex:
+        raise ValueError('invalid cursor') from ex
+    if not isinstance(created_at, int) or not isinstance(book_id, str):
+        raise ValueError('invalid cursor')
+    return created_at, book_id
@@ -0,0 +1,137 @@
+"""JSON encoding shared by the caches and the JSON responses.
+
+``dumps`` always returns compact UTF-8 ``bytes``. The backend is ``Config.JSON_BACKEND`` when
+set, otherwise the fastest one installed; call sites use ``json_utils.dumps`` so that
+:func:`use_backend` takes effect everywhere.
+"""
+import codecs
+import json
+
+from config import Config
+
+
+def _orjson():
+    import orjson
+    return orjson.dumps, orjson.loads
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode()
+
+    return dumps, ujson.loads
+
+
+def _stdlib():
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+    return dumps, json.loads
+
+
+BACKENDS = {'orjson': _orjson, 'ujson': _ujson, 'json': _stdlib}
+
+backend = None
+dumps = None
+loads = None
+
+
+def use_backend(name=None):
+    """Switch to backend ``name``, or to the first installed one of orjson, ujson, json."""
+    global backend, dumps, loads
+    for candidate in [name] if name else list(BACKENDS):
+        try:
+            dumps, loads = BACKENDS[candidate]()
+        except ImportError:
+            continue
+        backend = candidate
+        return backend
+    raise ImportError('JSON backend {} is not installed'.format(name))
+
+
+use_backend(Config.JSON_BACKEND)
+
+
+async def iter_ndjson(chunks, max_item_size=1 << 20):
+    """Yield ``(item, error)`` for every non-blank line of an NDJSON body arriving in ``chunks``.
+
+    ``error`` is a message when the line is not valid JSON; only one line is buffered at a time
+    and a line longer than ``max_item_size`` bytes raises ``ValueError``.
+    """
+    buffer = b''
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+        if len(buffer) > max_item_size:
+            raise ValueError('line longer than {} bytes'.format(max_item_size))
+        for line in lines:
+            if line.strip():
+                yield _parse_line(line)
+    if buffer.strip():
+        yield _parse_line(buffer)
+
+
+def _parse_line(line):
+    try:
+        return loads(line), None
+    except ValueError as ex:
+        return None, 'invalid JSON: {}'.format(ex)
+
+
+async def iter_json_array(chunks, max_item_size=1 << 20):
+    """Yield the items of a JSON array body arriving in ``chunks`` as soon as each one is complete.
+
+    Raises ``ValueError`` when the body is not a well-formed array or an item is longer than
+    ``max_item_size`` characters; items before the error have already been yielded.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    text = ''
+    expect = '['
+    eof = False
+    chunks = chunks.__aiter__()
+    while True:
+        text = text.lstrip()
+        if not text:
+            if eof:
+                raise ValueError('unexpected end of array' if expect != '[' else 'expected a JSON array')
+            try:
+                text = utf8.decode(await chunks.__anext__())
+            except StopAsyncIteration:
+                text = utf8.decode(b'', final=True)
+                eof = True
+            continue
+
+        if expect == '[':
+            if text[0] != '[':
+                raise ValueError('expected a JSON array')
+            text, expect = text[1:], 'first'
+        elif expect == ',' or (expect == 'first' and text[0] == ']'):
+            if text[0] == ']':
+                if text[1:].strip():
+                    raise ValueError('unexpected data after the array')
+                return
+            if text[0] != ',':
+                raise ValueError('expected , or ] after an item')
+            text, expect = text[1:], 'item'
+        else:
+            try:
+                item, end = decoder.raw_decode(text)
+            except json.JSONDecodeError as ex:
+                item, end = ex, None
+            # Without anything after it a number may still continue in the next chunk.
+            if end is None or (end == len(text) and not eof):
+                if eof:
+                    raise ValueError('invalid JSON: {}'.format(item))
+                if len(text) > max_item_size:
+                    raise ValueError('item longer than {} characters'.format(max_item_size))
+                try:
+                    text += utf8.decode(await chunks.__anext__())
+                except StopAsyncIteration:
+                    text += utf8.decode(b'', final=True)
+                    eof = True
+                continue
+            yield item
+            text, expect = text[end:], ','
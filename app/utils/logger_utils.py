@@ -1,10 +1,126 @@
+"""Logging through a queue: callers only enqueue a record, one thread per process writes it.
+
+Records go to a bounded queue through :class:`DroppingQueueHandler`, which drops and counts them
+when the queue is full rather than blocking the event loop, and a ``QueueListener`` thread writes
+them to stderr as JSON lines. Fields passed with ``extra=`` become fields of the line. Debug records
+are kept at ``Config.LOG_DEBUG_SAMPLE_RATE`` and carry the ``sample_rate`` they were kept at.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from app.utils import json_utils
+from config import Config
 
 FORMATTER = logging.Formatter(fmt='[%(asctime)s] [%(levelname)s] [%(name)s] - %(message)s',
                               datefmt='%m-%d-%Y %H:%M:%S %Z')
 LOG_FILE = 'logging.log'
 
+# Attributes of every LogRecord; any other attribute came from ``extra`` and is written as a field.
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._second_text = None
+
+    def _format_time(self, created):
+        # Formatting the date is most of the cost of a line: do it once per second.
+        second = int(created)
+        if second != self._second:
+            self._second_text = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(second))
+            self._second = second
+        return '{}.{:03d}Z'.format(self._second_text, int((created - second) * 1000))
+
+    def format(self, record):
+        entry = {
+            'time': self._format_time(record.created),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        try:
+            return json_utils.dumps(entry).decode()
+        except TypeError:  # an ``extra`` value the backend cannot encode
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Keep a ``rate`` fraction of the debug records, every record above debug."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            record.sample_rate = self.rate
+            return True
+        return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """``QueueHandler`` that drops records when the queue is full instead of waiting for room."""
+
+    def __init__(self, queue_):
+        super().__init__(queue_)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare, keep the traceback out of the message so it stays a field, and
+        # update the record in place rather than copy it: what later handlers see formats the same.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full when stopping: wait for room rather than fail.
+        self.queue.put(self._sentinel)
+
+
+def make_queue_handler(queue_size=None, debug_sample_rate=None):
+    handler = DroppingQueueHandler(queue.Queue(queue_size or Config.LOG_QUEUE_SIZE))
+    handler.addFilter(DebugSampler(Config.LOG_DEBUG_SAMPLE_RATE if debug_sample_rate is None else debug_sample_rate))
+    return handler
+
+
+def make_listener(queue_, stream=None):
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    return _Listener(queue_, output)
+
 
 def get_console_handler():
     console_handler = logging.StreamHandler()
@@ -18,9 +134,71 @@ def get_file_handler():
     return file_handler
 
 
+_setup_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def _start_listener():
+    global _listener
+    _listener = make_listener(_queue_handler.queue)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _after_fork_in_child():
+    # The listener thread does not survive a fork and the queue may hold the parent's records.
+    _queue_handler.queue = queue.Queue(_queue_handler.queue.maxsize)
+    _queue_handler.dropped = 0
+    _queue_handler._dropped_lock = threading.Lock()
+    _start_listener()
+
+
+def get_queue_handler():
+    """This process's queue handler, with its listener started on first use."""
+    global _queue_handler
+    with _setup_lock:
+        if _queue_handler is None:
+            _queue_handler = make_queue_handler()
+            _start_listener()
+            atexit.register(_stop_listener)
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+    return _queue_handler
+
+
+def dropped_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def flush():
+    """Wait until the listener has written every record queued so far."""
+    if _queue_handler is not None:
+        _queue_handler.queue.join()
+
+
+def sanic_log_config():
+    """``log_config`` for ``Sanic()`` sending its own loggers, the access log included, through the queue."""
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {'queue': {'()': get_queue_handler}},
+        'loggers': {
+            name: {'level': 'INFO', 'handlers': ['queue'], 'propagate': False}
+            for name in ('sanic.root', 'sanic.error', 'sanic.access')
+        },
+    }
+
+
 def get_logger(logger_name):
+    """``logging.getLogger(logger_name)`` writing through the queue; calling it again adds nothing."""
     logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.DEBUG)
-    logger.addHandler(get_console_handler())
-    # logger.addHandler(get_file_handler())
+    handler = get_queue_handler()
+    if handler not in logger.handlers:
+        logger.setLevel(Config.LOG_LEVEL)
+        logger.addHandler(handler)
+        logger.propagate = False
     return logger
@@ -0,0 +1,203 @@
+"""Prometheus metrics, added up across every worker.
+
+On the hot path a worker only counts into plain dicts: no lock, no I/O. Every
+``Config.METRICS_FLUSH_INTERVAL`` seconds, and whenever ``/metrics`` is read, it adds what it
+counted since the previous flush to one Redis hash with ``HINCRBYFLOAT``, and ``/metrics`` renders
+that hash. Totals therefore cover all workers, survive worker restarts, and lag by at most one
+flush interval for the other workers. Counts drained by a flush that then fails are lost.
+"""
+import asyncio
+import math
+from bisect import bisect_left
+
+from app.constants.cache_constants import CacheConstants
+from app.utils import json_utils
+from app.utils.logger_utils import get_logger
+
+logger = get_logger('Metrics')
+
+# Seconds, the Prometheus client defaults.
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+
+    def drain(self):
+        """Yield ``(labels, field, delta)`` for everything counted since the last call, and forget it."""
+        raise NotImplementedError
+
+    def samples(self, values):
+        """Yield ``(suffix, labels, extra label, value)`` from the flushed ``{labels: {field: value}}``."""
+        for labels, fields in sorted(values.items()):
+            yield '', labels, None, fields.get('', 0.0)
+
+    def render(self, values):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n')),
+            '# TYPE {} {}'.format(self.name, self.kind)
+        ]
+        for suffix, labels, extra, value in self.samples(values):
+            lines.append('{}{}{} {}'.format(
+                self.name, suffix, _format_labels(self.labels, labels, extra), _format_value(value)
+            ))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def drain(self):
+        values, self._values = self._values, {}
+        for labels, value in values.items():
+            yield labels, '', value
+
+
+class CounterFunc(_Metric):
+    """Counter read from ``fn() -> {labels: running total}`` at flush time, for counts kept elsewhere anyway."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels, fn):
+        super().__init__(name, documentation, labels)
+        self._fn = fn
+        self._flushed = {}
+
+    def drain(self):
+        for labels, value in self._fn().items():
+            flushed = self._flushed.get(labels, 0)
+            # A total that went down was reset, everything in it is new.
+            delta = value - flushed if value >= flushed else value
+            self._flushed[labels] = value
+            if delta:
+                yield labels, '', delta
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        # Per labels: one count per bucket, then +Inf, then the sum of the values.
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def drain(self):
+        values, self._values = self._values, {}
+        bounds = [_format_value(bound) for bound in self.buckets] + ['+Inf']
+        for labels, counts in values.items():
+            for bound, count in zip(bounds, counts):
+                if count:
+                    yield labels, bound, count
+            yield labels, 'sum', counts[-1]
+
+    def samples(self, values):
+        # Buckets are flushed as counts of values up to each bound; Prometheus wants running totals.
+        for labels, fields in sorted(values.items()):
+            counts = sorted((float(field), count) for field, count in fields.items() if field != 'sum')
+            total, i = 0, 0
+            for bound in self.buckets + (math.inf,):
+                while i < len(counts) and counts[i][0] <= bound:
+                    total += counts[i][1]
+                    i += 1
+                yield '_bucket', labels, ('le', _format_value(bound)), total
+            yield '_sum', labels, None, fields.get('sum', 0.0)
+            yield '_count', labels, None, total
+
+
+class Registry:
+    def __init__(self, key=CacheConstants.metrics):
+        self.key = key
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError('metric {} is already registered'.format(metric.name))
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def counter_func(self, name, documentation, labels, fn):
+        return self._register(CounterFunc(name, documentation, labels, fn))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    async def flush(self, r):
+        """Add what this worker counted since the last flush to the shared hash."""
+        pipe = r.pipeline(transaction=True)
+        n_fields = 0
+        for metric in self.metrics.values():
+            for labels, field, delta in metric.drain():
+                pipe.hincrbyfloat(self.key, json_utils.dumps([metric.name, list(labels), field]), delta)
+                n_fields += 1
+        if n_fields:
+            await pipe.execute()
+        return n_fields
+
+    async def flush_periodically(self, r, interval):
+        """Flush every ``interval`` seconds; runs until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(r)
+            except asyncio.CancelledError:
+                raise
+            except Exception as ex:
+                logger.warning('could not flush metrics: {}'.format(ex))
+
+    async def render(self, r):
+        """Every worker's metrics in the Prometheus text format, after flushing this worker's."""
+        await self.flush(r)
+        values = {}
+        for field, value in (await r.hgetall(self.key)).items():
+            name, labels, key = json_utils.loads(field)
+            values.setdefault(name, {}).setdefault(tuple(labels), {})[key] = float(value)
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render(values.get(metric.name, {})))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Forget what was counted and not flushed yet."""
+        for metric in self.metrics.values():
+            list(metric.drain())
+
+
+registry = Registry()
+counter = registry.counter
+counter_func = registry.counter_func
+histogram = registry.histogram
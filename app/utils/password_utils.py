@@ -0,0 +1,99 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import Config
+from app.hooks.error import ApiServiceUnavailable
+from app.utils import metrics
+from app.utils.logger_utils import get_logger
+
+logger = get_logger('PasswordHasher')
+
+SCHEME = 'scrypt'
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode()
+
+
+def hash_password(password, n=None, r=8, p=1):
+    """Salted scrypt hash encoded as ``scrypt$n$r$p$salt$hash``; ``n`` is the work factor."""
+    n = n or Config.PASSWORD_SCRYPT_N
+    salt = os.urandom(16)
+    derived = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32)
+    return '$'.join([SCHEME, str(n), str(r), str(p), _b64(salt), _b64(derived)])
+
+
+def is_password_hash(value):
+    return isinstance(value, str) and value.startswith(SCHEME + '$')
+
+
+def verify_password(password, encoded):
+    if not is_password_hash(encoded):
+        # Accounts registered before hashing was introduced; login re-hashes them.
+        return hmac.compare_digest(str(encoded).encode(), password.encode())
+    _, n, r, p, salt, expected = encoded.split('$')
+    n, r, p = int(n), int(r), int(p)
+    derived = hashlib.scrypt(
+        password.encode(), salt=base64.b64decode(salt), n=n, r=r, p=p, maxmem=256 * n * r + 2 ** 20, dklen=32
+    )
+    return hmac.compare_digest(derived, base64.b64decode(expected))
+
+
+def _make_executor(workers):
+    if multiprocessing.current_process().daemon:
+        # Sanic runs multiple workers as daemonic processes, which may not start children.
+        # hashlib.scrypt releases the GIL, so threads still keep the event loop free.
+        logger.info('daemonic worker: hashing passwords in {} threads'.format(workers))
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+class PasswordHasher:
+    """Runs hashing in a process pool so the event loop and the GIL stay free for other requests.
+
+    In a daemonic process (a Sanic worker when there are several) it uses a thread pool instead.
+    At most ``max_pending`` jobs may be queued or running; beyond that callers get a 503 with
+    ``Retry-After`` instead of piling up behind a saturated pool.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or Config.PASSWORD_HASH_WORKERS
+        self.max_pending = max_pending or Config.PASSWORD_HASH_MAX_PENDING
+        self.pending = 0
+        self.rejected = 0
+        self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ApiServiceUnavailable('too many logins in progress, try again shortly', retry_after=1)
+        if self._executor is None:
+            self._executor = _make_executor(self.workers)
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password):
+        return await self._run(hash_password, password, Config.PASSWORD_SCRYPT_N)
+
+    async def verify(self, password, encoded):
+        return await self._run(verify_password, password, encoded)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+metrics.counter_func(
+    'password_hash_rejected_total', 'Password hashes and checks refused with a 503 because too many were pending.', (),
+    lambda: {(): password_hasher.rejected}
+)
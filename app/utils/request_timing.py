@@ -0,0 +1,48 @@
+"""Where the time of the current request goes, by phase (auth, validation, cache, db, serialize).
+
+:func:`start` gives the request a fresh breakdown in a context variable; Sanic runs the
+middleware and the handler of a request in one task, so code anywhere below the handler can
+:func:`add` to it without the request being passed down. Outside a request nothing is recorded.
+Phases that overlap (e.g. queries run with ``asyncio.gather``) are counted once per call.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from app.utils import json_utils
+
+_phases = contextvars.ContextVar('request_phases', default=None)
+
+
+def start():
+    phases = {}
+    _phases.set(phases)
+    return phases
+
+
+def get():
+    return _phases.get()
+
+
+def add(name, seconds):
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - started_at)
+
+
+def dumps(obj, **kwargs):
+    """``json_utils.dumps`` counted as the serialize phase, for Sanic's ``json()`` responses."""
+    started_at = time.perf_counter()
+    try:
+        return json_utils.dumps(obj)
+    finally:
+        add('serialize', time.perf_counter() - started_at)
@@ -0,0 +1,63 @@
+"""Concurrency benchmark: blocking MongoDB calls vs AsyncMongoDB on the event loop.
+
+Runs N concurrent "requests" that each do one query against an in-memory collection
+with simulated round-trip latency, while a ticker coroutine measures how late the
+event loop wakes it up. Blocking calls serialize the requests and starve the ticker;
+the executor-backed layer overlaps them and keeps the loop responsive.
+
+    $ python -m benchmarks.async_mongodb_bench
+"""
+import asyncio
+import time
+
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.models.book import Book
+from tests.fakes import FakeMongoClient
+
+LATENCY = 0.01
+CONCURRENCY = (1, 8, 32, 64)
+
+
+async def _measure(call, concurrency):
+    max_lag = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal max_lag
+        while running:
+            expected = time.perf_counter() + 0.001
+            await asyncio.sleep(0.001)
+            max_lag = max(max_lag, time.perf_counter() - expected)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*[call() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    running = False
+    await task
+    return elapsed, max_lag
+
+
+async def main():
+    mongodb = MongoDB(client=FakeMongoClient(latency=LATENCY))
+    for i in range(100):
+        mongodb.add_book(Book(str(i)).from_dict({'title': 'Book {}'.format(i)}))
+    async_db = AsyncMongoDB(mongodb, max_workers=32)
+
+    async def blocking():
+        return mongodb.get_books()
+
+    print('{:>11} | {:>10} | {:>12} | {:>10} | {:>12}'.format(
+        'concurrency', 'sync total', 'sync max lag', 'async total', 'async max lag'))
+    for concurrency in CONCURRENCY:
+        sync_total, sync_lag = await _measure(blocking, concurrency)
+        async_total, async_lag = await _measure(async_db.get_books, concurrency)
+        print('{:>11} | {:>8.1f}ms | {:>10.1f}ms | {:>9.1f}ms | {:>11.1f}ms'.format(
+            concurrency, sync_total * 1e3, sync_lag * 1e3, async_total * 1e3, async_lag * 1e3))
+
+    async_db.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
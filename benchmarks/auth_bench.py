@@ -0,0 +1,49 @@
+"""Benchmark: @protected handler throughput with the verified-JWT cache on and off.
+
+Calls a protected no-op handler directly (no HTTP server) with a pool of reused tokens,
+the way clients keep one token for ``Config.EXPIRATION_JWT`` seconds.
+
+    $ python -m benchmarks.auth_bench
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+from app.decorators import auth
+from app.decorators.auth import VerifiedTokenCache, protected
+from app.utils import jwt_utils
+
+N_REQUESTS = 20000
+N_USERS = (1, 100, 1000)
+
+
+@protected
+async def handler(request, username=None):
+    return username
+
+
+async def _throughput(requests):
+    start = time.perf_counter()
+    for request in requests:
+        await handler(request)
+    return len(requests) / (time.perf_counter() - start)
+
+
+def main():
+    print('{:>6} | {:>13} | {:>12} | {:>7} | {:>9}'.format('users', 'cache off', 'cache on', 'speedup', 'hit ratio'))
+    for n_users in N_USERS:
+        tokens = [jwt_utils.generate_jwt('user{}'.format(i)) for i in range(n_users)]
+        requests = [SimpleNamespace(token=tokens[i % n_users]) for i in range(N_REQUESTS)]
+
+        with mock.patch.object(auth, 'verified_tokens', VerifiedTokenCache(0)):
+            off = asyncio.run(_throughput(requests))
+        cache = VerifiedTokenCache(10000)
+        with mock.patch.object(auth, 'verified_tokens', cache):
+            on = asyncio.run(_throughput(requests))
+        print('{:>6} | {:>9.0f} r/s | {:>8.0f} r/s | {:>6.1f}x | {:>8.1%}'.format(
+            n_users, off, on, on / off, cache.stats.to_dict()['hit_ratio']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Benchmark: CPU spent compressing JSON responses vs bytes saved, per payload size.
+
+Payloads are GET /books pages encoded with json_utils; brotli rows only appear when the
+optional ``brotli`` package is installed.
+
+    $ python -m benchmarks.compression_bench
+"""
+import timeit
+
+from app.hooks import compression
+from app.utils import json_utils
+from benchmarks.response_cache_bench import make_page
+
+N_BOOKS = (1, 4, 16, 256, 4096, 40000)
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 5, 11)}
+
+
+def _encoder(encoding, level):
+    if encoding == 'gzip':
+        return lambda body: compression.gzip.compress(body, compresslevel=level)
+    return lambda body: compression.brotli.compress(body, quality=level)
+
+
+def main():
+    print('{:>7} | {:>9} | {:>10} | {:>9} | {:>9} | {:>8}'.format(
+        'body', 'encoding', 'time', 'out', 'saved', 'MB/s'))
+    for n_books in N_BOOKS:
+        body = json_utils.dumps(make_page(n_books))
+        for encoding in compression.ENCODERS:
+            for level in LEVELS[encoding]:
+                compress = _encoder(encoding, level)
+                number = max(1, 200000 // len(body))
+                seconds = min(timeit.repeat(lambda: compress(body), number=number, repeat=3)) / number
+                size = len(compress(body))
+                print('{:>6.1f}K | {:>9} | {:>8.3f}ms | {:>8.1f}K | {:>8.0f}% | {:>8.0f}'.format(
+                    len(body) / 1024, '{}-{}'.format(encoding, level), seconds * 1e3, size / 1024,
+                    100 * (1 - size / len(body)), len(body) / seconds / 2 ** 20))
+    print()
+    print('bodies under Config.COMPRESS_MIN_SIZE are sent as they are; cached pages are compressed once per version')
+
+
+if __name__ == '__main__':
+    main()
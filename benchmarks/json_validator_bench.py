@@ -0,0 +1,47 @@
+"""Benchmark: jsonschema.validate per request vs the validator compiled by validate_with_jsonschema.
+
+    $ python -m benchmarks.json_validator_bench
+"""
+import timeit
+
+from jsonschema import ValidationError, validate
+from jsonschema.exceptions import best_match
+
+from app.decorators.json_validator import compile_jsonschema
+from app.models.book import create_book_json_schema, login_json_schema, update_book_json_schema
+
+CASES = [
+    ('create_book', create_book_json_schema, {
+        'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton', 'description': 'Spice.'
+    }),
+    ('create_book invalid', create_book_json_schema, {'title': 'Dune', 'authors': 'Frank Herbert'}),
+    ('update_book', update_book_json_schema, {'title': 'Dune Messiah'}),
+    ('login', login_json_schema, {'username': 'alice', 'password': 'secret'}),
+]
+NUMBER = 5000
+
+
+def _per_call(fn):
+    return min(timeit.repeat(fn, number=NUMBER, repeat=3)) / NUMBER * 1e6
+
+
+def main():
+    print('{:>20} | {:>17} | {:>13} | {:>7}'.format('schema', 'validate() per call', 'compiled', 'speedup'))
+    for name, schema, body in CASES:
+        validator = compile_jsonschema(schema)
+
+        def old():
+            try:
+                validate(body, schema)
+            except ValidationError:
+                pass
+
+        def new():
+            best_match(validator.iter_errors(body))
+
+        old_us, new_us = _per_call(old), _per_call(new)
+        print('{:>20} | {:>17.1f}us | {:>11.1f}us | {:>6.1f}x'.format(name, old_us, new_us, old_us / new_us))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Benchmark: request throughput with heavy logging, direct StreamHandler vs the queued JSON pipeline.
+
+Each simulated request waits ``IO_WAIT`` seconds (its database call) and logs
+``LINES_PER_REQUEST`` lines; requests run ``CONCURRENCY`` at a time on one event loop. The sink is either ``/dev/null`` or a stream whose
+writes block for ``SLOW_WRITE`` seconds, like a stdout pipe that a log shipper drains slowly.
+Event loop lag is sampled meanwhile.
+
+    $ python -m benchmarks.logging_bench
+"""
+import asyncio
+import logging
+import os
+import time
+
+from app.utils.logger_utils import FORMATTER, make_listener, make_queue_handler
+
+N_REQUESTS = 5000
+CONCURRENCY = 50
+LINES_PER_REQUEST = 10
+IO_WAIT = 0.001
+SLOW_WRITE = 0.0001
+QUEUE_SIZE = 10000
+
+
+class SlowStream:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+async def _request(logger, i):
+    await asyncio.sleep(IO_WAIT)
+    for line in range(LINES_PER_REQUEST):
+        logger.info('request %s step %s', i, line, extra={'book_id': 'book-{}'.format(i)})
+
+
+async def _probe(lags, interval=0.005):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - expected, 0) * 1000)
+
+
+async def _run(logger):
+    lags = []
+    probe = asyncio.ensure_future(_probe(lags))
+    start = time.perf_counter()
+    for batch in range(0, N_REQUESTS, CONCURRENCY):
+        await asyncio.gather(*[_request(logger, i) for i in range(batch, batch + CONCURRENCY)])
+    elapsed = time.perf_counter() - start
+    probe.cancel()
+    return N_REQUESTS / elapsed, max(lags or [0.0])
+
+
+def _logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    return logger
+
+
+def main():
+    print('{:>10} | {:>9} | {:>11} | {:>12} | {:>8}'.format('sink', 'pipeline', 'requests/s', 'max loop lag', 'dropped'))
+    for sink_name in ('/dev/null', 'slow pipe'):
+        devnull = open(os.devnull, 'w')
+        stream = devnull if sink_name == '/dev/null' else SlowStream(SLOW_WRITE)
+
+        direct = logging.StreamHandler(stream)
+        direct.setFormatter(FORMATTER)
+        rate, lag = asyncio.run(_run(_logger('bench.direct', direct)))
+        print('{:>10} | {:>9} | {:>11.0f} | {:>10.1f}ms | {:>8}'.format(sink_name, 'direct', rate, lag, '-'))
+
+        handler = make_queue_handler(QUEUE_SIZE, debug_sample_rate=1.0)
+        listener = make_listener(handler.queue, stream)
+        listener.start()
+        rate, lag = asyncio.run(_run(_logger('bench.queued', handler)))
+        listener.stop()
+        print('{:>10} | {:>9} | {:>11.0f} | {:>10.1f}ms | {:>8}'.format(sink_name, 'queued', rate, lag, handler.dropped))
+        devnull.close()
+
+
+if __name__ == '__main__':
+    main()
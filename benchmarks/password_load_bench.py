@@ -0,0 +1,102 @@
+"""Load test: latency of a non-auth route during a burst of logins.
+
+Drives the books blueprint in-process through the ASGI test client. GET /books/<book_id>
+is probed every few milliseconds while ``N_LOGINS`` logins run concurrently, first with
+scrypt verification inline on the event loop, then through the process pool.
+
+    $ python -m benchmarks.password_load_bench
+"""
+import asyncio
+import json
+import logging
+import os
+import statistics
+import time
+import warnings
+from unittest import mock
+
+from app.apis import books_blueprint
+from app.models.book import Book
+from app.utils import password_utils
+from tests.fakes import create_test_app
+
+N_LOGINS = 32
+PROBE_INTERVAL = 0.005
+
+
+class InlineHasher:
+    async def hash(self, password):
+        return password_utils.hash_password(password)
+
+    async def verify(self, password, encoded):
+        return password_utils.verify_password(password, encoded)
+
+    def close(self):
+        pass
+
+
+async def _run(app, hasher, n_logins=N_LOGINS):
+    with mock.patch.object(books_blueprint, 'password_hasher', hasher):
+        body = json.dumps({'username': 'alice', 'password': 'secret'})
+        await app.asgi_client.get('/books/book-1')
+
+        latencies = []
+        done = False
+
+        async def probe():
+            while not done:
+                start = time.perf_counter()
+                await app.asgi_client.get('/books/book-1')
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(PROBE_INTERVAL)
+
+        prober = asyncio.create_task(probe())
+        start = time.perf_counter()
+        results = await asyncio.gather(*[app.asgi_client.post('/books/login', data=body) for _ in range(n_logins)])
+        if not n_logins:
+            await asyncio.sleep(0.5)
+        burst = time.perf_counter() - start
+        done = True
+        await prober
+
+    statuses = [response.status for _, response in results]
+    latencies.sort()
+    return {
+        'burst': burst,
+        'ok': statuses.count(200),
+        'shed': statuses.count(503),
+        'probes': len(latencies),
+        'p50': statistics.median(latencies),
+        'p99': latencies[int(len(latencies) * 0.99) - 1] if len(latencies) > 1 else latencies[-1],
+        'max': latencies[-1],
+    }
+
+
+def main():
+    warnings.simplefilter('ignore')
+    logging.disable(logging.INFO)
+    app, db, _ = create_test_app()
+    # Measure the hashing alone: no rate limit, no queue in front of the logins.
+    admission = books_blueprint.admission
+    mock.patch.dict(admission.config, {'rate': 1e9, 'burst': 1e9}).start()
+    mock.patch.object(admission.limiters['login'], 'limit', N_LOGINS).start()
+    db.mongodb._books_col.insert_one(Book('book-1').from_dict({'title': 'Dune'}).to_dict())
+    db.mongodb._users_col.insert_one({'username': 'alice', 'password': password_utils.hash_password('secret')})
+
+    print('{} concurrent logins, scrypt n={}, {} CPUs'.format(
+        N_LOGINS, password_utils.Config.PASSWORD_SCRYPT_N, os.cpu_count()))
+    print('{:>8} | {:>9} | {:>7} | {:>6} | {:>11} | {:>11} | {:>11}'.format(
+        'hashing', 'burst', 'ok/shed', 'probes', 'probe p50', 'probe p99', 'probe max'))
+    pooled = password_utils.PasswordHasher()
+    asyncio.run(pooled.hash('start the worker processes'))
+    for name, hasher, n_logins in (('idle', pooled, 0), ('inline', InlineHasher(), N_LOGINS), ('pool', pooled, N_LOGINS)):
+        stats = asyncio.run(_run(app, hasher, n_logins))
+        print('{:>8} | {:>7.0f}ms | {:>3}/{:<3} | {:>6} | {:>9.1f}ms | {:>9.1f}ms | {:>9.1f}ms'.format(
+            name, stats['burst'] * 1e3, stats['ok'], stats['shed'], stats['probes'],
+            stats['p50'] * 1e3, stats['p99'] * 1e3, stats['max'] * 1e3))
+    pooled.close()
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Micro-benchmark: serving a cached GET /books page, decoded vs pre-serialized.
+
+The old path loads the cached JSON and encodes it again for the response; the new one
+hands the cached bytes to the response as they are. Encoding cost is shown for every
+installed JSON backend.
+
+    $ python -m benchmarks.response_cache_bench
+"""
+import gzip
+import json
+import timeit
+
+from app.databases.redis_cached import _decode, _encode
+from app.models.book import Book
+from app.utils import json_utils
+
+SIZES = (1000, 10000, 100000)
+
+
+def make_page(n_books):
+    books = [
+        Book('book-{:06d}'.format(i)).from_dict({
+            'title': 'Title {}'.format(i),
+            'authors': ['Author {}'.format(i % 97), 'Author {}'.format(i % 13)],
+            'publisher': 'Publisher {}'.format(i % 11),
+            'description': 'A description of book {} that is a little longer than the title.'.format(i),
+            'owner': 'user{}'.format(i % 50),
+            'createdAt': 1600000000 + i,
+            'lastUpdatedAt': 1600000000 + i
+        }).to_dict()
+        for i in range(n_books)
+    ]
+    return {'n_books': n_books, 'books': books, 'next': None}
+
+
+def _best(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e3
+
+
+def main():
+    backends = [name for name in json_utils.BACKENDS if _available(name)]
+    print('{:>7} | {:>9} | {:>16} | {:>15} | {:>12} | {:>9}'.format(
+        'books', 'body', 'old: loads+dumps', 'new: raw bytes', 'gzip (once)', 'gzip body'))
+    for n_books in SIZES:
+        page = make_page(n_books)
+        stored_old = json.dumps(page).encode()
+        stored_new = _encode(json_utils.dumps(page))
+        number = max(1, 2000 // n_books)
+
+        old = _best(lambda: json.dumps(json.loads(stored_old)), number)
+        new = _best(lambda: _decode(stored_new), number)
+        body = _decode(stored_new)
+        compress = _best(lambda: gzip.compress(body), 1)
+        print('{:>7} | {:>7.0f}KB | {:>14.2f}ms | {:>13.3f}ms | {:>10.2f}ms | {:>7.0f}KB'.format(
+            n_books, len(body) / 1024, old, new, compress, len(gzip.compress(body)) / 1024))
+
+    print()
+    print('encode one page ({} books) per backend:'.format(SIZES[1]))
+    page = make_page(SIZES[1])
+    for name in backends:
+        dumps, _ = json_utils.BACKENDS[name]()
+        print('  {:>7}: {:.2f}ms'.format(name, _best(lambda: dumps(page), 5)))
+
+
+def _available(name):
+    try:
+        json_utils.BACKENDS[name]()
+        return True
+    except ImportError:
+        return False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""Benchmark: GET /books/search's BM25 index over 100k books vs filtering every book per query.
+
+Reports build time, index memory, query latency for rare, common and multi-word queries, the
+cost of the incremental updates the write handlers make, and how long a compaction holds the
+event loop now that it runs in a thread.
+
+    $ python -m benchmarks.search_bench
+"""
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+from app.databases.books_search import BooksSearch, InvertedIndex, tokenize
+from tests.fakes import FakeRedis
+
+N_BOOKS = 100000
+VOCABULARY = 20000
+QUERIES = {
+    'rare word': 'w19000',
+    'common word': 'w3',
+    'three words': 'w3 w150 w2000',
+    'author': 'author17',
+}
+REPEAT = 20
+
+
+def make_books(n, seed=0):
+    rng = random.Random(seed)
+    # Word popularity follows a power law, as it does in real titles and descriptions.
+    weights = [1 / (rank + 1) for rank in range(VOCABULARY)]
+    words = ['w{}'.format(rank) for rank in range(VOCABULARY)]
+    books = []
+    for i in range(n):
+        books.append({
+            '_id': 'book-{:06d}'.format(i),
+            'title': ' '.join(rng.choices(words, weights, k=rng.randint(2, 6))),
+            'authors': ['author{}'.format(rng.randrange(5000))],
+            'description': ' '.join(rng.choices(words, weights, k=rng.randint(10, 40))),
+        })
+    return books
+
+
+def _linear_search(books, query, limit):
+    terms = set(tokenize(query))
+    hits = []
+    for book in books:
+        text = set(tokenize(' '.join([book['title'], ' '.join(book['authors']), book['description']])))
+        if terms & text:
+            hits.append(book['_id'])
+    return hits[:limit]
+
+
+def _ms(fn, repeat=REPEAT):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def _compaction_stall(index, book_ids):
+    """Remove ``book_ids`` through BooksSearch; return the compaction time and the longest loop stall."""
+    search = BooksSearch()
+    search.index, search.ready = index, True
+    gaps = []
+
+    async def tick():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    ticker = asyncio.ensure_future(tick())
+    await asyncio.sleep(0.01)
+    await search.remove_books(FakeRedis(), book_ids)
+    start = time.perf_counter()
+    await search._compaction
+    elapsed = time.perf_counter() - start
+    ticker.cancel()
+    return elapsed, max(gaps)
+
+
+def main():
+    books = make_books(N_BOOKS)
+
+    start = time.perf_counter()
+    index = InvertedIndex()
+    for book in books:
+        index.add(book)
+    build_s = time.perf_counter() - start
+
+    tracemalloc.start()
+    traced = InvertedIndex()
+    for book in books:
+        traced.add(book)
+    index_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    del traced
+    n_postings = sum(len(docs) for docs, _ in index._postings.values())
+    print('{} books, {} terms, {} postings: built in {:.2f}s, {:.1f} MiB ({:.0f} bytes/posting incl. ids)'.format(
+        N_BOOKS, len(index._postings), n_postings, build_s, index_mb, index_mb * 2 ** 20 / n_postings
+    ))
+
+    print('{:>12} | {:>7} | {:>10} | {:>13}'.format('query', 'matches', 'BM25 top 50', 'linear filter'))
+    for name, query in QUERIES.items():
+        n_matches, _ = index.search(query, 50)
+        linear = _ms(lambda: _linear_search(books, query, 50), repeat=3) if name != 'author' else None
+        print('{:>12} | {:>7} | {:>8.2f}ms | {}'.format(
+            name, n_matches, _ms(lambda: index.search(query, 50)),
+            '{:>11.0f}ms'.format(linear) if linear is not None else '{:>13}'.format('-')
+        ))
+
+    start = time.perf_counter()
+    for book in books[:1000]:
+        index.add(dict(book, title=book['title'] + ' updated'))
+    update_us = (time.perf_counter() - start) / 1000 * 1e6
+    start = time.perf_counter()
+    for book in books[1000:2000]:
+        index.remove(book['_id'])
+    remove_us = (time.perf_counter() - start) / 1000 * 1e6
+    start = time.perf_counter()
+    index.compact()
+    compact_s = time.perf_counter() - start
+    print('update {:.0f}us/book, delete {:.1f}us/book, compaction {:.2f}s'.format(update_us, remove_us, compact_s))
+
+    compact_s, stall_s = asyncio.run(_compaction_stall(index, [book['_id'] for book in books[2000:2000 + N_BOOKS // 4]]))
+    print('compaction in a thread: {:.2f}s, longest event loop stall {:.0f}ms'.format(compact_s, stall_s * 1000))
+
+
+if __name__ == '__main__':
+    main()
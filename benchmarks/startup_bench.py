@@ -0,0 +1,68 @@
+"""Benchmark: what importing the app and starting a worker cost.
+
+Imports the blueprints in a fresh interpreter, counting the MongoDB clients created on the way
+(there should be none: workers open theirs in ``before_server_start``), then times a worker
+start/stop cycle on the in-memory stand-ins with ``MONGO_LATENCY`` per database call, the way
+the test client runs one per request. A real worker logs its own ``worker started in ...``.
+
+    $ python -m benchmarks.startup_bench
+"""
+import logging
+import statistics
+import subprocess
+import sys
+import time
+
+from tests.fakes import create_test_app
+
+MONGO_LATENCY = 0.002
+REPEAT = 5
+
+IMPORT_PROBE = '''
+import time
+import pymongo
+
+created = []
+
+
+class CountingClient(pymongo.MongoClient):
+    def __init__(self, *args, **kwargs):
+        created.append(args)
+        kwargs['connect'] = False
+        super().__init__(*args, **kwargs)
+
+
+pymongo.MongoClient = CountingClient
+start = time.perf_counter()
+import app.apis
+print('{:.3f} {}'.format(time.perf_counter() - start, len(created)))
+'''
+
+
+def _import():
+    out = subprocess.run([sys.executable, '-c', IMPORT_PROBE], capture_output=True, text=True, check=True)
+    seconds, n_clients = out.stdout.split()
+    return float(seconds), int(n_clients)
+
+
+def main():
+    logging.disable(logging.INFO)
+    samples = [_import() for _ in range(REPEAT)]
+    print('import app.apis: {:.0f}ms, {} MongoDB clients created'.format(
+        statistics.median(seconds for seconds, _ in samples) * 1000, samples[0][1]
+    ))
+
+    app, db, redis = create_test_app(latency=MONGO_LATENCY)
+    cycles = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        app.test_client.get('/books/stats')
+        cycles.append(time.perf_counter() - start)
+    db.close()
+    print('worker start, one request, stop: {:.0f}ms ({}ms per MongoDB call)'.format(
+        statistics.median(cycles) * 1000, MONGO_LATENCY * 1000
+    ))
+
+
+if __name__ == '__main__':
+    main()
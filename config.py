@@ -18,8 +18,82 @@ class Config:
 
     SECRET_KEY = os.getenv('SECRET_KEY', '85c145a16bd6f6e1f3e104ca78c6a102')
     EXPIRATION_JWT = 3600  # seconds
+    PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))  # scrypt work factor, a power of 2
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # processes per server worker
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))  # beyond this, 503
+    JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10000))  # verified tokens kept per worker, 0 disables
 
     REDIS = 'redis://localhost:6379/0'
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))  # per worker
+    REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5))  # seconds to wait for a free connection
+
+    JSON_BACKEND = os.getenv('JSON_BACKEND')  # orjson, ujson or json; fastest installed when unset
+
+    BOOKS_PAGE_SIZE = 50
+    BOOKS_MAX_PAGE_SIZE = 200
+    BOOKS_EXPORT_BATCH_SIZE = 500
+    BOOKS_BULK_BATCH_SIZE = 500  # books per insert_many in POST /books/bulk
+    BOOKS_BULK_MAX_ITEM_SIZE = 64 * 1024  # bytes, longer items fail the whole upload
+    BOOKS_BATCH_MAX_IDS = 1000  # ids per GET/POST /books/batch
+    SEARCH_MAX_RESULTS = 1000  # deepest offset + limit GET /books/search pages to
+    BOOK_CACHE_TTL = 300  # seconds
+    BOOK_MISSING_CACHE_TTL = 30  # seconds, for ids that do not exist
+    LOCAL_CACHE_SIZE = 1024  # entries kept in each worker in front of Redis
+    LOCAL_CACHE_TTL = 5  # seconds
+    CACHE_LOCK_TTL = 5  # seconds one worker may spend recomputing a missed key
+    CACHE_LOCK_POLL_INTERVAL = 0.05  # seconds
+    PUBSUB_RETRY_MIN = 0.5  # seconds before subscribing again after a Redis error, doubled per failure
+    PUBSUB_RETRY_MAX = 30  # seconds
+    BOOKS_PAGE_TTL = 300  # seconds
+    BOOKS_PAGE_STALE_TTL = 30  # seconds a page may be served stale while it is refreshed
+    BOOKS_REMOVED_TTL = 600  # seconds a removed book is kept out of the books cache, whatever late write comes in
+    COMPRESS_MIN_SIZE = 1024  # bytes, smaller bodies are sent uncompressed
+    COMPRESS_OFFLOAD_SIZE = 64 * 1024  # bytes, larger bodies are compressed off the event loop
+    METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))  # seconds between a worker's flushes
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # records waiting to be written, more are dropped
+    LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 1.0))  # fraction of debug records kept
+    SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 1.0))  # logged with a per-phase breakdown, 0 disables
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))  # fraction of requests run under cProfile
+    PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')  # X-Profile header value that profiles a request, unset disables it
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', 100))  # newest profiles kept in PROFILE_DIR
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))  # seconds a request may wait for its route, then 503
+    ADMISSION_RETRY_AFTER = 1  # seconds, Retry-After of those 503s
+    # Per blueprint: requests per second per client (its JWT username, else its IP) with bursts up to
+    # `burst`, kept in Redis; and per handler (running, waiting) requests in each worker, see app/decorators/admission.py
+    ADMISSION = {
+        'books_blueprint': {
+            'rate': float(os.getenv('RATE_LIMIT', 50)),
+            'burst': int(os.getenv('RATE_LIMIT_BURST', 100)),
+            'routes': {
+                'get_all_books': (32, 64),
+                'search_books': (16, 32),
+                'export_books': (4, 4),
+                'create_books': (4, 4),
+                'update_books': (4, 8),
+                'del_books': (4, 8),
+                'get_books_batch': (16, 32),
+                'post_books_batch': (16, 32),
+                'register': (8, 16),
+                'login': (8, 16),
+            },
+        },
+    }
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+
+
+class ProductionConfig:
+    """Run profile for production: one worker per core, no reloader. Selected with RUN_PROFILE=production."""
+    RUN_SETTING = {
+        'host': os.environ.get('SERVER_HOST', 'localhost'),
+        'port': int(os.environ.get('SERVER_PORT', 8080)),
+        'debug': False,
+        'access_log': os.environ.get('ACCESS_LOG', '1') == '1',
+        'auto_reload': False,
+        'workers': int(os.environ.get('SERVER_WORKERS') or os.cpu_count() or 1)
+    }
 
 
 class LocalDBConfig:
@@ -36,3 +110,7 @@ class MongoDBConfig:
     HOST = os.environ.get("MONGO_HOST") or "localhost"
     PORT = os.environ.get("MONGO_PORT") or "27017"
     DATABASE = os.environ.get("MONGO_DATABASE") or "example_db"
+    EXECUTOR_WORKERS = int(os.environ.get("MONGO_EXECUTOR_WORKERS") or 8)
+    # Connections per worker; no more than EXECUTOR_WORKERS queries run at once anyway.
+    MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE") or EXECUTOR_WORKERS)
+    EXPLAIN_QUERIES = bool(os.environ.get("MONGO_EXPLAIN_QUERIES"))  # log collection scans at startup
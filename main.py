@@ -1,17 +1,17 @@
 import os
 
 from sanic.response import text
-from sanic_redis import SanicRedis
 
 from app import create_app
 from app.apis import api
 from app.misc.log import log
-from config import Config, LocalDBConfig
+from config import Config, LocalDBConfig, ProductionConfig
 
-app = create_app(Config, LocalDBConfig)
-redis = SanicRedis()
-
-redis.init_app(app)
+# RUN_PROFILE=production: a worker per core and no reloader (see ProductionConfig).
+if os.environ.get('RUN_PROFILE') == 'production':
+    app = create_app(Config, LocalDBConfig, ProductionConfig)
+else:
+    app = create_app(Config, LocalDBConfig)
 
 app.blueprint(api)
 
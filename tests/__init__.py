@@ -1,6 +0,0 @@
-import unittest
-from tests.books_test import BooksTests
-
-
-if __name__ == '__main__':
-    unittest.main()
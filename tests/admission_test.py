@@ -0,0 +1,145 @@
+import asyncio
+import unittest
+
+from unittest import mock
+
+from app.apis import books_blueprint
+from app.constants.cache_constants import CacheConstants
+from app.decorators.admission import ConcurrencyLimiter, take_token
+from app.utils import jwt_utils
+from tests.fakes import FakeRedis, create_test_app
+
+
+class ConcurrencyLimiterTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the per-route concurrency limit """
+
+    async def test_waiters_get_the_slot_in_arrival_order(self):
+        limiter = ConcurrencyLimiter(1, 2, timeout=1)
+        await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(wait('first')), asyncio.ensure_future(wait('second'))]
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.waiting, 2)
+        limiter.release()
+        await tasks[0]
+        # The slot went to the first waiter, not back to the pool.
+        self.assertEqual((order, limiter.active, limiter.waiting), (['first'], 1, 1))
+        limiter.release()
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ['first', 'second'])
+        limiter.release()
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+    async def test_full_queue_and_timeout(self):
+        limiter = ConcurrencyLimiter(1, 1, timeout=0.01)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with self.assertRaises(OverflowError):
+            await limiter.acquire()
+        with self.assertRaises(asyncio.TimeoutError):
+            await waiter
+        self.assertEqual((limiter.active, limiter.waiting), (1, 0))
+
+    async def test_cancelled_waiter_leaves_the_queue(self):
+        limiter = ConcurrencyLimiter(1, 1, timeout=1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+    async def test_timeout_after_release_skipped_the_waiter(self):
+        limiter = ConcurrencyLimiter(1, 1, timeout=1)
+        await limiter.acquire()
+
+        async def wait_for(waiter, timeout):
+            # The timeout cancels the waiter, and a release runs before acquire handles it.
+            waiter.cancel()
+            limiter.release()
+            raise asyncio.TimeoutError()
+
+        with mock.patch('app.decorators.admission.asyncio.wait_for', wait_for):
+            with self.assertRaises(asyncio.TimeoutError):
+                await limiter.acquire()
+        self.assertEqual((limiter.active, limiter.waiting), (0, 0))
+
+
+class TokenBucketTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the rate limit script, run by the Redis stand-in """
+
+    async def test_burst_then_refill(self):
+        r = FakeRedis()
+        self.assertEqual(await take_token(r, 'bucket', 10, 2), (True, 0.0))
+        self.assertEqual((await take_token(r, 'bucket', 10, 2))[0], True)
+        allowed, wait = await take_token(r, 'bucket', 10, 2)
+        self.assertFalse(allowed)
+        self.assertTrue(0 < wait <= 0.1)
+        # Refused requests take nothing: the bucket refills as if they had not been made.
+        await asyncio.sleep(wait + 0.01)
+        self.assertEqual((await take_token(r, 'bucket', 10, 2))[0], True)
+        self.assertIn('bucket', r.expires)
+
+
+class AdmissionTests(unittest.TestCase):
+    """ Unit testcases for admission control on the books blueprint """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        patcher = mock.patch.dict(books_blueprint.admission.config, {'rate': 1, 'burst': 2})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_rate_limited_per_client(self):
+        for _ in range(2):
+            request, response = self.app.test_client.get('/books/stats')
+            self.assertEqual(response.status, 200)
+        request, response = self.app.test_client.get('/books/stats')
+        self.assertEqual(response.status, 429)
+        self.assertEqual(response.headers['retry-after'], '1')
+
+        # A signed-in user has a bucket of their own.
+        headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+        request, response = self.app.test_client.get('/books/stats', headers=headers)
+        self.assertEqual(response.status, 200)
+        key = CacheConstants.rate_limit.format(scope='books_blueprint', client='user:alice')
+        self.assertIn(key, self.redis.data)
+
+    def test_fails_open_without_redis(self):
+        with mock.patch.object(FakeRedis, 'eval', side_effect=ConnectionError('down')):
+            for _ in range(3):
+                request, response = self.app.test_client.get('/books/stats')
+                self.assertEqual(response.status, 200)
+
+    def test_busy_route_answers_503(self):
+        books_blueprint.admission.config['burst'] = 10
+        limiter = books_blueprint.admission.limiters['get_all_books']
+        with mock.patch.object(limiter, 'active', limiter.limit), mock.patch.object(limiter, 'queue_size', 0):
+            request, response = self.app.test_client.get('/books')
+            self.assertEqual(response.status, 503)
+            self.assertEqual(response.headers['retry-after'], '1')
+            # Other routes are not affected.
+            request, response = self.app.test_client.get('/books/stats')
+            self.assertEqual(response.status, 200)
+        self.assertEqual(limiter.active, 0)
+
+        request, response = self.app.test_client.get('/books')
+        self.assertEqual(response.status, 200)
+
+    def test_batch_routes_are_limited(self):
+        self.assertIn('get_books_batch', books_blueprint.admission.limiters)
+        self.assertIn('post_books_batch', books_blueprint.admission.limiters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import unittest
+
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.models.book import Book
+from tests.fakes import FakeMongoClient
+
+
+class AsyncMongoDBTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the awaitable data layer """
+
+    def setUp(self):
+        self.client = FakeMongoClient()
+        self.db = AsyncMongoDB(MongoDB(client=self.client), max_workers=4)
+
+    def tearDown(self):
+        self.db.close()
+
+    async def test_book_round_trip(self):
+        book = Book('book-1').from_dict({'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'})
+        self.assertIsNotNone(await self.db.add_book(book))
+
+        books = await self.db.get_books(filter_={'_id': 'book-1'})
+        self.assertEqual(books[0].title, 'Dune')
+
+        await self.db.update_book('book-1', update={'title': 'Dune Messiah'})
+        books = await self.db.get_books(filter_={'_id': 'book-1'})
+        self.assertEqual(books[0].title, 'Dune Messiah')
+
+        self.assertTrue(await self.db.del_book('book-1'))
+        self.assertEqual(await self.db.get_books(), [])
+
+    async def test_users(self):
+        await self.db.add_user({'username': 'alice', 'password': 'secret'})
+        users = await self.db.get_user(filter_={'username': 'alice'})
+        self.assertEqual(users[0]['username'], 'alice')
+
+    async def test_event_loop_not_blocked(self):
+        self.db.mongodb._books_col.latency = 0.05
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        await asyncio.gather(*[self.db.get_books() for _ in range(4)])
+        elapsed = time.perf_counter() - start
+        task.cancel()
+
+        # Four 50 ms queries share the pool, so they overlap and the ticker keeps running.
+        self.assertLess(elapsed, 0.15)
+        self.assertGreater(ticks, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import asyncio
+import datetime
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import jwt
+
+from app.constants.cache_constants import CacheConstants
+from app.decorators import auth
+from app.decorators.auth import RevokedTokens, VerifiedTokenCache, check_token
+from app.utils import jwt_utils
+from config import Config
+from tests.fakes import FakeRedis
+
+
+def _request(token):
+    return SimpleNamespace(token=token)
+
+
+class VerifiedTokenCacheTests(unittest.TestCase):
+    """ Unit testcases for the verified JWT cache behind @protected """
+
+    def setUp(self):
+        self.cache = VerifiedTokenCache(max_size=10)
+        patcher = mock.patch.object(auth, 'verified_tokens', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_skips_verification(self):
+        token = jwt_utils.generate_jwt('alice')
+        self.assertEqual(check_token(_request(token))[1]['username'], 'alice')
+        with mock.patch.object(auth.jwt, 'decode', side_effect=AssertionError('verified again')):
+            self.assertEqual(check_token(_request(token))[1]['username'], 'alice')
+        self.assertEqual((self.cache.stats.hits, self.cache.stats.misses), (1, 1))
+
+    def test_invalid_token_is_not_cached(self):
+        token = jwt.encode({'username': 'mallory'}, 'wrong-key')
+        self.assertEqual(check_token(_request(token)), (False, None))
+        self.assertIsNone(self.cache.get(token))
+
+    def test_entry_dropped_at_exp(self):
+        exp = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(seconds=1)
+        token = jwt.encode({'username': 'alice', 'exp': exp}, Config.SECRET_KEY)
+        self.assertTrue(check_token(_request(token))[0])
+        with mock.patch('time.monotonic', return_value=time.monotonic() + 2):
+            self.assertIsNone(self.cache.get(token))
+
+    def test_revoke(self):
+        token = jwt_utils.generate_jwt('alice')
+        self.assertTrue(check_token(_request(token))[0])
+        asyncio.run(self.cache.revoke(FakeRedis(), token))
+        self.assertEqual(check_token(_request(token)), (False, None))
+
+    def test_revocations_do_not_depend_on_cache_size(self):
+        cache = VerifiedTokenCache(max_size=0)
+        r = FakeRedis()
+        tokens = [jwt_utils.generate_jwt(username) for username in ('alice', 'bob', 'carol')]
+        for token in tokens:
+            asyncio.run(cache.revoke(r, token))
+        self.assertTrue(all(cache.is_revoked(token) for token in tokens))
+
+    def test_disabled(self):
+        cache = VerifiedTokenCache(max_size=0)
+        token = jwt_utils.generate_jwt('alice')
+        cache.put(token, {'username': 'alice', 'exp': 2 ** 40})
+        self.assertIsNone(cache.get(token))
+
+
+class RevokedTokensTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for revocations shared across workers """
+
+    async def test_revocation_reaches_other_workers(self):
+        r = FakeRedis()
+        worker_a, worker_b = VerifiedTokenCache(max_size=10), VerifiedTokenCache(max_size=10)
+        token = jwt_utils.generate_jwt('alice')
+        listener = asyncio.ensure_future(worker_b.revoked.listen(r))
+        await asyncio.sleep(0.01)
+
+        with mock.patch.object(auth, 'verified_tokens', worker_b):
+            self.assertTrue(check_token(_request(token))[0])  # cached by worker b
+            await worker_a.revoke(r, token)
+            await asyncio.sleep(0.01)
+            self.assertEqual(check_token(_request(token)), (False, None))
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+        # A worker started later loads the revocations made so far.
+        worker_c = VerifiedTokenCache(max_size=10)
+        await worker_c.revoked.load(r)
+        self.assertTrue(worker_c.is_revoked(token))
+
+    async def test_listener_reloads_after_a_lost_connection(self):
+        r = FakeRedis()
+        worker_a, worker_b = VerifiedTokenCache(max_size=10), VerifiedTokenCache(max_size=10)
+        token = jwt_utils.generate_jwt('alice')
+        with mock.patch.object(Config, 'PUBSUB_RETRY_MIN', 0.01):
+            listener = asyncio.ensure_future(worker_b.revoked.listen(r))
+            await asyncio.sleep(0.01)
+            r.drop_subscribers()
+            await worker_a.revoke(r, token)  # published to nobody
+            await asyncio.sleep(0.05)
+            self.assertTrue(worker_b.is_revoked(token))
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    async def test_expired_revocations_are_dropped(self):
+        r = FakeRedis()
+        revoked = RevokedTokens()
+        await revoked.revoke(r, b'old', time.time() + 0.01)
+        await revoked.revoke(r, b'new', time.time() + 60)
+        await asyncio.sleep(0.02)
+        self.assertNotIn(b'old', revoked)
+        await revoked.revoke(r, b'newer', time.time() + 60)
+        self.assertEqual(await r.zcard(CacheConstants.revoked_tokens), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
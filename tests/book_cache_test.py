@@ -0,0 +1,65 @@
+import json
+import unittest
+
+from app.databases.redis_cached import book_cache_stats
+from app.models.book import Book
+from app.utils import jwt_utils
+from tests.fakes import create_test_app
+
+
+class BookCacheTests(unittest.TestCase):
+    """ Unit testcases for the per-book cache behind GET /books/<book_id> """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.books_col = self.db.mongodb._books_col
+        book = Book('book-1').from_dict({'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'})
+        book.owner = 'alice'
+        self.books_col.insert_one(book.to_dict())
+        self.headers = {'Authorization': 'Bearer {}'.format(jwt_utils.generate_jwt('alice'))}
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_read_through(self):
+        hits = book_cache_stats.hits
+        self.assertEqual(self.app.test_client.get('/books/book-1')[1].status, 200)
+        calls = self.books_col.calls
+        request, response = self.app.test_client.get('/books/book-1')
+        self.assertEqual(json.loads(response.text)['title'], 'Dune')
+        self.assertEqual(self.books_col.calls, calls)
+        self.assertEqual(book_cache_stats.hits, hits + 1)
+
+    def test_missing_book_is_cached(self):
+        negative_hits = book_cache_stats.negative_hits
+        self.assertEqual(self.app.test_client.get('/books/nope')[1].status, 404)
+        calls = self.books_col.calls
+        self.assertEqual(self.app.test_client.get('/books/nope')[1].status, 404)
+        self.assertEqual(self.books_col.calls, calls)
+        self.assertEqual(book_cache_stats.negative_hits, negative_hits + 1)
+
+    def test_failed_read_is_not_cached_as_missing(self):
+        self.books_col.fail_reads()
+        self.assertEqual(self.app.test_client.get('/books/book-1')[1].status, 500)
+        request, response = self.app.test_client.get('/books/book-1')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.text)['title'], 'Dune')
+
+        self.books_col.insert_one(Book('book-2').from_dict({'title': 'Emma'}).to_dict())
+        self.books_col.fail_reads()
+        self.assertEqual(self.app.test_client.get('/books/batch?ids=book-2')[1].status, 500)
+        request, response = self.app.test_client.get('/books/batch?ids=book-2')
+        self.assertEqual(json.loads(response.text)['missing'], [])
+
+    def test_update_and_delete_invalidate(self):
+        self.app.test_client.get('/books/book-1')
+        self.app.test_client.put('/books/book-1', headers=self.headers, data=json.dumps({'title': 'Dune Messiah'}))
+        request, response = self.app.test_client.get('/books/book-1')
+        self.assertEqual(json.loads(response.text)['title'], 'Dune Messiah')
+
+        self.app.test_client.delete('/books/book-1', headers=self.headers)
+        self.assertEqual(self.app.test_client.get('/books/book-1')[1].status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
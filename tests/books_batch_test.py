@@ -0,0 +1,91 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from app.databases.book_loader import BookLoader
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.models.book import Book
+from tests.fakes import FakeMongoClient, create_test_app
+
+
+class BooksBatchTests(unittest.TestCase):
+    """ Unit testcases for GET and POST /books/batch """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.books_col = self.db.mongodb._books_col
+        for i in range(4):
+            self.books_col.insert_one(Book('book-{}'.format(i)).from_dict({'title': str(i)}).to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _get(self, ids):
+        request, response = self.app.test_client.get('/books/batch?ids=' + ids)
+        return response.status, json.loads(response.text) if response.status == 200 else None
+
+    def test_request_order_and_misses(self):
+        calls = self.books_col.calls
+        status, data = self._get('book-2,nope,book-0,book-2')
+        self.assertEqual(status, 200)
+        self.assertEqual([book and book['_id'] for book in data['books']], ['book-2', None, 'book-0', 'book-2'])
+        self.assertEqual((data['n_books'], data['missing']), (3, ['nope']))
+        self.assertEqual(self.books_col.calls - calls, 1)
+
+    def test_served_from_book_cache(self):
+        self.app.test_client.get('/books/book-1')
+        calls = self.books_col.calls
+        self._get('book-1,book-3,nope')
+        self.assertEqual(self.books_col.calls - calls, 1)
+
+        calls = self.books_col.calls
+        status, data = self._get('book-1,book-3,nope')
+        self.assertEqual(self.books_col.calls, calls)
+        self.assertEqual(data['missing'], ['nope'])
+
+    def test_post(self):
+        request, response = self.app.test_client.post('/books/batch', data=json.dumps({'ids': ['book-3', 'book-1']}))
+        self.assertEqual(response.status, 200)
+        self.assertEqual([book['_id'] for book in json.loads(response.text)['books']], ['book-3', 'book-1'])
+
+        request, response = self.app.test_client.post('/books/batch', data=json.dumps({'ids': []}))
+        self.assertEqual(response.status, 400)
+
+    def test_bad_requests(self):
+        self.assertEqual(self._get('')[0], 400)
+        with mock.patch('app.apis.books_blueprint.Config.BOOKS_BATCH_MAX_IDS', 2):
+            self.assertEqual(self._get('a,b,c')[0], 400)
+
+
+class BookLoaderTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the request-scoped book loader """
+
+    async def asyncSetUp(self):
+        self.db = AsyncMongoDB(MongoDB(client=FakeMongoClient()), max_workers=2)
+        self.books_col = self.db.mongodb._books_col
+        for i in range(3):
+            self.books_col.insert_one(Book('book-{}'.format(i)).to_dict())
+
+    async def asyncTearDown(self):
+        self.db.close()
+
+    async def test_coalesces_lookups(self):
+        loader = BookLoader(self.db)
+        calls = self.books_col.calls
+        first, many, again = await asyncio.gather(
+            loader.load('book-0'), loader.load_many(['book-1', 'nope', 'book-0']), loader.load('book-2')
+        )
+        self.assertEqual(self.books_col.calls - calls, 1)
+        self.assertEqual(first['_id'], 'book-0')
+        self.assertEqual([book and book['_id'] for book in many], ['book-1', None, 'book-0'])
+
+        await loader.load('book-1')
+        self.assertEqual(self.books_col.calls - calls, 1)
+        loader.clear('book-1')
+        await loader.load('book-1')
+        self.assertEqual(self.books_col.calls - calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
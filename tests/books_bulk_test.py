@@ -0,0 +1,220 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from app.models.book import Book
+from app.utils import json_utils, jwt_utils
+from tests.fakes import create_test_app
+
+
+class BooksBulkCreateTests(unittest.TestCase):
+    """ Unit testcases for POST /books/bulk """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+
+    def tearDown(self):
+        self.db.close()
+
+    def _post(self, data, content_type='application/json'):
+        headers = {**self.headers, 'Content-Type': content_type}
+        request, response = self.app.test_client.post('/books/bulk', data=data, headers=headers)
+        lines = [json.loads(line) for line in response.text.splitlines()] if response.status == 200 else None
+        return response.status, lines
+
+    @staticmethod
+    def _book(i):
+        return {'title': 'Title {}'.format(i), 'authors': ['Author'], 'publisher': 'Publisher'}
+
+    def test_json_array(self):
+        books = [self._book(i) for i in range(3)]
+        status, lines = self._post(json.dumps(books))
+        self.assertEqual(status, 200)
+        self.assertEqual([line['status'] for line in lines[:-1]], ['created'] * 3)
+        self.assertEqual(lines[-1], {'created': 3, 'failed': 0})
+        docs = self.db.mongodb._books_col.docs
+        self.assertEqual(sorted(doc['title'] for doc in docs.values()), ['Title 0', 'Title 1', 'Title 2'])
+        self.assertTrue(all(doc['owner'] == 'alice' for doc in docs.values()))
+
+    def test_ndjson_reports_invalid_items(self):
+        body = '\n'.join([json.dumps(self._book(0)), '{not json', json.dumps({'title': 'no authors'}),
+                          json.dumps(self._book(3))])
+        status, lines = self._post(body, content_type='application/x-ndjson')
+        self.assertEqual(status, 200)
+        self.assertEqual([(line['index'], line['status']) for line in lines[:-1]],
+                         [(0, 'created'), (1, 'failed'), (2, 'failed'), (3, 'created')])
+        self.assertEqual(lines[-1], {'created': 2, 'failed': 2})
+        self.assertEqual(len(self.db.mongodb._books_col.docs), 2)
+
+    def test_duplicate_ids_fail_alone(self):
+        books = [self._book(i) for i in range(3)]
+        ids = iter(['same', 'same', 'other'])
+        with mock.patch('app.apis.books_blueprint.uuid.uuid4', lambda: next(ids)):
+            status, lines = self._post(json.dumps(books))
+        self.assertEqual([line['status'] for line in lines[:-1]], ['created', 'failed', 'created'])
+
+    def test_server_fields_are_rejected(self):
+        books = [dict(self._book(0), _id='mine'), dict(self._book(1), createdAt='soon'), self._book(2)]
+        status, lines = self._post(json.dumps(books))
+        self.assertEqual([line['status'] for line in lines[:-1]], ['failed', 'failed', 'created'])
+        self.assertEqual(lines[-1], {'created': 1, 'failed': 2})
+        self.assertNotIn('mine', self.db.mongodb._books_col.docs)
+
+    def test_one_insert_and_cache_update_per_batch(self):
+        books = [self._book(i) for i in range(5)]
+        with mock.patch('app.apis.books_blueprint.Config.BOOKS_BULK_BATCH_SIZE', 2):
+            status, lines = self._post(json.dumps(books))
+        self.assertEqual(lines[-1], {'created': 5, 'failed': 0})
+        self.assertEqual(self.db.mongodb._books_col.calls, 3)
+        self.assertEqual(int(self.redis.data['books:version']), 3)
+
+    def test_malformed_array(self):
+        status, _ = self._post('{"title": "not an array"}')
+        self.assertEqual(status, 400)
+
+        status, lines = self._post('[{}, ')
+        self.assertEqual(status, 200)
+        self.assertEqual(lines[-1]['failed'], 1)
+        self.assertIn('error', lines[-1])
+
+    def test_requires_token(self):
+        request, response = self.app.test_client.post('/books/bulk', data='[]')
+        self.assertEqual(response.status, 401)
+
+
+class BooksBulkUpdateDeleteTests(unittest.TestCase):
+    """ Unit testcases for PATCH /books/bulk and DELETE /books/bulk """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+        self.books_col = self.db.mongodb._books_col
+        for i in range(4):
+            owner = 'alice' if i < 3 else 'bob'
+            self.books_col.insert_one(Book('book-{}'.format(i)).from_dict({'title': str(i), 'owner': owner}).to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _send(self, method, body):
+        request, response = self.app.test_client.request(
+            '/books/bulk', http_method=method, content=json.dumps(body), headers=self.headers
+        )
+        return response.status, json.loads(response.text) if response.status == 200 else None
+
+    def test_update_by_ids_skips_other_owners(self):
+        status, data = self._send('patch', {'ids': ['book-0', 'book-3', 'nope'], 'update': {'title': 'new'}})
+        self.assertEqual(status, 200)
+        self.assertEqual(data['matched'], 1)
+        self.assertEqual(self.books_col.docs['book-0']['title'], 'new')
+        self.assertEqual(self.books_col.docs['book-3']['title'], '3')
+
+    def test_update_by_owner(self):
+        status, data = self._send('patch', {'owner': 'alice', 'update': {'publisher': 'P'}})
+        self.assertEqual(data['modified'], 3)
+        self.assertEqual(sorted(doc['_id'] for doc in self.books_col.docs.values() if doc.get('publisher') == 'P'),
+                         ['book-0', 'book-1', 'book-2'])
+
+    def test_update_refreshes_cached_book(self):
+        self.app.test_client.get('/books/book-1')
+        self._send('patch', {'ids': ['book-1'], 'update': {'title': 'new'}})
+        request, response = self.app.test_client.get('/books/book-1')
+        self.assertEqual(json.loads(response.text)['title'], 'new')
+
+    def test_delete_by_ids(self):
+        status, data = self._send('delete', {'ids': ['book-1', 'book-3']})
+        self.assertEqual(status, 200)
+        self.assertEqual(data['deleted'], 1)
+        self.assertEqual(sorted(self.books_col.docs), ['book-0', 'book-2', 'book-3'])
+
+    def test_delete_by_owner_in_one_write(self):
+        calls = self.books_col.calls
+        status, data = self._send('delete', {'owner': 'alice'})
+        self.assertEqual(data['deleted'], 3)
+        self.assertEqual(list(self.books_col.docs), ['book-3'])
+        self.assertEqual(self.books_col.calls - calls, 2)
+        self.assertEqual(int(self.redis.data['books:version']), 1)
+
+    def test_owner_selection_is_batched_and_projected(self):
+        projections = []
+        find = self.books_col.find
+
+        def recording_find(filter_=None, projection=None, **kwargs):
+            projections.append(projection)
+            return find(filter_, projection, **kwargs)
+
+        with mock.patch('app.apis.books_blueprint.Config.BOOKS_BULK_BATCH_SIZE', 2), \
+                mock.patch.object(self.books_col, 'find', recording_find):
+            status, data = self._send('patch', {'owner': 'alice', 'update': {'publisher': 'P'}})
+            self.assertEqual((data['matched'], data['modified']), (3, 3))
+            # Two batches: each selected, updated, then read back in full.
+            self.assertEqual(projections, [['owner', 'publisher', 'authors'], None] * 2)
+            self.assertEqual(int(self.redis.data['books:version']), 2)
+
+            status, data = self._send('delete', {'owner': 'alice'})
+        self.assertEqual(data['deleted'], 3)
+        self.assertEqual(list(self.books_col.docs), ['book-3'])
+
+    def test_update_caches_the_books_as_stored(self):
+        update_many = self.books_col.update_many
+
+        def racing_update_many(filter_, update):
+            # Another writer renames book-0 after it was selected.
+            self.books_col.docs['book-0'].update(title='renamed', version=1)
+            return update_many(filter_, update)
+
+        with mock.patch.object(self.books_col, 'update_many', racing_update_many):
+            self._send('patch', {'ids': ['book-0'], 'update': {'publisher': 'P'}})
+        cached = json.loads(self.redis.data['books:data'][b'book-0'])
+        self.assertEqual((cached['title'], cached['publisher'], cached['version']), ('renamed', 'P', 2))
+
+    def test_other_owner_is_forbidden(self):
+        self.assertEqual(self._send('delete', {'owner': 'bob'})[0], 403)
+        self.assertEqual(self._send('patch', {'owner': 'bob', 'update': {'title': 'x'}})[0], 403)
+        self.assertEqual(len(self.books_col.docs), 4)
+
+    def test_selector_is_required(self):
+        self.assertEqual(self._send('delete', {})[0], 400)
+        self.assertEqual(self._send('delete', {'ids': ['book-0'], 'owner': 'alice'})[0], 400)
+        self.assertEqual(self._send('patch', {'ids': ['book-0'], 'update': {}})[0], 400)
+
+
+class BulkBodyParsingTests(unittest.TestCase):
+    """ Unit testcases for the incremental JSON array and NDJSON parsers """
+
+    @staticmethod
+    def _parse(parser, body, chunk_size=1):
+        async def chunks():
+            for i in range(0, len(body), chunk_size):
+                yield body[i:i + chunk_size]
+
+        async def collect():
+            return [item async for item in parser(chunks())]
+        return asyncio.run(collect())
+
+    def test_array_split_anywhere(self):
+        body = '[ {"title": "é"}, 12, [1, 2] , 345 ]'.encode()
+        for chunk_size in (1, 2, 5, len(body)):
+            self.assertEqual(self._parse(json_utils.iter_json_array, body, chunk_size),
+                             [{'title': 'é'}, 12, [1, 2], 345])
+
+    def test_array_errors(self):
+        for body in (b'', b'{}', b'[1, 2', b'[1 2]', b'[{bad}]'):
+            with self.assertRaises(ValueError):
+                self._parse(json_utils.iter_json_array, body)
+
+    def test_item_size_is_bounded(self):
+        parser = lambda chunks: json_utils.iter_json_array(chunks, max_item_size=16)
+        with self.assertRaises(ValueError):
+            self._parse(parser, b'["' + b'x' * 100 + b'"]')
+
+    def test_ndjson(self):
+        items = self._parse(json_utils.iter_ndjson, b'{"a": 1}\n\nnope\n[2]')
+        self.assertEqual([item for item, _ in items], [{'a': 1}, None, [2]])
+        self.assertIsNotNone(items[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
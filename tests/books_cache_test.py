@@ -0,0 +1,123 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from app.constants.cache_constants import CacheConstants
+from app.databases import books_cache
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.databases.redis_cached import get_version
+from app.models.book import Book
+from config import Config
+from tests.fakes import FakeMongoClient, FakeRedis
+
+
+def _book(book_id, created_at):
+    return Book(book_id).from_dict({'title': book_id, 'createdAt': created_at}).to_dict()
+
+
+class BooksCacheTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the incremental books collection cache """
+
+    async def asyncSetUp(self):
+        self.r = FakeRedis()
+        self.db = AsyncMongoDB(MongoDB(client=FakeMongoClient()), max_workers=2)
+        for i in range(5):
+            await self.db.add_book(Book().from_dict(_book('book-{}'.format(i), 1000 + i // 2)))
+
+    async def asyncTearDown(self):
+        self.db.close()
+
+    async def _ids(self, limit, after=None):
+        return [book['_id'] for book in await books_cache.get_books_page(self.r, limit, after=after)]
+
+    async def test_cold_cache_serves_nothing(self):
+        self.assertIsNone(await books_cache.get_books_page(self.r, 10))
+
+    async def test_warm_and_page(self):
+        self.assertTrue(await books_cache.warm_books_cache(self.r, self.db, batch_size=2))
+        self.assertEqual(await self._ids(3), ['book-0', 'book-1', 'book-2'])
+        self.assertEqual(await self._ids(3, after=(1001, 'book-2')), ['book-3', 'book-4'])
+
+    async def test_page_after_removed_cursor_book(self):
+        await books_cache.warm_books_cache(self.r, self.db)
+        await books_cache.remove_book(self.r, 'book-2')
+        self.assertEqual(await self._ids(10, after=(1001, 'book-2')), ['book-3', 'book-4'])
+
+    async def test_writes_are_incremental_and_versioned(self):
+        await books_cache.warm_books_cache(self.r, self.db)
+        version = await get_version(self.r, CacheConstants.books_version)
+
+        await books_cache.put_book(self.r, _book('book-new', 999))
+        await books_cache.put_book(self.r, {**_book('book-4', 1002), 'title': 'renamed', 'version': 1})
+        await books_cache.remove_book(self.r, 'book-0')
+
+        self.assertEqual(await get_version(self.r, CacheConstants.books_version), version + 3)
+        self.assertEqual(await self._ids(2), ['book-new', 'book-1'])
+        cached = json.loads(await self.r.hget(CacheConstants.books_data, 'book-4'))
+        self.assertEqual(cached['title'], 'renamed')
+
+    async def _warm_racing(self, write):
+        """Warm up, with ``write()`` landing after each batch is read and before it is cached."""
+        db = self.db
+
+        class RacingDB:
+            async def iter_books(self, batch_size):
+                async for docs in db.iter_books(batch_size=batch_size):
+                    await write()
+                    yield docs
+
+            async def get_books(self, filter_=None):
+                return await db.get_books(filter_=filter_)
+
+        self.assertTrue(await books_cache.warm_books_cache(self.r, RacingDB()))
+        self.assertFalse(await self.r.exists(CacheConstants.books_dirty))
+
+    async def test_delete_during_warm_up_is_not_resurrected(self):
+        async def delete():
+            await self.db.del_book('book-1')
+            await books_cache.remove_book(self.r, 'book-1')
+
+        await self._warm_racing(delete)
+        self.assertNotIn('book-1', await self._ids(10))
+
+    async def test_update_during_warm_up_is_not_overwritten(self):
+        async def update():
+            await self.db.update_book('book-3', {'title': 'renamed'})
+            await books_cache.put_book(self.r, {**_book('book-3', 1001), 'title': 'renamed', 'version': 1})
+
+        await self._warm_racing(update)
+        cached = json.loads(await self.r.hget(CacheConstants.books_data, 'book-3'))
+        self.assertEqual(cached['title'], 'renamed')
+
+    async def test_late_writes_do_not_go_back(self):
+        await books_cache.warm_books_cache(self.r, self.db)
+        # Two updates of book-4 and a delete of book-3, each cached in the wrong order.
+        await books_cache.put_book(self.r, {**_book('book-4', 1002), 'title': 'second', 'version': 2})
+        await books_cache.put_books(self.r, [{**_book('book-4', 1002), 'title': 'first', 'version': 1}])
+        await books_cache.remove_books(self.r, ['book-3'])
+        await books_cache.put_book(self.r, {**_book('book-3', 1001), 'title': 'renamed', 'version': 1})
+
+        self.assertEqual(await self._ids(10), ['book-0', 'book-1', 'book-2', 'book-4'])
+        cached = json.loads(await self.r.hget(CacheConstants.books_data, 'book-4'))
+        self.assertEqual((cached['title'], cached['version']), ('second', 2))
+
+    async def test_removals_are_forgotten(self):
+        with mock.patch.object(Config, 'BOOKS_REMOVED_TTL', 0.01):
+            await books_cache.remove_books(self.r, ['book-1'])
+            await asyncio.sleep(0.02)
+            await books_cache.remove_books(self.r, ['book-2'])
+        self.assertEqual(await self.r.zrange(CacheConstants.books_removed, 0, -1), [b'book-2'])
+
+    async def test_failed_read_leaves_the_cache_cold(self):
+        self.db.mongodb._books_col.fail_reads(after=1)
+        self.assertFalse(await books_cache.warm_books_cache(self.r, self.db, batch_size=2))
+        self.assertIsNone(await books_cache.get_books_page(self.r, 10))
+        self.assertFalse(await self.r.exists(CacheConstants.books_warming))
+
+        self.assertTrue(await books_cache.warm_books_cache(self.r, self.db, batch_size=2))
+        self.assertEqual(len(await self._ids(10)), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
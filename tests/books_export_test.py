@@ -0,0 +1,60 @@
+import json
+import unittest
+
+from app.models.book import Book
+from config import Config
+from tests.fakes import create_test_app
+
+
+class BooksExportTests(unittest.TestCase):
+    """ Unit testcases for GET /books/export """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.n_books = Config.BOOKS_EXPORT_BATCH_SIZE + 3
+        books_col = self.db.mongodb._books_col
+        for i in range(self.n_books):
+            books_col.insert_one(Book('book-{:05d}'.format(i)).from_dict({'title': str(i)}).to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _export(self, url, headers=None):
+        request, response = self.app.test_client.get(url, headers=headers)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers['content-type'], 'application/x-ndjson')
+        return response, [json.loads(line) for line in response.text.splitlines()]
+
+    def test_export_all(self):
+        response, books = self._export('/books/export', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-encoding', response.headers)
+        self.assertEqual(len(books), self.n_books)
+        self.assertEqual(books[-1]['_id'], 'book-{:05d}'.format(self.n_books - 1))
+
+    def test_export_resume(self):
+        _, books = self._export('/books/export?after=book-00499', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual([book['_id'] for book in books], ['book-00500', 'book-00501', 'book-00502'])
+
+    def test_export_gzip(self):
+        response, books = self._export('/books/export', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(len(books), self.n_books)
+
+    def test_gzip_refused(self):
+        for accept in ('gzip;q=0', 'x-gzip', 'br;q=1, gzip;q=0'):
+            response, books = self._export('/books/export', headers={'Accept-Encoding': accept})
+            self.assertNotIn('content-encoding', response.headers)
+            self.assertEqual(len(books), self.n_books)
+
+    def test_failed_read_aborts_the_stream(self):
+        # A consumer must see a broken response, not a clean end of a shorter export.
+        self.db.mongodb._books_col.fail_reads(after=1)
+        try:
+            request, response = self.app.test_client.get('/books/export', headers={'Accept-Encoding': 'identity'})
+        except ValueError:  # the test client got no complete response
+            response = None
+        self.assertIsNone(response)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import unittest
+from unittest import mock
+
+from app.models.book import Book
+from app.utils import jwt_utils
+from app.utils.cursor_utils import encode_cursor
+from config import Config
+from tests.fakes import create_test_app
+
+
+class BooksPaginationTests(unittest.TestCase):
+    """ Unit testcases for paging through GET /books """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        books_col = self.db.mongodb._books_col
+        for i in range(7):
+            book = Book('book-{}'.format(i)).from_dict({'title': 'Title {}'.format(i), 'createdAt': 1000 + i // 2})
+            books_col.insert_one(book.to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _get(self, url):
+        request, response = self.app.test_client.get(url)
+        return response.status, json.loads(response.text) if response.status == 200 else None
+
+    def test_pages_cover_all_books_in_order(self):
+        ids = []
+        url = '/books?limit=3'
+        while url:
+            status, data = self._get(url)
+            self.assertEqual(status, 200)
+            self.assertLessEqual(data['n_books'], 3)
+            ids.extend(book['_id'] for book in data['books'])
+            url = '/books?limit=3&after={}'.format(data['next']) if data['next'] else None
+        self.assertEqual(ids, ['book-{}'.format(i) for i in range(7)])
+
+    def test_fields_projection(self):
+        status, data = self._get('/books?limit=2&fields=title')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['books'][0], {'_id': 'book-0', 'title': 'Title 0'})
+
+    def test_limit_is_capped(self):
+        status, data = self._get('/books?limit={}'.format(Config.BOOKS_MAX_PAGE_SIZE + 1))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['n_books'], 7)
+        self.assertIsNone(data['next'])
+
+    def test_page_is_cached(self):
+        self._get('/books?limit=2')
+        calls = self.db.mongodb._books_col.calls
+        self._get('/books?limit=2')
+        self.assertEqual(self.db.mongodb._books_col.calls, calls)
+
+    def test_failed_load_is_not_cached(self):
+        self.db.mongodb._books_col.fail_reads(times=2)  # the page and the cache warm-up it starts
+        self.assertEqual(self._get('/books?limit=2')[0], 500)
+        status, data = self._get('/books?limit=2')
+        self.assertEqual(status, 200)
+        self.assertEqual(data['n_books'], 2)
+
+    def test_gzip_body(self):
+        with mock.patch('app.hooks.compression.Config.COMPRESS_MIN_SIZE', 0):
+            for _ in range(2):
+                request, response = self.app.test_client.get('/books?limit=3', headers={'Accept-Encoding': 'gzip'})
+                self.assertEqual(response.headers['content-encoding'], 'gzip')
+                self.assertEqual(json.loads(response.text)['n_books'], 3)
+
+    def test_client_cannot_set_created_at(self):
+        headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+        book = {'title': 'Late', 'authors': ['Author'], 'publisher': 'Publisher'}
+        for extra in ({'createdAt': 1.5}, {'createdAt': 'soon'}, {'_id': 'book-0'}, {'version': 9}):
+            request, response = self.app.test_client.post('/books', json=dict(book, **extra), headers=headers)
+            self.assertEqual(response.status, 400)
+        request, response = self.app.test_client.post('/books', json=book, headers=headers)
+        self.assertEqual(response.status, 201)
+
+        # Every cursor the new book appears in still decodes.
+        url, ids = '/books?limit=3', []
+        while url:
+            status, data = self._get(url)
+            self.assertEqual(status, 200)
+            ids.extend(book['_id'] for book in data['books'])
+            url = '/books?limit=3&after={}'.format(data['next']) if data['next'] else None
+        self.assertEqual(len(ids), 8)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self._get('/books?limit=0')[0], 400)
+        self.assertEqual(self._get('/books?limit=abc')[0], 400)
+        self.assertEqual(self._get('/books?fields=password')[0], 400)
+        self.assertEqual(self._get('/books?after=not-a-cursor')[0], 400)
+        self.assertEqual(self._get('/books?after={}'.format(encode_cursor(1003, 'book-6')))[1]['books'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
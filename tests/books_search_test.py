@@ -0,0 +1,216 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from app.databases.books_search import BooksSearch, InvertedIndex, books_search
+from app.models.book import Book
+from app.utils import jwt_utils
+from config import Config
+from tests.fakes import FakeRedis, create_test_app
+
+
+def _book(book_id, title, authors=(), description=None):
+    return {'_id': book_id, 'title': title, 'authors': list(authors), 'description': description}
+
+
+class InvertedIndexTests(unittest.TestCase):
+    """ Unit testcases for the BM25 index """
+
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(_book('dune', 'Dune', ['Frank Herbert'], 'A desert planet and its spice'))
+        self.index.add(_book('messiah', 'Dune Messiah', ['Frank Herbert'], 'The sequel to Dune'))
+        self.index.add(_book('emma', 'Emma', ['Jane Austen'], 'A comedy of manners, nothing like Dune'))
+
+    def _ids(self, query, limit=10, offset=0):
+        return [book_id for book_id, _ in self.index.search(query, limit, offset)[1]]
+
+    def test_ranking(self):
+        self.assertEqual(self._ids('dune')[-1], 'emma')
+        self.assertEqual(self._ids('herbert spice'), ['dune', 'messiah'])
+        self.assertEqual(self._ids('AUSTEN'), ['emma'])
+        self.assertEqual(self.index.search('zebra', 10), (0, []))
+
+    def test_paging(self):
+        n_matches, hits = self.index.search('dune', limit=2, offset=1)
+        self.assertEqual(n_matches, 3)
+        self.assertEqual([book_id for book_id, _ in hits], self._ids('dune')[1:])
+
+    def test_update_and_remove(self):
+        self.index.add(_book('emma', 'Persuasion', ['Jane Austen']))
+        self.assertEqual(self._ids('emma'), [])
+        self.assertEqual(self._ids('persuasion'), ['emma'])
+        self.assertTrue(self.index.remove('dune'))
+        self.assertFalse(self.index.remove('dune'))
+        self.assertEqual(self._ids('herbert'), ['messiah'])
+        self.assertEqual(len(self.index), 2)
+
+    def test_late_changes_are_ignored(self):
+        self.assertTrue(self.index.add(dict(_book('emma', 'Persuasion'), version=2)))
+        self.assertFalse(self.index.add(dict(_book('emma', 'Emma'), version=1)))
+        self.assertEqual(self._ids('persuasion'), ['emma'])
+        self.index.remove('dune')
+        self.assertFalse(self.index.add(dict(_book('dune', 'Dune'), version=3)))
+        self.assertEqual(self._ids('spice desert'), [])
+        self.assertEqual(len(self.index), 2)
+
+    def test_compact_keeps_results(self):
+        self.index.remove('messiah')
+        before = self.index.search('dune herbert austen', 10)
+        self.index.compact()
+        self.assertEqual(self.index.search('dune herbert austen', 10), before)
+
+
+class BooksSearchTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for keeping the index of every worker current """
+
+    async def test_changes_reach_other_workers(self):
+        r = FakeRedis()
+        worker_a, worker_b = BooksSearch(), BooksSearch()
+        worker_a.ready = worker_b.ready = True
+        listener = asyncio.ensure_future(worker_b.listen(r))
+        await asyncio.sleep(0)
+        await worker_a.add_books(r, [_book('dune', 'Dune')])
+        await asyncio.sleep(0.05)
+        self.assertEqual(worker_b.search('dune', 10)[0], 1)
+        await worker_a.remove_books(r, ['dune'])
+        await asyncio.sleep(0.05)
+        self.assertEqual(worker_b.search('dune', 10)[0], 0)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    async def test_rebuilt_after_a_lost_connection(self):
+        r = FakeRedis()
+        worker_a, worker_b = BooksSearch(), BooksSearch()
+        worker_a.ready = worker_b.ready = True
+        stored = [_book('dune', 'Dune')]
+
+        class DB:
+            async def iter_books(self, batch_size):
+                yield list(stored)
+
+        with mock.patch.object(Config, 'PUBSUB_RETRY_MIN', 0.01):
+            listener = asyncio.ensure_future(worker_b.listen(r, DB()))
+            await asyncio.sleep(0)
+            r.drop_subscribers()
+            await worker_a.add_books(r, stored)  # published to nobody
+            await asyncio.sleep(0.05)
+            self.assertTrue(worker_b.ready)
+            self.assertEqual(worker_b.search('dune', 10)[0], 1)
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    async def test_reset_during_build(self):
+        search = BooksSearch()
+
+        class DB:
+            async def iter_books(self, batch_size):
+                search.reset()
+                yield [_book('dune', 'Dune')]
+
+        await search.build(DB())
+        self.assertFalse(search.ready)
+        self.assertIsNone(search._pending)
+
+    async def test_compaction_runs_off_the_loop_and_replays_changes(self):
+        r = FakeRedis()
+        search = BooksSearch()
+        search.ready = True
+        await search.add_books(r, [_book('book-{}'.format(i), 'Saga part {}'.format(i)) for i in range(2000)])
+        await search.remove_books(r, ['book-{}'.format(i) for i in range(1, 1600)])
+        self.assertIsNotNone(search._compaction)
+        old_index = search.index
+        self.assertGreater(old_index._removed, 0)  # compacted in a copy, not in place
+
+        # Changes made meanwhile are queued, then applied to the compacted index.
+        await search.remove_books(r, ['book-0'])
+        await search.add_books(r, [_book('emma', 'Emma')])
+        self.assertEqual(search.search('saga', 1000)[0], 401)
+        await search._compaction
+        self.assertIsNot(search.index, old_index)
+        self.assertEqual(search.index._removed, 1)
+        self.assertEqual(search.search('saga', 1000)[0], 400)
+        self.assertEqual(search.search('emma', 10)[1][0][0], 'emma')
+
+    async def test_changes_during_build_are_replayed(self):
+        search = BooksSearch()
+        r = FakeRedis()
+
+        class SlowDB:
+            async def iter_books(self, batch_size):
+                await search.remove_books(r, ['dune'])
+                yield [_book('dune', 'Dune'), _book('emma', 'Emma')]
+
+        await search.build(SlowDB())
+        self.assertTrue(search.ready)
+        self.assertEqual(search.search('dune emma', 10)[0], 1)
+
+
+class SearchEndpointTests(unittest.TestCase):
+    """ Unit testcases for GET /books/search """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+        for i in range(5):
+            book = Book('book-{}'.format(i)).from_dict({'title': 'Saga part {}'.format(i), 'owner': 'alice'})
+            self.db.mongodb._books_col.insert_one(book.to_dict())
+        books_search.reset()
+        asyncio.run(books_search.build(self.db))
+
+    def tearDown(self):
+        self.db.close()
+
+    def _search(self, query):
+        request, response = self.app.test_client.get('/books/search?' + query)
+        return response.status, json.loads(response.text) if response.status == 200 else None
+
+    def test_built_at_startup_and_paged(self):
+        status, data = self._search('q=saga&limit=2')
+        self.assertEqual(status, 200)
+        self.assertEqual((data['n_matches'], data['n_books'], data['next']), (5, 2, 2))
+        status, data = self._search('q=saga&limit=2&offset=4')
+        self.assertEqual((data['n_books'], data['next']), (1, None))
+        self.assertEqual(self._search('q=part 3')[1]['books'][0]['_id'], 'book-3')
+
+    def test_follows_writes(self):
+        self.app.test_client.post('/books', headers=self.headers, data=json.dumps(
+            {'title': 'Odyssey', 'authors': ['Homer'], 'publisher': 'Penguin'}
+        ))
+        self.assertEqual(self._search('q=homer')[1]['books'][0]['title'], 'Odyssey')
+
+        self.app.test_client.put('/books/book-1', headers=self.headers, data=json.dumps({'title': 'Iliad'}))
+        self.assertEqual(self._search('q=iliad')[1]['books'][0]['_id'], 'book-1')
+
+        self.app.test_client.delete('/books/book-2', headers=self.headers)
+        status, data = self._search('q=saga')
+        self.assertEqual([book['_id'] for book in data['books']], ['book-0', 'book-3', 'book-4'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self._search('q=')[0], 400)
+        self.assertEqual(self._search('q=saga&offset=-1')[0], 400)
+        self.assertEqual(self._search('q=saga&offset=100000')[0], 400)
+
+    def test_unavailable_while_building(self):
+        books_search.ready = False
+        books_search._pending = []
+        try:
+            self.assertEqual(self._search('q=saga')[0], 503)
+        finally:
+            books_search._pending = None
+
+    def test_failed_build_is_retried(self):
+        books_search.reset()
+        self.db.mongodb._books_col.fail_reads()
+        with self.assertRaises(Exception):
+            asyncio.run(books_search.build(self.db))
+        self.assertFalse(books_search.ready)
+
+        self._search('q=saga')  # starts a new build
+        status, data = self._search('q=saga')
+        self.assertEqual((status, data['n_matches']), (200, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
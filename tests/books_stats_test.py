@@ -0,0 +1,101 @@
+import asyncio
+import json
+import unittest
+
+from app.databases import books_stats
+from app.models.book import Book
+from app.utils import jwt_utils
+from tests.fakes import create_test_app
+
+
+class BooksStatsTests(unittest.TestCase):
+    """ Unit testcases for GET /books/stats and its counters """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+
+    def tearDown(self):
+        self.db.close()
+
+    def _create(self, title, authors, publisher):
+        self.app.test_client.post('/books', headers=self.headers, data=json.dumps(
+            {'title': title, 'authors': authors, 'publisher': publisher}
+        ))
+        return next(doc['_id'] for doc in self.db.mongodb._books_col.docs.values() if doc['title'] == title)
+
+    def _stats(self, query=''):
+        request, response = self.app.test_client.get('/books/stats' + query)
+        self.assertEqual(response.status, 200)
+        return json.loads(response.text)
+
+    def _counts(self, stats, group):
+        return {entry['name']: entry['n_books'] for entry in stats[group]}
+
+    def test_counters_follow_writes(self):
+        dune = self._create('Dune', ['Frank Herbert'], 'Chilton')
+        self._create('Good Omens', ['Terry Pratchett', 'Neil Gaiman'], 'Gollancz')
+        self._create('Mort', ['Terry Pratchett'], 'Gollancz')
+
+        stats = self._stats()
+        self.assertEqual((stats['n_books'], stats['n_authors'], stats['n_publishers']), (3, 3, 2))
+        self.assertEqual(stats['authors'][0], {'name': 'Terry Pratchett', 'n_books': 2})
+        self.assertEqual(self._counts(stats, 'owners'), {'alice': 3})
+
+        self.app.test_client.put('/books/' + dune, headers=self.headers, data=json.dumps({'publisher': 'Gollancz'}))
+        stats = self._stats()
+        self.assertEqual(self._counts(stats, 'publishers'), {'Gollancz': 3})
+
+        self.app.test_client.delete('/books/' + dune, headers=self.headers)
+        stats = self._stats('?limit=1')
+        self.assertEqual((stats['n_books'], stats['n_authors']), (2, 2))
+        self.assertEqual(stats['authors'], [{'name': 'Terry Pratchett', 'n_books': 2}])
+
+    def test_bulk_writes(self):
+        body = json.dumps([{'title': str(i), 'authors': ['A{}'.format(i % 2)], 'publisher': 'P'} for i in range(4)])
+        self.app.test_client.post('/books/bulk', headers=self.headers, data=body)
+        self.assertEqual(self._counts(self._stats(), 'authors'), {'A0': 2, 'A1': 2})
+
+        self.app.test_client.request('/books/bulk', http_method='patch', headers=self.headers,
+                                     content=json.dumps({'owner': 'alice', 'update': {'authors': ['B']}}))
+        self.assertEqual(self._counts(self._stats(), 'authors'), {'B': 4})
+
+        self.app.test_client.request('/books/bulk', http_method='delete', headers=self.headers,
+                                     content=json.dumps({'owner': 'alice'}))
+        stats = self._stats()
+        self.assertEqual((stats['n_books'], stats['authors'], stats['owners']), (0, [], []))
+
+    def test_read_does_not_touch_mongo(self):
+        self._create('Dune', ['Frank Herbert'], 'Chilton')
+        calls = self.db.mongodb._books_col.calls
+        self._stats()
+        self.assertEqual(self.db.mongodb._books_col.calls, calls)
+
+    def test_reconcile_repairs_drift(self):
+        self._create('Dune', ['Frank Herbert'], 'Chilton')
+        self.db.mongodb._books_col.insert_one(
+            Book('direct').from_dict({'title': 'Emma', 'authors': ['Jane Austen'], 'owner': 'bob'}).to_dict()
+        )
+        asyncio.run(self.redis.zincrby('stats:books:publisher', 5, 'Ghost'))
+
+        drift = asyncio.run(books_stats.reconcile_stats(self.redis, self.db))
+        self.assertEqual(drift['n_books'], 1)
+        self.assertEqual(drift['publishers'], {'Ghost': -5})
+        stats = self._stats()
+        self.assertEqual(self._counts(stats, 'owners'), {'alice': 1, 'bob': 1})
+        self.assertEqual(self._counts(stats, 'publishers'), {'Chilton': 1})
+        self.assertEqual(asyncio.run(books_stats.reconcile_stats(self.redis, self.db)), {})
+
+    def test_reconcile_keeps_counters_when_a_read_fails(self):
+        self._create('Dune', ['Frank Herbert'], 'Chilton')
+        for i in range(3):
+            self.db.mongodb._books_col.insert_one(Book('direct-{}'.format(i)).from_dict({'title': str(i)}).to_dict())
+        self.db.mongodb._books_col.fail_reads(after=1)
+
+        with self.assertRaises(Exception):
+            asyncio.run(books_stats.reconcile_stats(self.redis, self.db, batch_size=2))
+        self.assertEqual(self._stats()['n_books'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
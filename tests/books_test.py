@@ -3,7 +3,17 @@ import json
 import unittest
 from tests import test_constants
 from app.databases.mongodb import MongoDB
-_db = MongoDB()
+
+
+def _any_book_id():
+    """Id of some book in the database; the client is opened here rather than when the module is imported."""
+    db = MongoDB()
+    try:
+        return db.get_books(filter_={})[0]._id
+    finally:
+        db.client.close()
+
+
 class BooksTests(unittest.TestCase):
     """ Unit testcases for REST APIs """
 
@@ -81,8 +91,7 @@ class BooksTests(unittest.TestCase):
         body = json.dumps({
             "title": "Test"
         })
-        book = _db.get_book({})
-        book_id = book.get("_id")
+        book_id = _any_book_id()
 
         request_user, response_user = app.test_client.post('/books/login', data=user)
         data = json.loads(response_user.text)
@@ -129,8 +138,7 @@ class BooksTests(unittest.TestCase):
         self.assertIsInstance(data_response.get('book'), object)
 
     def test_delete_book_no_login(self):
-        book = _db.get_book({})
-        book_id = book.get("_id")
+        book_id = _any_book_id()
         headers = {'Authorization': ''}
         request, response = app.test_client.delete('/books/{}'.format(book_id), headers=headers)
         self.assertEqual(response.status, 401)
@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from app.models.book import Book
+from app.utils import jwt_utils
+from tests.fakes import create_test_app
+
+
+class BooksConditionalWriteTests(unittest.TestCase):
+    """ Unit testcases for PUT and DELETE /books/<book_id> with ownership and If-Match """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.books_col = self.db.mongodb._books_col
+        book = Book('book-1').from_dict({'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'})
+        book.owner = 'alice'
+        self.books_col.insert_one(book.to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    @staticmethod
+    def _headers(username='alice', if_match=None):
+        headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt(username)}
+        if if_match:
+            headers['If-Match'] = if_match
+        return headers
+
+    def _put(self, book_id='book-1', **kwargs):
+        request, response = self.app.test_client.put(
+            '/books/{}'.format(book_id), headers=self._headers(**kwargs), data=json.dumps({'title': 'Dune Messiah'})
+        )
+        return response
+
+    def _delete(self, book_id='book-1', **kwargs):
+        request, response = self.app.test_client.delete('/books/{}'.format(book_id), headers=self._headers(**kwargs))
+        return response
+
+    def test_update_is_one_round_trip(self):
+        calls = self.books_col.calls
+        response = self._put()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(self.books_col.calls - calls, 1)
+        self.assertEqual(response.headers['etag'], '"v1"')
+        self.assertEqual(self.books_col.docs['book-1']['version'], 1)
+
+        request, response = self.app.test_client.get('/books/book-1', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.headers['etag'], '"v1"')
+        self.assertEqual(json.loads(response.text)['title'], 'Dune Messiah')
+
+    def test_if_match(self):
+        self.assertEqual(self._put(if_match='"v1"').status, 409)
+        self.assertEqual(self.books_col.docs['book-1']['title'], 'Dune')
+        self.assertEqual(self._put(if_match='"v0"').status, 200)
+        self.assertEqual(self._put(if_match='W/"v1"').status, 409)
+        self.assertEqual(self._put(if_match='"v3", "v1-gzip"').status, 200)
+        self.assertEqual(self._put(if_match='*').status, 200)
+
+    def test_if_match_on_book_without_version(self):
+        del self.books_col.docs['book-1']['version']
+        self.assertEqual(self._put(if_match='"v0"').status, 200)
+
+    def test_update_errors(self):
+        self.assertEqual(self._put(username='bob').status, 403)
+        self.assertEqual(self._put(book_id='nope').status, 404)
+        self.assertEqual(self.books_col.docs['book-1']['title'], 'Dune')
+
+    def test_delete(self):
+        self.assertEqual(self._delete(username='bob').status, 403)
+        self.assertEqual(self._delete(if_match='"v5"').status, 409)
+        calls = self.books_col.calls
+        self.assertEqual(self._delete(if_match='"v0"').status, 200)
+        self.assertEqual(self.books_col.calls - calls, 1)
+        self.assertEqual(self._delete().status, 404)
+
+        request, response = self.app.test_client.get('/books/book-1')
+        self.assertEqual(response.status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
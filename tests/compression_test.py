@@ -0,0 +1,65 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from app.hooks import compression
+from app.models.book import Book
+from tests.fakes import create_test_app
+
+
+class AcceptEncodingTests(unittest.TestCase):
+    """ Unit testcases for Accept-Encoding negotiation """
+
+    def _accepted(self, header):
+        return compression.accepted_encodings(SimpleNamespace(headers={'accept-encoding': header}))
+
+    def test_negotiation(self):
+        self.assertEqual(self._accepted('gzip, deflate'), ['gzip'])
+        self.assertEqual(self._accepted('identity'), [])
+        self.assertEqual(self._accepted('gzip;q=0'), [])
+        self.assertEqual(self._accepted('*'), sorted(compression.ENCODERS, key=lambda name: name != 'br'))
+
+
+class CompressResponseTests(unittest.TestCase):
+    """ Unit testcases for the response compression middleware """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        books_col = self.db.mongodb._books_col
+        for i in range(50):
+            books_col.insert_one(Book('book-{:02d}'.format(i)).from_dict({'title': 'Title {}'.format(i)}).to_dict())
+
+    def tearDown(self):
+        self.db.close()
+
+    def _get(self, url, encoding):
+        request, response = self.app.test_client.get(url, headers={'Accept-Encoding': encoding})
+        return response
+
+    def test_large_body_is_compressed_once(self):
+        with mock.patch.dict(compression.ENCODERS, {'gzip': mock.Mock(wraps=compression._gzip)}):
+            for _ in range(3):
+                response = self._get('/books?limit=50', 'gzip')
+                self.assertEqual(response.headers['content-encoding'], 'gzip')
+                self.assertTrue(response.headers['etag'].endswith('-gzip"'))
+                self.assertEqual(json.loads(response.text)['n_books'], 50)
+            self.assertEqual(compression.ENCODERS['gzip'].call_count, 1)
+
+    def test_small_body_is_not_compressed(self):
+        response = self._get('/books?limit=1&fields=title', 'gzip')
+        self.assertNotIn('content-encoding', response.headers)
+
+    def test_identity(self):
+        response = self._get('/books?limit=50', 'identity')
+        self.assertNotIn('content-encoding', response.headers)
+        self.assertEqual(response.headers['vary'], 'Accept-Encoding')
+
+    def test_export_stream_is_left_alone(self):
+        response = self._get('/books/export', 'gzip')
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertEqual(len(response.text.splitlines()), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
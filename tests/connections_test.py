@@ -0,0 +1,152 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+from sanic import Sanic
+from sanic.response import json as json_response
+
+from app import register_listeners
+from app.databases import connections
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from tests.fakes import FakeMongoClient, FakeRedis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The production app (create_app with ProductionConfig) on the in-memory stand-ins, opened by the
+# real listeners in each worker. Every worker gets a user alice/secret.
+SERVER = '''
+import sys
+
+from app import create_app
+from app.apis import api
+from app.databases import connections
+from app.databases.mongodb import AsyncMongoDB, MongoDB
+from app.utils.password_utils import hash_password
+from config import Config, ProductionConfig
+from tests.fakes import FakeMongoClient, FakeRedis
+
+
+def connect_mongodb():
+    db = AsyncMongoDB(MongoDB(client=FakeMongoClient()))
+    db.mongodb._users_col.insert_one({'username': 'alice', 'password': hash_password('secret')})
+    return db
+
+
+connections.connect_mongodb = connect_mongodb
+connections.connect_redis = lambda url: FakeRedis()
+app = create_app(Config, ProductionConfig)
+app.blueprint(api)
+app.run(**dict(app.config['RUN_SETTING'], host='127.0.0.1', port=int(sys.argv[1]), access_log=False))
+'''
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ConnectionsTests(unittest.TestCase):
+    """ Unit testcases for the MongoDB and Redis clients each worker opens and closes """
+
+    def setUp(self):
+        self.opened = []
+
+        def connect_mongodb():
+            db = AsyncMongoDB(MongoDB(client=FakeMongoClient()), max_workers=2)
+            self.opened.append(db)
+            return db
+
+        def connect_redis(url):
+            redis = FakeRedis()
+            self.opened.append(redis)
+            return redis
+
+        for name, fn in (('connect_mongodb', connect_mongodb), ('connect_redis', connect_redis)):
+            patcher = mock.patch.object(connections, name, fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_opened_per_start_and_closed_on_stop(self):
+        app = Sanic('connections_test_app')
+        app.config.REDIS = 'redis://stand-in'
+        register_listeners(app)
+
+        @app.get('/clients')
+        async def clients(request):
+            return json_response({'db': id(request.app.ctx.db), 'redis': id(request.app.ctx.redis)})
+
+        # The test client starts and stops a server per request, as a worker would.
+        seen = [json.loads(app.test_client.get('/clients')[1].text) for _ in range(2)]
+        self.assertNotEqual(seen[0], seen[1])
+        self.assertEqual(len(self.opened), 4)
+        for db, redis in (self.opened[:2], self.opened[2:]):
+            self.assertTrue(db.mongodb.client.closed)
+            self.assertTrue(redis.closed)
+            self.assertTrue(redis.connection_pool.disconnected)
+
+    def test_production_workers(self):
+        probe = 'from config import ProductionConfig; print(ProductionConfig.RUN_SETTING["workers"])'
+        for env, expected in (({'SERVER_WORKERS': '3'}, '3'), ({'SERVER_WORKERS': ''}, str(os.cpu_count() or 1))):
+            out = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=dict(os.environ, **env),
+                                 capture_output=True, text=True, check=True)
+            self.assertEqual(out.stdout.strip(), expected)
+
+
+class MultiWorkerSmokeTests(unittest.TestCase):
+    """ Smoke test of the production profile: two worker processes serving the auth routes """
+
+    def setUp(self):
+        self.port = _free_port()
+        env = dict(os.environ, SERVER_WORKERS='2', PASSWORD_SCRYPT_N=str(2 ** 8), LOG_LEVEL='WARNING')
+        self.server = subprocess.Popen([sys.executable, '-c', SERVER, str(self.port)], cwd=ROOT, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.addCleanup(self._stop)
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                urllib.request.urlopen(self._url('/books/stats'), timeout=1)
+                return
+            except (urllib.error.URLError, ConnectionError):
+                if time.monotonic() > deadline or self.server.poll() is not None:
+                    self.fail('server did not start: {}'.format(self.server.stderr.read().decode()[-2000:]))
+                time.sleep(0.2)
+
+    def _stop(self):
+        self.server.send_signal(signal.SIGINT)
+        try:
+            self.server.wait(10)
+        except subprocess.TimeoutExpired:
+            self.server.kill()
+            self.server.wait()
+        self.server.stderr.close()
+
+    def _url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.port, path)
+
+    def _post(self, path, body):
+        request = urllib.request.Request(self._url(path), data=json.dumps(body).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as ex:
+            return ex.code
+
+    def test_register_and_login(self):
+        # Enough requests that both workers serve some.
+        for i in range(6):
+            self.assertEqual(self._post('/books/register', {'username': 'user{}'.format(i), 'password': 'pw'}), 200)
+            self.assertEqual(self._post('/books/login', {'username': 'alice', 'password': 'secret'}), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+
+from app.models.book import Book
+from app.utils import jwt_utils
+from tests.fakes import create_test_app
+
+
+class ETagTests(unittest.TestCase):
+    """ Unit testcases for conditional GET on /books and /books/<book_id> """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.books_col = self.db.mongodb._books_col
+        book = Book('book-1').from_dict({'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'})
+        book.owner = 'alice'
+        self.books_col.insert_one(book.to_dict())
+        self.headers = {'Authorization': 'Bearer {}'.format(jwt_utils.generate_jwt('alice'))}
+
+    def tearDown(self):
+        self.db.close()
+
+    def _get(self, url, etag=None):
+        headers = {'Accept-Encoding': 'identity'}
+        if etag:
+            headers['If-None-Match'] = etag
+        request, response = self.app.test_client.get(url, headers=headers)
+        return response
+
+    def _assert_conditional(self, url):
+        etag = self._get(url).headers['etag']
+        calls = self.books_col.calls
+        response = self._get(url, etag=etag)
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.body, b'')
+        self.assertEqual(self.books_col.calls, calls)
+        return etag
+
+    def test_books_not_modified_until_write(self):
+        etag = self._assert_conditional('/books?limit=10')
+        self.app.test_client.post('/books', headers=self.headers, data=json.dumps(
+            {'title': 'Emma', 'authors': ['Jane Austen'], 'publisher': 'John Murray'}
+        ))
+        response = self._get('/books?limit=10', etag=etag)
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers['etag'], etag)
+
+    def test_book_not_modified_until_update(self):
+        etag = self._assert_conditional('/books/book-1')
+        self.app.test_client.put('/books/book-1', headers=self.headers, data=json.dumps({'title': 'Dune Messiah'}))
+        response = self._get('/books/book-1', etag=etag)
+        self.assertEqual(response.status, 200)
+        self.assertNotEqual(response.headers['etag'], etag)
+
+    def test_unknown_book_has_no_etag(self):
+        response = self._get('/books/nope', etag='*')
+        self.assertEqual(response.status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
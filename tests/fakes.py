@@ -0,0 +1,698 @@
+"""In-process stand-ins for the external services, used by the unit tests and benchmarks."""
+import asyncio
+import copy
+import math
+import time
+
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError, OperationFailure
+
+
+def _get_field(doc, path):
+    value = doc
+    for part in path.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _compare(value, op, operand):
+    values = value if isinstance(value, list) else [value]
+    if op == '$eq':
+        return operand in values or value == operand
+    if op == '$ne':
+        return not _compare(value, '$eq', operand)
+    if op == '$in':
+        return any(_compare(value, '$eq', item) for item in operand)
+    if op == '$nin':
+        return not _compare(value, '$in', operand)
+    if op == '$exists':
+        return (value is not None) == bool(operand)
+    checks = {
+        '$gt': lambda a: a > operand,
+        '$gte': lambda a: a >= operand,
+        '$lt': lambda a: a < operand,
+        '$lte': lambda a: a <= operand,
+    }
+    return any(v is not None and type(v) is type(operand) and checks[op](v) for v in values)
+
+
+def matches(doc, filter_):
+    for key, condition in (filter_ or {}).items():
+        if key == '$or':
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == '$and':
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+            value = _get_field(doc, key)
+            if not all(_compare(value, op, operand) for op, operand in condition.items()):
+                return False
+        elif not _compare(_get_field(doc, key), '$eq', condition):
+            return False
+    return True
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    include = {k for k, v in projection.items() if v}
+    if include:
+        keys = include | ({'_id'} if projection.get('_id', 1) else set())
+        return {k: copy.deepcopy(v) for k, v in doc.items() if k in keys}
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in projection}
+
+
+def _apply_update(doc, update):
+    doc.update(copy.deepcopy(update.get('$set', {})))
+    for field, amount in update.get('$inc', {}).items():
+        doc[field] = doc.get(field, 0) + amount
+
+
+class _Result:
+    def __init__(self, **kwargs):
+        self.acknowledged = True
+        self.__dict__.update(kwargs)
+
+
+class FakeCursor:
+    def __init__(self, collection, filter_, projection):
+        self._collection = collection
+        self._filter = filter_
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=1):
+        self._sort = key_or_list if isinstance(key_or_list, list) else [(key_or_list, direction)]
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, _size):
+        return self
+
+    def explain(self):
+        """A winning plan shaped like the server's: an index scan when an index leads with a filtered or sorted field."""
+        indexes = self._collection.indexes.values()
+        if '$text' in (self._filter or {}):
+            if not any('text' in dict(index['key']).values() for index in indexes):
+                raise OperationFailure('text index required for $text query')
+            plan = {'stage': 'TEXT_MATCH', 'inputStage': {'stage': 'IXSCAN'}}
+        else:
+            leading = {index['key'][0][0] for index in indexes if index['key'][0][1] != 'text'}
+
+            def indexed(filter_):
+                # Like the server, an $or only uses indexes when every branch can.
+                return any(all(indexed(sub) for sub in value) if key == '$or' else key in leading
+                           for key, value in filter_.items())
+
+            if indexed(self._filter or {}) or (self._sort and self._sort[0][0] in leading):
+                plan = {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}
+            else:
+                plan = {'stage': 'COLLSCAN'}
+        if self._sort and plan['stage'] == 'COLLSCAN':
+            plan = {'stage': 'SORT', 'inputStage': plan}
+        return {'queryPlanner': {'winningPlan': plan}}
+
+    def __iter__(self):
+        self._collection._wait()
+        docs = [doc for doc in self._collection.docs.values() if matches(doc, self._filter)]
+        for field, direction in reversed(self._sort or []):
+            docs.sort(key=lambda d: (_get_field(d, field) is not None, _get_field(d, field)), reverse=direction < 0)
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([_project(doc, self._projection) for doc in docs])
+
+
+class FakeCollection:
+    """A dict-backed collection speaking the subset of pymongo the data layer uses.
+
+    ``latency`` seconds are slept (blocking) on each operation to mimic a network round trip.
+    """
+
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.docs = {}
+        self.calls = 0
+        self.indexes = {'_id_': {'key': [('_id', 1)]}}
+        self._failures = []
+
+    def fail_reads(self, times=1, after=0):
+        """Make ``find`` raise ``AutoReconnect`` ``times`` times, once ``after`` more calls have succeeded."""
+        self._failures = [False] * after + [True] * times
+
+    def _wait(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # Index calls are not counted in ``calls``: the test servers ensure indexes on every start.
+    def index_information(self):
+        return copy.deepcopy(self.indexes)
+
+    def create_index(self, keys, name=None, **options):
+        name = name or '_'.join('{}_{}'.format(field, direction) for field, direction in keys)
+        self.indexes[name] = dict(options, key=list(keys))
+        return name
+
+    def find(self, filter_=None, projection=None, sort=None, limit=0):
+        if self._failures and self._failures.pop(0):
+            raise AutoReconnect('connection to the fake server lost')
+        cursor = FakeCursor(self, filter_, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.limit(limit)
+
+    def find_one(self, filter_=None, projection=None):
+        return next(iter(self.find(filter_, projection, limit=1)), None)
+
+    def count_documents(self, filter_):
+        return len(list(self.find(filter_)))
+
+    def insert_one(self, doc):
+        self._wait()
+        doc = copy.deepcopy(doc)
+        if doc.get('_id') in self.docs:
+            raise DuplicateKeyError('duplicate key: {}'.format(doc.get('_id')))
+        for name, index in self.indexes.items():
+            fields = [field for field, _ in index['key']]
+            if index.get('unique') and any(
+                all(_get_field(other, field) == _get_field(doc, field) for field in fields) for other in self.docs.values()
+            ):
+                raise DuplicateKeyError('duplicate key in index {}'.format(name))
+        doc.setdefault('_id', 'oid-{}'.format(len(self.docs) + 1))
+        self.docs[doc['_id']] = doc
+        return _Result(inserted_id=doc['_id'])
+
+    def insert_many(self, docs, ordered=True):
+        self._wait()
+        inserted_ids, errors = [], []
+        for index, doc in enumerate(docs):
+            doc = copy.deepcopy(doc)
+            if doc.get('_id') in self.docs:
+                errors.append({'index': index, 'code': 11000, 'errmsg': 'duplicate key: {}'.format(doc['_id'])})
+                if ordered:
+                    break
+                continue
+            doc.setdefault('_id', 'oid-{}'.format(len(self.docs) + 1))
+            self.docs[doc['_id']] = doc
+            inserted_ids.append(doc['_id'])
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(inserted_ids)})
+        return _Result(inserted_ids=inserted_ids)
+
+    def update_one(self, filter_, update):
+        return self._update(filter_, update, many=False)
+
+    def update_many(self, filter_, update):
+        return self._update(filter_, update, many=True)
+
+    def _update(self, filter_, update, many):
+        self._wait()
+        matched = [doc for doc in self.docs.values() if matches(doc, filter_)]
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            _apply_update(doc, update)
+        return _Result(matched_count=len(matched), modified_count=len(matched))
+
+    def find_one_and_update(self, filter_, update, projection=None, return_document=False):
+        self._wait()
+        doc = next((doc for doc in self.docs.values() if matches(doc, filter_)), None)
+        if doc is None:
+            return None
+        before = _project(doc, projection)
+        _apply_update(doc, update)
+        return _project(doc, projection) if return_document else before
+
+    def find_one_and_delete(self, filter_, projection=None):
+        self._wait()
+        doc = next((doc for doc in self.docs.values() if matches(doc, filter_)), None)
+        if doc is None:
+            return None
+        del self.docs[doc['_id']]
+        return _project(doc, projection)
+
+    def delete_one(self, filter_):
+        return self._delete(filter_, many=False)
+
+    def delete_many(self, filter_):
+        return self._delete(filter_, many=True)
+
+    def _delete(self, filter_, many):
+        self._wait()
+        matched = [key for key, doc in self.docs.items() if matches(doc, filter_)]
+        if not many:
+            matched = matched[:1]
+        for key in matched:
+            del self.docs[key]
+        return _Result(deleted_count=len(matched))
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, latency=self.latency)
+        return self.collections[name]
+
+
+class FakeMongoClient:
+    """Drop-in for ``pymongo.MongoClient`` when building :class:`app.databases.mongodb.MongoDB`."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.databases = {}
+        self.closed = False
+
+    def __getitem__(self, name):
+        if name not in self.databases:
+            self.databases[name] = FakeDatabase(latency=self.latency)
+        return self.databases[name]
+
+    def close(self):
+        self.closed = True
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (int, float)):
+        value = repr(value)
+    return str(value).encode()
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self._redis = redis
+        self._queue = asyncio.Queue()
+        self.channels = set()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+        self._redis.subscribers.append(self)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+        if not self.channels and self in self._redis.subscribers:
+            self._redis.subscribers.remove(self)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def reset(self):
+        await self.unsubscribe(*self.channels)
+
+
+class FakePipeline:
+    """Queues commands like ``redis.pipeline()`` and runs them in order on ``execute``."""
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._redis, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        commands, self._commands = self._commands, []
+        return [await method(*args, **kwargs) for method, args, kwargs in commands]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+
+class FakeConnectionPool:
+    def __init__(self):
+        self.disconnected = False
+
+    async def disconnect(self):
+        self.disconnected = True
+
+
+class FakeRedis:
+    """Async, in-process stand-in for the ``aioredis`` client stored on ``app.ctx.redis``.
+
+    Values come back as ``bytes`` like a client created without ``decode_responses``.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.subscribers = []
+        self.calls = 0
+        self.connection_pool = FakeConnectionPool()
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def drop_subscribers(self):
+        """Break every subscription, as a lost connection would: the next ``get_message`` raises."""
+        subscribers, self.subscribers = self.subscribers, []
+        for pubsub in subscribers:
+            pubsub._queue.put_nowait(ConnectionError('Connection closed by server.'))
+
+    async def publish(self, channel, message):
+        receivers = [pubsub for pubsub in self.subscribers if channel in pubsub.channels]
+        for pubsub in receivers:
+            pubsub._queue.put_nowait({'type': 'message', 'channel': _to_bytes(channel), 'data': _to_bytes(message)})
+        return len(receivers)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    def _alive(self, key):
+        self.calls += 1
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    async def get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    async def mget(self, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys, *args]
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None, px=None, nx=False):
+        if nx and self._alive(key):
+            return None
+        self._alive(key)
+        self.data[key] = _to_bytes(value)
+        self.expires.pop(key, None)
+        if ex or px:
+            self.expires[key] = time.monotonic() + (ex if ex else px / 1000)
+        return True
+
+    async def delete(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return deleted
+
+    async def exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key))
+
+    async def expire(self, key, seconds):
+        if not self._alive(key):
+            return False
+        self.expires[key] = time.monotonic() + seconds
+        return True
+
+    async def incr(self, key, amount=1):
+        return await self.incrby(key, amount)
+
+    async def incrby(self, key, amount=1):
+        value = int(self.data[key]) + amount if self._alive(key) else amount
+        self.data[key] = _to_bytes(value)
+        return value
+
+    async def rename(self, src, dst):
+        self._alive(src)
+        self.data[dst] = self.data.pop(src)
+        self.expires.pop(dst, None)
+        if src in self.expires:
+            self.expires[dst] = self.expires.pop(src)
+        return True
+
+    def _container(self, key, factory):
+        if not self._alive(key):
+            self.data[key] = factory()
+        return self.data[key]
+
+    def _cleanup(self, key):
+        if not self.data.get(key):
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    # scripts
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        """Run the Python twin of ``script``; only the scripts in :func:`_scripts` are known."""
+        twin = _scripts().get(script)
+        if twin is None:
+            raise NotImplementedError('no stand-in for this script')
+        return await twin(self, list(keys_and_args[:numkeys]), list(keys_and_args[numkeys:]))
+
+    # hashes
+
+    async def hset(self, name, key=None, value=None, mapping=None):
+        items = dict(mapping or {})
+        if key is not None:
+            items[key] = value
+        hash_ = self._container(name, dict)
+        added = sum(1 for field in items if _to_bytes(field) not in hash_)
+        hash_.update({_to_bytes(field): _to_bytes(v) for field, v in items.items()})
+        return added
+
+    async def hget(self, name, key):
+        return self.data[name].get(_to_bytes(key)) if self._alive(name) else None
+
+    async def hmget(self, name, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys, *args]
+        hash_ = self.data[name] if self._alive(name) else {}
+        return [hash_.get(_to_bytes(key)) for key in keys]
+
+    async def hgetall(self, name):
+        return dict(self.data[name]) if self._alive(name) else {}
+
+    async def hdel(self, name, *keys):
+        if not self._alive(name):
+            return 0
+        deleted = sum(1 for key in keys if self.data[name].pop(_to_bytes(key), None) is not None)
+        self._cleanup(name)
+        return deleted
+
+    async def hincrby(self, name, key, amount=1):
+        hash_ = self._container(name, dict)
+        value = int(hash_.get(_to_bytes(key), 0)) + amount
+        hash_[_to_bytes(key)] = _to_bytes(value)
+        return value
+
+    async def hincrbyfloat(self, name, key, amount=1.0):
+        hash_ = self._container(name, dict)
+        value = float(hash_.get(_to_bytes(key), 0)) + amount
+        hash_[_to_bytes(key)] = _to_bytes(value)
+        return value
+
+    async def hlen(self, name):
+        return len(self.data[name]) if self._alive(name) else 0
+
+    # sets
+
+    async def sadd(self, name, *values):
+        set_ = self._container(name, set)
+        added = sum(1 for value in values if _to_bytes(value) not in set_)
+        set_.update(_to_bytes(value) for value in values)
+        return added
+
+    async def srem(self, name, *values):
+        if not self._alive(name):
+            return 0
+        removed = sum(1 for value in values if _to_bytes(value) in self.data[name])
+        self.data[name].difference_update(_to_bytes(value) for value in values)
+        self._cleanup(name)
+        return removed
+
+    async def smembers(self, name):
+        return set(self.data[name]) if self._alive(name) else set()
+
+    # sorted sets
+
+    def _ordered(self, name):
+        zset = self.data[name] if self._alive(name) else {}
+        return sorted(zset.items(), key=lambda item: (item[1], item[0]))
+
+    async def zadd(self, name, mapping):
+        zset = self._container(name, dict)
+        added = sum(1 for member in mapping if _to_bytes(member) not in zset)
+        zset.update({_to_bytes(member): float(score) for member, score in mapping.items()})
+        return added
+
+    async def zrem(self, name, *members):
+        if not self._alive(name):
+            return 0
+        removed = sum(1 for member in members if self.data[name].pop(_to_bytes(member), None) is not None)
+        self._cleanup(name)
+        return removed
+
+    async def zincrby(self, name, amount, member):
+        zset = self._container(name, dict)
+        zset[_to_bytes(member)] = zset.get(_to_bytes(member), 0.0) + amount
+        return zset[_to_bytes(member)]
+
+    async def zremrangebyscore(self, name, min, max):
+        members = await self.zrangebyscore(name, min, max)
+        return await self.zrem(name, *members) if members else 0
+
+    async def zscore(self, name, member):
+        return self.data[name].get(_to_bytes(member)) if self._alive(name) else None
+
+    async def zcard(self, name):
+        return len(self.data[name]) if self._alive(name) else 0
+
+    async def zrank(self, name, member):
+        for rank, (item, _) in enumerate(self._ordered(name)):
+            if item == _to_bytes(member):
+                return rank
+        return None
+
+    async def zrange(self, name, start, end, desc=False, withscores=False):
+        items = self._ordered(name)
+        if desc:
+            items.reverse()
+        end = len(items) if end == -1 else end + 1
+        items = items[start:end]
+        return items if withscores else [member for member, _ in items]
+
+    async def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        def bound(value):
+            value = str(value)
+            if value in ('-inf', '+inf'):
+                return float(value), False
+            if value.startswith('('):
+                return float(value[1:]), True
+            return float(value), False
+
+        (low, low_open), (high, high_open) = bound(min), bound(max)
+        items = [
+            (member, score) for member, score in self._ordered(name)
+            if (score > low if low_open else score >= low) and (score < high if high_open else score <= high)
+        ]
+        if start is not None:
+            items = items[start:start + num]
+        return items if withscores else [member for member, _ in items]
+
+
+async def _token_bucket(redis, keys, args):
+    # app.decorators.admission.TOKEN_BUCKET_SCRIPT, step for step.
+    key, (rate, burst) = keys[0], (float(args[0]), float(args[1]))
+    now = time.time()
+    tokens, updated = await redis.hmget(key, 'tokens', 'updated')
+    tokens = burst if tokens is None else min(burst, float(tokens) + max(0.0, now - float(updated)) * rate)
+    allowed, wait = 0, 0.0
+    if tokens >= 1:
+        allowed, tokens = 1, tokens - 1
+    else:
+        wait = (1 - tokens) / rate
+    await redis.hset(key, mapping={'tokens': repr(tokens), 'updated': repr(now)})
+    await redis.expire(key, (math.ceil(burst / rate * 1000) + 1000) / 1000)
+    return [allowed, _to_bytes(repr(wait))]
+
+
+async def _put_books(redis, keys, args):
+    # app.databases.books_cache.PUT_BOOKS_SCRIPT, step for step.
+    data, index, versions, removed = keys
+    written = 0
+    for i in range(0, len(args), 4):
+        book_id, version, created_at, value = args[i:i + 4]
+        cached = await redis.hget(versions, book_id)
+        if await redis.zscore(removed, book_id) is None and (cached is None or int(cached) < int(version)):
+            await redis.hset(data, book_id, value)
+            await redis.zadd(index, {book_id: created_at})
+            await redis.hset(versions, book_id, version)
+            written += 1
+    return written
+
+
+async def _remove_books(redis, keys, args):
+    # app.databases.books_cache.REMOVE_BOOKS_SCRIPT, step for step.
+    data, index, versions, removed = keys
+    now = time.time()
+    for book_id in args[1:]:
+        await redis.hdel(data, book_id)
+        await redis.zrem(index, book_id)
+        await redis.hdel(versions, book_id)
+        await redis.zadd(removed, {book_id: now})
+    await redis.zremrangebyscore(removed, '-inf', now - float(args[0]))
+    return len(args) - 1
+
+
+def _scripts():
+    from app.databases import books_cache
+    from app.decorators import admission
+
+    return {
+        admission.TOKEN_BUCKET_SCRIPT: _token_bucket,
+        books_cache.PUT_BOOKS_SCRIPT: _put_books,
+        books_cache.REMOVE_BOOKS_SCRIPT: _remove_books,
+    }
+
+
+_test_app = None
+
+
+def create_test_app(latency=0.0):
+    """The books blueprint mounted on a throwaway Sanic app, backed by fresh in-memory stand-ins.
+
+    Returns ``(app, db, redis)`` where ``db`` is the :class:`AsyncMongoDB` the handlers use.
+    """
+    global _test_app
+    from sanic import Sanic
+
+    from app import register_hooks
+    from app.apis import books_blueprint
+    from app.apis.metrics_blueprint import metrics_bp
+    from app.apis.profiles_blueprint import profiles_bp
+    from app.databases.mongodb import AsyncMongoDB, MongoDB
+    from app.databases.books_search import books_search
+    from app.databases.redis_cached import cache
+    from app.utils import metrics, request_timing
+
+    if _test_app is None:
+        Sanic.test_mode = True
+        _test_app = Sanic('books_test_app', dumps=request_timing.dumps)
+        _test_app.blueprint(books_blueprint.books_bp)
+        _test_app.blueprint(metrics_bp)
+        _test_app.blueprint(profiles_bp)
+        register_hooks(_test_app)
+
+    db = AsyncMongoDB(MongoDB(client=FakeMongoClient(latency=latency)), max_workers=4)
+    redis = FakeRedis()
+    _test_app.ctx.db = db
+    _test_app.ctx.redis = redis
+    cache.clear()
+    metrics.registry.reset()
+    books_search.reset()
+    # The new collection is empty, and so is the index: nothing to build.
+    books_search.ready = True
+    return _test_app, db, redis
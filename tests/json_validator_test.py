@@ -0,0 +1,65 @@
+import unittest
+
+from jsonschema import ValidationError, validate
+from sanic.request import Request
+
+from app.decorators.json_validator import validate_with_jsonschema
+from app.hooks.error import ApiBadRequest
+from app.models.book import create_book_json_schema, login_json_schema, update_book_json_schema
+
+
+def _request(body):
+    request = Request.__new__(Request)
+    request.parsed_json = body
+    request.body = b''
+    return request
+
+
+class JsonValidatorTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for validate_with_jsonschema """
+
+    BODIES = [
+        None,
+        {},
+        {'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'},
+        {'title': 1, 'authors': ['Frank Herbert'], 'publisher': 'Chilton'},
+        {'title': 'Dune', 'authors': 'Frank Herbert', 'publisher': 'Chilton'},
+        {'username': 'alice', 'password': 'secret'},
+        {'username': 'alice', 'password': 'secret', 'role': 'admin'},
+        {'pages': 412},
+    ]
+
+    async def test_messages_match_jsonschema_validate(self):
+        for schema in (create_book_json_schema, update_book_json_schema, login_json_schema):
+            @validate_with_jsonschema(schema)
+            async def handler(request):
+                return 'ok'
+
+            for body in self.BODIES:
+                try:
+                    validate(body, schema)
+                    expected = None
+                except ValidationError as ex:
+                    expected = 'Bad Request: ' + ex.message
+
+                try:
+                    result = await handler(_request(body))
+                    self.assertIsNone(expected)
+                    self.assertEqual(result, 'ok')
+                except ApiBadRequest as ex:
+                    self.assertEqual(str(ex), expected)
+
+    async def test_method_handler(self):
+        class View:
+            @validate_with_jsonschema(login_json_schema)
+            async def post(self, request):
+                return request.json
+
+        body = {'username': 'alice', 'password': 'secret'}
+        self.assertEqual(await View().post(_request(body)), body)
+        with self.assertRaises(ApiBadRequest):
+            await View().post(_request({}))
+
+
+if __name__ == '__main__':
+    unittest.main()
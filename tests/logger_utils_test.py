@@ -0,0 +1,78 @@
+import io
+import json
+import logging
+import queue
+import sys
+import unittest
+
+from unittest import mock
+
+from app.utils import logger_utils
+from app.utils.logger_utils import DebugSampler, DroppingQueueHandler, JsonFormatter, get_logger, make_listener
+
+
+def _record(level=logging.INFO, msg='hello %s', args=('world',), **extra):
+    record = logging.LogRecord('books', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+class LoggerUtilsTests(unittest.TestCase):
+    """ Unit testcases for the queued JSON logging """
+
+    def test_get_logger_is_idempotent(self):
+        first = get_logger('IdempotentTest')
+        second = get_logger('IdempotentTest')
+        self.assertIs(first, second)
+        self.assertEqual(first.handlers, [logger_utils.get_queue_handler()])
+
+    def test_json_lines_with_extra_fields(self):
+        line = json.loads(JsonFormatter().format(_record(book_id='abc')))
+        self.assertEqual(
+            {key: line[key] for key in ('level', 'logger', 'message', 'book_id')},
+            {'level': 'INFO', 'logger': 'books', 'message': 'hello world', 'book_id': 'abc'}
+        )
+        self.assertRegex(line['time'], r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d\.\d{3}Z$')
+
+    def test_values_the_json_backend_cannot_encode(self):
+        line = json.loads(JsonFormatter().format(_record(owner=object())))
+        self.assertTrue(line['owner'].startswith('<object object'))
+
+    def test_full_queue_drops_and_counts(self):
+        handler = DroppingQueueHandler(queue.Queue(2))
+        for _ in range(5):
+            handler.handle(_record())
+        self.assertEqual((handler.queue.qsize(), handler.dropped), (2, 3))
+
+    def test_samples_debug_records_only(self):
+        sampler = DebugSampler(0.25)
+        with mock.patch('random.random', side_effect=[0.1, 0.9]):
+            kept = _record(logging.DEBUG)
+            self.assertTrue(sampler.filter(kept))
+            self.assertFalse(sampler.filter(_record(logging.DEBUG)))
+        self.assertEqual(kept.sample_rate, 0.25)
+        self.assertTrue(sampler.filter(_record(logging.INFO)))
+        self.assertTrue(DebugSampler(1.0).filter(_record(logging.DEBUG)))
+
+    def test_listener_writes_queued_records(self):
+        stream = io.StringIO()
+        handler = DroppingQueueHandler(queue.Queue(10))
+        listener = make_listener(handler.queue, stream)
+        listener.start()
+        try:
+            handler.handle(_record(msg='one', args=()))
+            try:
+                raise ValueError('bad')
+            except ValueError:
+                record = _record(level=logging.ERROR, msg='two', args=())
+                record.exc_info = sys.exc_info()
+                handler.handle(record)
+        finally:
+            listener.stop()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines], ['one', 'two'])
+        self.assertIn('ValueError: bad', lines[1]['exc_info'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+
+from unittest import mock
+
+from app.utils import jwt_utils
+from app.utils.metrics import Registry
+from app.utils.password_utils import password_hasher
+from tests.fakes import FakeRedis, create_test_app
+
+
+def _worker(key='test:metrics'):
+    """A registry with the same metrics in every worker, as the app modules declare them."""
+    registry = Registry(key=key)
+    registry.counter('jobs_total', 'Jobs done.', ('queue',))
+    registry.histogram('job_duration_seconds', 'Job durations.', ('queue',), buckets=(0.1, 1.0))
+    return registry
+
+
+class MetricsRegistryTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the Prometheus registry """
+
+    async def asyncSetUp(self):
+        self.r = FakeRedis()
+
+    async def test_renders_counters_and_cumulative_buckets(self):
+        registry = _worker()
+        registry.metrics['jobs_total'].inc('a "quoted"\\name')
+        histogram = registry.metrics['job_duration_seconds']
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, 'a')
+
+        lines = (await registry.render(self.r)).splitlines()
+        self.assertIn('# TYPE jobs_total counter', lines)
+        self.assertIn('jobs_total{queue="a \\"quoted\\"\\\\name"} 1', lines)
+        self.assertIn('# TYPE job_duration_seconds histogram', lines)
+        self.assertEqual([line for line in lines if line.startswith('job_duration_seconds{') or '_bucket' in line], [
+            'job_duration_seconds_bucket{queue="a",le="0.1"} 2',
+            'job_duration_seconds_bucket{queue="a",le="1"} 3',
+            'job_duration_seconds_bucket{queue="a",le="+Inf"} 4',
+        ])
+        self.assertIn('job_duration_seconds_sum{queue="a"} 3.65', lines)
+        self.assertIn('job_duration_seconds_count{queue="a"} 4', lines)
+
+    async def test_adds_up_across_workers(self):
+        worker_a, worker_b = _worker(), _worker()
+        worker_a.metrics['jobs_total'].inc('a', amount=2)
+        worker_b.metrics['jobs_total'].inc('a')
+        worker_b.metrics['jobs_total'].inc('b')
+        worker_a.metrics['job_duration_seconds'].observe(0.5, 'a')
+        worker_b.metrics['job_duration_seconds'].observe(0.5, 'a')
+        # Each worker flushes on its own schedule; a render only flushes the worker rendering.
+        await worker_b.flush(self.r)
+
+        for registry in (worker_a, worker_b):
+            lines = (await registry.render(self.r)).splitlines()
+            self.assertIn('jobs_total{queue="a"} 3', lines)
+            self.assertIn('jobs_total{queue="b"} 1', lines)
+            self.assertIn('job_duration_seconds_count{queue="a"} 2', lines)
+
+    async def test_flush_sends_only_new_counts(self):
+        registry = _worker()
+        registry.metrics['jobs_total'].inc('a')
+        self.assertEqual(await registry.flush(self.r), 1)
+        self.assertEqual(await registry.flush(self.r), 0)
+        registry.metrics['jobs_total'].inc('a')
+        await registry.flush(self.r)
+        self.assertIn('jobs_total{queue="a"} 2', (await registry.render(self.r)).splitlines())
+
+    async def test_counter_func_flushes_differences(self):
+        registry = Registry(key='test:metrics')
+        totals = {('hit',): 5}
+        registry.counter_func('lookups_total', 'Lookups.', ('result',), lambda: dict(totals))
+        await registry.flush(self.r)
+        totals[('hit',)] = 7
+        await registry.flush(self.r)
+        # A total that went down was reset: all of it is new.
+        totals[('hit',)] = 1
+        self.assertIn('lookups_total{result="hit"} 8', (await registry.render(self.r)).splitlines())
+
+    def test_rejects_duplicate_names(self):
+        registry = _worker()
+        with self.assertRaises(ValueError):
+            registry.counter('jobs_total', 'Again.')
+
+
+class MetricsEndpointTests(unittest.TestCase):
+    """ Unit testcases for GET /metrics """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.redis.data.pop('metrics', None)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_requests_mongodb_and_cache(self):
+        self.app.test_client.get('/books/missing')
+        self.app.test_client.get('/books/missing')
+        self.app.test_client.get('/no/such/route')
+        request, response = self.app.test_client.get('/metrics')
+
+        self.assertEqual(response.status, 200)
+        self.assertTrue(response.headers['content-type'].startswith('text/plain; version=0.0.4'))
+        lines = response.text.splitlines()
+        self.assertIn('http_responses_total{method="GET",route="/books/<book_id:str>",status="404"} 2', lines)
+        self.assertIn('http_responses_total{method="GET",route="unmatched",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/books/<book_id:str>"} 2', lines)
+        # The first lookup misses and caches the missing book, the second hits that negative entry.
+        self.assertIn('mongodb_operation_duration_seconds_count{method="get_books"} 1', lines)
+        self.assertIn('cache_lookups_total{tier="book",result="miss"} 1', lines)
+        self.assertIn('cache_lookups_total{tier="book",result="negative_hit"} 1', lines)
+
+    def test_mongodb_errors(self):
+        def get_books(filter_=None, projection=None):
+            raise RuntimeError('database down')
+
+        with mock.patch.object(self.db.mongodb, 'get_books', get_books):
+            self.app.test_client.get('/books/missing')
+        request, response = self.app.test_client.get('/metrics')
+        self.assertIn('mongodb_operation_errors_total{method="get_books"} 1', response.text.splitlines())
+
+    def test_token_cache_and_password_hasher(self):
+        # A user of its own: a token another test verified would already be cached.
+        headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('metrics-reader')}
+        for _ in range(2):
+            self.app.test_client.post('/books', json={}, headers=headers)
+        with mock.patch.object(password_hasher, 'max_pending', 0):
+            request, response = self.app.test_client.post('/books/register', json={'username': 'bob', 'password': 'pw'})
+        self.assertEqual(response.status, 503)
+
+        request, response = self.app.test_client.get('/metrics')
+        names = {line.split(' ')[0] for line in response.text.splitlines() if not line.startswith('#')}
+        self.assertTrue({'jwt_cache_lookups_total{result="hit"}', 'jwt_cache_lookups_total{result="miss"}',
+                         'password_hash_rejected_total'} <= names)
+
+
+if __name__ == '__main__':
+    unittest.main()
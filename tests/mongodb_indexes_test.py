@@ -0,0 +1,38 @@
+import unittest
+
+from app.databases.mongodb import MongoDB
+from tests.fakes import FakeMongoClient, create_test_app
+
+
+class MongoIndexesTests(unittest.TestCase):
+    """ Unit testcases for the index registry and the query plan check """
+
+    def setUp(self):
+        self.db = MongoDB(client=FakeMongoClient())
+
+    def _collscans(self):
+        report = self.db.explain_queries()
+        return sorted(entry['query'] for entry in report if entry.get('collscan') or 'error' in entry)
+
+    def test_ensure_indexes_is_idempotent(self):
+        created = self.db.ensure_indexes()
+        self.assertIn('username_1', created)
+        self.assertTrue(self.db._users_col.indexes['username_1']['unique'])
+        self.assertEqual(self.db.ensure_indexes(), [])
+
+    def test_explain_flags_collection_scans(self):
+        self.assertEqual(self._collscans(), ['books by owner', 'books page', 'books text search', 'user by username'])
+        self.db.ensure_indexes()
+        self.assertEqual(self._collscans(), [])
+
+    def test_indexes_created_at_server_start(self):
+        app, db, _ = create_test_app()
+        try:
+            app.test_client.get('/books')
+            self.assertIn('owner_1', db.mongodb._books_col.indexes)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
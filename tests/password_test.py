@@ -0,0 +1,107 @@
+import asyncio
+import json
+import multiprocessing
+import unittest
+from unittest import mock
+
+from app.hooks.error import ApiServiceUnavailable
+from app.utils.password_utils import PasswordHasher, hash_password, is_password_hash, verify_password
+from tests.fakes import create_test_app
+
+
+class PasswordUtilsTests(unittest.TestCase):
+    """ Unit testcases for password hashing """
+
+    def test_hash_and_verify(self):
+        encoded = hash_password('secret', n=2 ** 8)
+        self.assertTrue(is_password_hash(encoded))
+        self.assertNotEqual(encoded, hash_password('secret', n=2 ** 8))
+        self.assertTrue(verify_password('secret', encoded))
+        self.assertFalse(verify_password('Secret', encoded))
+
+    def test_plaintext_legacy_password(self):
+        self.assertTrue(verify_password('secret', 'secret'))
+        self.assertFalse(verify_password('secret', 'other'))
+
+
+class PasswordHasherTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the process pool running password hashing """
+
+    async def test_sheds_load_when_saturated(self):
+        hasher = PasswordHasher(workers=1, max_pending=1)
+        hasher.pending = 1
+        with self.assertRaises(ApiServiceUnavailable) as ctx:
+            await hasher.hash('secret')
+        self.assertEqual(ctx.exception.headers, {'Retry-After': '1'})
+        self.assertEqual(hasher.rejected, 1)
+        hasher.close()
+
+    def test_runs_in_a_daemonic_process(self):
+        # Sanic's workers are daemonic when there are several of them.
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        process = context.Process(target=_hash_in_child, args=(results,), daemon=True)
+        process.start()
+        process.join(30)
+        self.assertEqual(results.get(timeout=1), 'ok')
+
+
+def _hash_in_child(results):
+    async def main():
+        hasher = PasswordHasher(workers=1)
+        try:
+            encoded = await hasher.hash('secret')
+            return 'ok' if await hasher.verify('secret', encoded) else 'wrong hash'
+        finally:
+            hasher.close()
+
+    try:
+        with mock.patch('app.utils.password_utils.Config.PASSWORD_SCRYPT_N', 2 ** 8):
+            results.put(asyncio.run(main()))
+    except BaseException as ex:
+        results.put(repr(ex))
+
+
+@mock.patch('app.utils.password_utils.Config.PASSWORD_SCRYPT_N', 2 ** 8)
+class RegisterLoginTests(unittest.TestCase):
+    """ Unit testcases for POST /books/register and POST /books/login """
+
+    def setUp(self):
+        self.app, self.db, _ = create_test_app()
+        self.users_col = self.db.mongodb._users_col
+
+    def tearDown(self):
+        self.db.close()
+
+    def _post(self, url, username, password):
+        request, response = self.app.test_client.post(url, data=json.dumps({'username': username, 'password': password}))
+        return response
+
+    def test_register_stores_hash_and_login(self):
+        self.assertEqual(self._post('/books/register', 'alice', 'secret').status, 200)
+        stored = self.users_col.find_one({'username': 'alice'})['password']
+        self.assertTrue(is_password_hash(stored))
+
+        response = self._post('/books/login', 'alice', 'secret')
+        self.assertEqual(response.status, 200)
+        self.assertIn('jwt', json.loads(response.text))
+        self.assertEqual(self._post('/books/login', 'alice', 'wrong').status, 400)
+
+    def test_concurrent_registrations_of_one_name(self):
+        async def register_twice():
+            await self.db.ensure_indexes()
+            body = json.dumps({'username': 'alice', 'password': 'secret'})
+            return await asyncio.gather(*[self.app.asgi_client.post('/books/register', data=body) for _ in range(2)])
+
+        statuses = sorted(response.status for _, response in asyncio.run(register_twice()))
+        self.assertEqual(statuses, [200, 400])
+        self.assertEqual(len(list(self.users_col.find({'username': 'alice'}))), 1)
+
+    def test_login_upgrades_plaintext_password(self):
+        self.users_col.insert_one({'username': 'bob', 'password': 'secret'})
+        self.assertEqual(self._post('/books/login', 'bob', 'secret').status, 200)
+        self.assertTrue(verify_password('secret', self.users_col.find_one({'username': 'bob'})['password']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+
+from unittest import mock
+
+from app.utils import jwt_utils, request_timing
+from config import Config
+from tests.fakes import create_test_app
+
+
+class RequestTimingTests(unittest.TestCase):
+    """ Unit testcases for the per-request phase breakdown """
+
+    def test_records_only_inside_a_request(self):
+        request_timing._phases.set(None)
+        request_timing.add('db', 1.0)
+        self.assertIsNone(request_timing.get())
+
+        phases = request_timing.start()
+        request_timing.add('db', 0.5)
+        request_timing.add('db', 0.25)
+        with request_timing.phase('auth'):
+            pass
+        self.assertEqual(phases['db'], 0.75)
+        self.assertIn('auth', phases)
+        request_timing._phases.set(None)
+
+
+class ProfilingTests(unittest.TestCase):
+    """ Unit testcases for profiled requests, /profiles and the slow-request log """
+
+    def setUp(self):
+        self.app, self.db, self.redis = create_test_app()
+        self.dir = tempfile.TemporaryDirectory()
+        self.patches = [
+            mock.patch.object(Config, 'PROFILE_DIR', self.dir.name),
+            mock.patch.object(Config, 'PROFILE_TOKEN', 'admin-secret'),
+            mock.patch.object(Config, 'PROFILE_SAMPLE_RATE', 0.0),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.admin = {'X-Profile': 'admin-secret'}
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        self.dir.cleanup()
+        self.db.close()
+
+    def test_profile_on_header_then_list_and_download(self):
+        request, response = self.app.test_client.get('/books', headers={'X-Profile': 'wrong'})
+        self.assertNotIn('x-profile-id', response.headers)
+
+        request, response = self.app.test_client.get('/books', headers=self.admin)
+        self.assertEqual(response.status, 200)
+        name = response.headers['x-profile-id']
+        self.assertTrue(name.endswith('.prof'))
+
+        request, response = self.app.test_client.get('/profiles', headers=self.admin)
+        self.assertEqual([profile['name'] for profile in json.loads(response.text)['profiles']], [name])
+
+        request, response = self.app.test_client.get('/profiles/' + name, headers=self.admin)
+        self.assertEqual(response.status, 200)
+        path = os.path.join(self.dir.name, 'downloaded.prof')
+        with open(path, 'wb') as f:
+            f.write(response.body)
+        self.assertTrue(any(function[2] == 'get_all_books' for function in pstats.Stats(path).stats))
+
+        request, response = self.app.test_client.get('/profiles/{}?format=text'.format(name), headers=self.admin)
+        self.assertIn('get_all_books', response.text)
+
+    def test_sampled_requests_and_retention(self):
+        with mock.patch.object(Config, 'PROFILE_SAMPLE_RATE', 1.0), mock.patch.object(Config, 'PROFILE_KEEP', 2):
+            names = [self.app.test_client.get('/books/{}'.format(i))[1].headers['x-profile-id'] for i in range(3)]
+        self.assertEqual(len(set(names)), 3)
+        self.assertEqual(len(os.listdir(self.dir.name)), 2)
+        self.assertNotIn(names[0], os.listdir(self.dir.name))
+
+    def test_profiles_need_the_token(self):
+        request, response = self.app.test_client.get('/profiles')
+        self.assertEqual(response.status, 403)
+        with mock.patch.object(Config, 'PROFILE_TOKEN', None):
+            request, response = self.app.test_client.get('/profiles', headers=self.admin)
+        self.assertEqual(response.status, 403)
+
+        request, response = self.app.test_client.get('/profiles/not-a-profile.txt', headers=self.admin)
+        self.assertEqual(response.status, 400)
+        request, response = self.app.test_client.get('/profiles/missing.prof', headers=self.admin)
+        self.assertEqual(response.status, 404)
+
+    def test_slow_requests_are_logged_by_phase(self):
+        headers = {'Authorization': 'Bearer ' + jwt_utils.generate_jwt('alice')}
+        with mock.patch.object(Config, 'SLOW_REQUEST_SECONDS', 1e-9), self.assertLogs('Profiling', 'WARNING') as logs:
+            self.app.test_client.post('/books', headers=headers, data=json.dumps(
+                {'title': 'Dune', 'authors': ['Frank Herbert'], 'publisher': 'Chilton'}
+            ))
+            book_id = next(iter(self.db.mongodb._books_col.docs))
+            self.app.test_client.get('/books/' + book_id)
+        create, read = logs.output[-2:]
+        self.assertIn('slow request POST /books 201', create)
+        for phase in ('auth', 'validation', 'db', 'other'):
+            self.assertIn(phase + ' ', create)
+        self.assertIn('slow request GET /books/{} 200'.format(book_id), read)
+        for phase in ('cache', 'db', 'serialize'):
+            self.assertIn(phase + ' ', read)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import time
+import unittest
+
+from unittest import mock
+
+from app.databases.redis_cached import LRUCache, TieredCache
+from config import Config
+from tests.fakes import FakeRedis
+
+
+class LRUCacheTests(unittest.TestCase):
+    """ Unit testcases for the in-process cache tier """
+
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('b'), (False, None))
+        self.assertEqual(lru.get('a'), (True, 1))
+        self.assertEqual(len(lru), 2)
+
+    def test_expires(self):
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertEqual(lru.get('a'), (False, None))
+
+
+class TieredCacheTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for the local + Redis cache """
+
+    async def asyncSetUp(self):
+        self.r = FakeRedis()
+        self.worker_a = TieredCache(max_size=10, local_ttl=60)
+        self.worker_b = TieredCache(max_size=10, local_ttl=60)
+
+    async def test_tier_stats(self):
+        await self.worker_a.set(self.r, 'key', {'n': 1})
+        self.assertEqual(await self.worker_b.get(self.r, 'key'), {'n': 1})
+        self.assertEqual(await self.worker_b.get(self.r, 'key'), {'n': 1})
+        self.assertIsNone(await self.worker_b.get(self.r, 'other'))
+
+        stats = self.worker_b.to_dict()
+        self.assertEqual((stats['local']['hits'], stats['local']['misses']), (1, 2))
+        self.assertEqual((stats['redis']['hits'], stats['redis']['misses']), (1, 1))
+
+    async def test_get_and_set_many(self):
+        await self.worker_a.set_many(self.r, {'a': 1, 'b': b'raw'}, ttl=60)
+        await self.worker_b.get(self.r, 'a')
+        self.assertEqual(await self.worker_b.get_many(self.r, ['a', 'missing', 'b']), [1, None, b'raw'])
+        stats = self.worker_b.to_dict()
+        self.assertEqual((stats['local']['hits'], stats['redis']['hits'], stats['redis']['misses']), (1, 2, 1))
+
+    async def test_local_hit_skips_redis(self):
+        await self.worker_a.set(self.r, 'key', 'value')
+        calls = self.r.calls
+        self.assertEqual(await self.worker_a.get(self.r, 'key'), 'value')
+        self.assertEqual(self.r.calls, calls)
+
+    async def test_delete_fans_out_to_other_workers(self):
+        listener = asyncio.create_task(self.worker_b.listen(self.r))
+        await asyncio.sleep(0)
+
+        await self.worker_a.set(self.r, 'key', 'old')
+        await self.worker_b.get(self.r, 'key')
+        await self.worker_a.delete(self.r, 'key')
+        await self.worker_a.set(self.r, 'key', 'new')
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(await self.worker_b.get(self.r, 'key'), 'new')
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+    async def test_listener_survives_a_lost_connection(self):
+        with mock.patch.object(Config, 'PUBSUB_RETRY_MIN', 0.01):
+            listener = asyncio.create_task(self.worker_b.listen(self.r))
+            await asyncio.sleep(0)
+            await self.worker_a.set(self.r, 'key', 'old')
+            await self.worker_b.get(self.r, 'key')
+
+            # The delete is published while worker b is not subscribed: it drops its local entries instead.
+            self.r.drop_subscribers()
+            await self.worker_a.delete(self.r, 'key')
+            await self.worker_a.set(self.r, 'key', 'new')
+            await asyncio.sleep(0.05)
+            self.assertEqual(await self.worker_b.get(self.r, 'key'), 'new')
+
+            await self.worker_a.delete(self.r, 'key')
+            await asyncio.sleep(0.01)
+            self.assertIsNone(await self.worker_b.get(self.r, 'key'))
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+        self.assertEqual(self.r.subscribers, [])
+
+
+
+class SingleFlightTests(unittest.IsolatedAsyncioTestCase):
+    """ Unit testcases for coalesced cache misses """
+
+    async def asyncSetUp(self):
+        self.r = FakeRedis()
+        self.calls = 0
+
+    async def _loader(self, value='fresh', delay=0.02):
+        self.calls += 1
+        await asyncio.sleep(delay)
+        return value
+
+    async def test_concurrent_misses_load_once(self):
+        cache = TieredCache(max_size=10, local_ttl=60)
+        values = await asyncio.gather(*[cache.get_or_set(self.r, 'key', self._loader) for _ in range(20)])
+        self.assertEqual(values, ['fresh'] * 20)
+        self.assertEqual(self.calls, 1)
+
+    async def test_other_worker_waits_for_lock_holder(self):
+        worker_a = TieredCache(max_size=10, local_ttl=60)
+        worker_b = TieredCache(max_size=10, local_ttl=60)
+        values = await asyncio.gather(
+            worker_a.get_or_set(self.r, 'key', self._loader),
+            worker_b.get_or_set(self.r, 'key', self._loader),
+        )
+        self.assertEqual(values, ['fresh', 'fresh'])
+        self.assertEqual(self.calls, 1)
+
+    async def test_expired_lock_falls_back_to_loading(self):
+        await self.r.set('lock:key', 'someone-else')
+        cache = TieredCache(max_size=10, local_ttl=60)
+        with mock.patch('app.databases.redis_cached.Config.CACHE_LOCK_TTL', 0.05):
+            self.assertEqual(await cache.get_or_set(self.r, 'key', self._loader), 'fresh')
+        self.assertEqual(self.calls, 1)
+
+    async def test_stale_while_revalidate(self):
+        cache = TieredCache(max_size=10, local_ttl=60)
+        await cache.get_or_set(self.r, 'key', lambda: self._loader('old', 0), ttl=0, stale_ttl=60)
+
+        self.assertEqual(await cache.get_or_set(self.r, 'key', self._loader, ttl=60, stale_ttl=60), 'old')
+        await asyncio.sleep(0.05)
+        self.assertEqual(await cache.get_or_set(self.r, 'key', self._loader, ttl=60, stale_ttl=60), 'fresh')
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()